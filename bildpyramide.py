@@ -0,0 +1,183 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from math import floor, log2
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice, QObject, QRunnable, QSize, QThreadPool, Qt, Signal, Slot
+from PySide6.QtGui import QImage, QImageIOHandler, QImageReader, QPixmap
+
+# Längste Seite der Stufe, die beim Import sofort dekodiert wird. Feinere
+# Stufen werden erst geladen, wenn jemand so weit hineinzoomt.
+STARTGROESSE = 2048
+MINGROESSE = 64
+
+
+class LadeSignale(QObject):
+    fertig = Signal(object, object)
+
+
+class StufenLaden(QRunnable):
+    'Dekodiert eine Stufe verkleinert und berechnet auf Wunsch alle gröberen Stufen.'
+    def __init__(self, quelle, groesse: QSize, stufe: int, mitGroeberen: bool, signale: LadeSignale):
+        super().__init__()
+        self._quelle = quelle
+        self._groesse = groesse
+        self._stufe = stufe
+        self._mitGroeberen = mitGroeberen
+        self._signale = signale
+
+    def run(self):
+        neueQuelle = None
+        if isinstance(self._quelle, QImage):
+            # Bilder aus der Zwischenablage werden komprimiert aufbewahrt,
+            # damit nicht das volle Bild im Speicher bleibt.
+            neueQuelle = QByteArray()
+            buffer = QBuffer(neueQuelle)
+            buffer.open(QIODevice.WriteOnly)
+            self._quelle.save(buffer, 'PNG')
+            buffer.close()
+            image = self._quelle.scaled(self._groesse, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        else:
+            image = leseBild(self._quelle, self._groesse)
+
+        stufen = {self._stufe: image}
+        if self._mitGroeberen:
+            stufe = self._stufe
+            while not image.isNull() and max(image.width(), image.height()) > MINGROESSE:
+                stufe += 1
+                image = image.scaled(max(1, image.width()//2), max(1, image.height()//2), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                stufen[stufe] = image
+        self._signale.fertig.emit(stufen, neueQuelle)
+
+
+def oeffneReader(quelle):
+    'Liefert den Reader und den Buffer, der so lange leben muss wie der Reader.'
+    buffer = None
+    if isinstance(quelle, QByteArray):
+        buffer = QBuffer()
+        buffer.setData(quelle)
+        buffer.open(QIODevice.ReadOnly)
+        reader = QImageReader(buffer)
+    else:
+        reader = QImageReader(quelle)
+    reader.setAutoTransform(True)
+    return reader, buffer
+
+
+def leseBild(quelle, groesse: QSize) -> QImage:
+    reader, buffer = oeffneReader(quelle)
+    reader.setScaledSize(groesse)
+    image = reader.read()
+    if image.isNull():
+        logger.warning(f'Bild konnte nicht gelesen werden: {reader.errorString()}')
+    return image
+
+
+class BildPyramide(QObject):
+    '''Mehrere Auflösungen eines Bildes. Stufe n hat die Kantenlänge 1/2**n des Originals.'''
+
+    aktualisiert = Signal()
+
+    def __init__(self, quelle):
+        super().__init__()
+        self._quelle = quelle
+        self._stufen: dict[int, QPixmap] = {}
+        self._ladend = set()
+        self._signale = []
+        # Bei Speichermangel freigegebene Stufen, die bei Bedarf neu geladen werden
+        self._freigegeben = set()
+        # Laut EXIF um 90° gedreht: _groesse ist die angezeigte, nicht die gespeicherte Größe.
+        self._gedreht = False
+
+        if isinstance(quelle, QImage):
+            self._groesse = quelle.size()
+        else:
+            reader, buffer = oeffneReader(quelle)
+            self._groesse = reader.size()
+            if reader.transformation() & QImageIOHandler.TransformationRotate90:
+                self._gedreht = True
+                self._groesse.transpose()
+
+        self._startstufe = 0
+        if self.isValid():
+            laenge = max(self._groesse.width(), self._groesse.height())
+            while laenge / 2**self._startstufe > STARTGROESSE:
+                self._startstufe += 1
+            self.ladeStufe(self._startstufe, True)
+
+    def isValid(self) -> bool:
+        return self._groesse.isValid() and not self._groesse.isEmpty()
+
+    def groesse(self) -> QSize:
+        return QSize(self._groesse)
+
+    def stufenGroesse(self, stufe: int) -> QSize:
+        return QSize(max(1, round(self._groesse.width() / 2**stufe)), max(1, round(self._groesse.height() / 2**stufe)))
+
+    def ladeStufe(self, stufe: int, mitGroeberen: bool = False):
+        if stufe in self._ladend:
+            return
+        self._ladend.add(stufe)
+        signale = LadeSignale()
+        signale.fertig.connect(self.stufenGeladen)
+        self._signale.append(signale)
+        groesse = self.stufenGroesse(stufe)
+        if self._gedreht:
+            # QImageReader skaliert vor dem Drehen, also auf die gespeicherte Größe.
+            groesse.transpose()
+        QThreadPool.globalInstance().start(StufenLaden(self._quelle, groesse, stufe, mitGroeberen, signale))
+
+    @Slot(object, object)
+    def stufenGeladen(self, stufen: dict, neueQuelle):
+        if neueQuelle is not None:
+            self._quelle = neueQuelle
+        for stufe, image in stufen.items():
+            self._ladend.discard(stufe)
+            self._freigegeben.discard(stufe)
+            if not image.isNull():
+                self._stufen[stufe] = QPixmap.fromImage(image)
+        self._signale = [s for s in self._signale if s is not self.sender()]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Bildstufen geladen: {sorted(stufen)}')
+        self.aktualisiert.emit()
+
+    def pixmap(self, lod: float) -> QPixmap:
+        'Liefert die passende Stufe für den Detailgrad lod (Gerätepixel pro Originalpixel).'
+        stufe = 0 if lod >= 1 else floor(log2(1/lod))
+        if stufe not in self._stufen and (stufe < self._startstufe or stufe in self._freigegeben) and not isinstance(self._quelle, QImage):
+            self.ladeStufe(stufe)
+        if stufe in self._stufen:
+            return self._stufen[stufe]
+        # Bis die gewünschte Stufe da ist, wird die nächstfeinere bzw. gröbere genommen.
+        vorhanden = sorted(self._stufen, key=lambda s: (abs(s-stufe), s))
+        if vorhanden:
+            return self._stufen[vorhanden[0]]
+        return None
+
+    def herabstufen(self) -> int:
+        'Gibt alle Stufen bis auf die gröbste frei. Liefert die freigegebenen Bytes.'
+        if len(self._stufen) < 2 or isinstance(self._quelle, QImage):
+            return 0
+        groebste = max(self._stufen)
+        frei = 0
+        for stufe in [stufe for stufe in self._stufen if stufe != groebste]:
+            pixmap = self._stufen.pop(stufe)
+            frei += pixmap.width()*pixmap.height()*4
+            self._freigegeben.add(stufe)
+        return frei
@@ -0,0 +1,141 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from collections import OrderedDict
+from PySide6.QtCore import QObject, QTimer, Qt
+from PySide6.QtGui import QPixmapCache
+from PySide6.QtWidgets import QGraphicsItem
+
+from pfadkodierung import pfadcache
+
+# Ab so vielen Pfadelementen lohnt sich ein Pixmap-Cache.
+SCHWELLE = 200
+# Geschätzter Speicher aller Item-Caches. Darüber werden die am längsten nicht gemalten verworfen.
+BUDGET = 64*1024*1024
+RESERVE = 16*1024*1024
+STATISTIKINTERVALL = 5000
+
+
+def komplexitaet(item: QGraphicsItem) -> int:
+    if hasattr(item, 'komplexitaet'):
+        return item.komplexitaet()
+    return 0
+
+
+class Cachepolitik(QObject):
+    '''Entscheidet pro Item über DeviceCoordinateCache. Fertige, aufwendige Items werden
+    gecacht, Items in Bearbeitung nicht. Bilder, SVGs und Texte haben eigene Raster und bleiben außen vor.'''
+
+    def __init__(self):
+        super().__init__()
+        # Item -> geschätzte Bytes, zuletzt gemalte am Ende
+        self._gecacht = OrderedDict()
+        self._bytes = 0
+        self._view = None
+        self._treffer = 0
+        self._fehlschlaege = 0
+        self._frameFehlschlaege = 0
+        self._timer = QTimer(self)
+        self._timer.setInterval(STATISTIKINTERVALL)
+        self._timer.timeout.connect(self.aufraeumen)
+
+    def setView(self, view):
+        self._view = view
+        QPixmapCache.setCacheLimit(max(QPixmapCache.cacheLimit(), (BUDGET+RESERVE)//1024))
+        self._timer.start()
+
+    def pruefe(self, item: QGraphicsItem):
+        'Nach dem Bearbeiten oder Einfügen eines Items.'
+        if item.scene() is None or komplexitaet(item) < SCHWELLE:
+            self.verwerfen(item)
+            return
+        if item not in self._gecacht:
+            item.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+            self._gecacht[item] = 0
+        self.schaetze(item)
+        self.budgetEinhalten()
+
+    def verwerfen(self, item: QGraphicsItem):
+        'Vor dem Bearbeiten oder Verschieben: jede Änderung würde den Cache neu füllen.'
+        groesse = self._gecacht.pop(item, None)
+        if groesse is None:
+            return
+        self._bytes -= groesse
+        item.setCacheMode(QGraphicsItem.NoCache)
+
+    def schaetze(self, item: QGraphicsItem):
+        if self._view is None:
+            return
+        # Größer als der Viewport wird der Cache nur für den sichtbaren Teil angelegt.
+        rect = self._view.mapFromScene(item.sceneBoundingRect()).boundingRect() & self._view.viewport().rect()
+        groesse = max(0, rect.width()*rect.height()*4)
+        self._bytes += groesse - self._gecacht[item]
+        self._gecacht[item] = groesse
+
+    def gemalt(self, item: QGraphicsItem):
+        'Aus paint: Bei einem gecachten Item bedeutet jeder Aufruf, dass der Cache neu gefüllt wird.'
+        if item not in self._gecacht:
+            return
+        self._gecacht.move_to_end(item)
+        self._fehlschlaege += 1
+        self._frameFehlschlaege += 1
+        self.schaetze(item)
+        if self._bytes > BUDGET:
+            # Nicht während des Zeichnens anderen Items den Cache wegnehmen
+            QTimer.singleShot(0, self.budgetEinhalten)
+
+    def frame(self, rect):
+        'Aus drawForeground: gecachte Items im Bild, die nicht gemalt wurden, sind Treffer.'
+        if self._gecacht and logger.isEnabledFor(logging.DEBUG):
+            sichtbar = sum(1 for item in self._view.scene().items(rect, Qt.IntersectsItemBoundingRect) if item in self._gecacht)
+            self._treffer += max(0, sichtbar - self._frameFehlschlaege)
+        self._frameFehlschlaege = 0
+
+    def neuePalette(self):
+        'Die Pixmaps gecachter Items zeigen noch die alten Farben.'
+        for item in self._gecacht:
+            item.update()
+
+    def leeren(self):
+        '''Bei Speichermangel die Pixmaps aller Item-Caches freigeben. Nur die eigenen,
+        der QPixmapCache enthält auch Pixmaps von Stil und Icons.'''
+        for item in self._gecacht:
+            item.setCacheMode(QGraphicsItem.NoCache)
+            item.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+            self._gecacht[item] = 0
+        self._bytes = 0
+
+    def budgetEinhalten(self):
+        while self._bytes > BUDGET and self._gecacht:
+            self.verwerfen(next(iter(self._gecacht)))
+
+    def aufraeumen(self):
+        # Entfernte und geparkte Items
+        for item in [item for item in self._gecacht if item.scene() is None]:
+            self.verwerfen(item)
+        if logger.isEnabledFor(logging.DEBUG) and (self._treffer or self._fehlschlaege or pfadcache.fehlschlaege):
+            logger.debug(f'Cache: {self._treffer} Treffer, {self._fehlschlaege} Fehlschläge, '
+                         f'{len(self._gecacht)} Items, {self._bytes/2**20:.1f} MB; '
+                         f'Pfadcache: {pfadcache.treffer} Treffer, {pfadcache.fehlschlaege} Fehlschläge')
+        self._treffer = self._fehlschlaege = 0
+        pfadcache.treffer = pfadcache.fehlschlaege = 0
+
+
+cachepolitik = Cachepolitik()
@@ -0,0 +1,233 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Aufzeichnen und Abspielen der Eingaben einer Tafel. Damit lassen sich
+# Probleme aus dem Klassenraum nachstellen und offline profilieren.
+#
+# Dateiformat (little endian):
+#   Kopf:     b'ETTR', Version (uint16)
+#   Ereignis: Zeit in s (double), Typ (uint16), Buttons/Gestenstatus (uint32),
+#             Quelle (uint8), Anzahl Punkte (uint8)
+#   Punkt:    ID (int32), Status (uint16), x, y, Ellipsenbreite, Ellipsenhöhe (float32)
+# Bei Gesten sind die beiden Punkte der aktuelle und der letzte Mittelpunkt. Ab Version 2
+# folgt bei Gesten auf den Ereigniskopf der gesamte Zoomfaktor (double).
+# Version 1 wird weiter gelesen, dort bleibt der Zoomfaktor 1.
+
+import logging
+logger = logging.getLogger('GUI')
+
+import struct
+from time import perf_counter
+from PySide6.QtCore import QEvent, QObject, QPointF, QSizeF, QTimer, Qt, Signal
+from PySide6.QtGui import QEventPoint
+from PySide6.QtWidgets import QPinchGesture
+
+MAGIC = b'ETTR'
+VERSION = 2
+KOPF = struct.Struct('<4sH')
+EREIGNIS = struct.Struct('<dHIBB')
+PUNKT = struct.Struct('<iHffff')
+ZOOM = struct.Struct('<d')
+
+TOUCHTYPEN = {QEvent.TouchBegin, QEvent.TouchUpdate, QEvent.TouchEnd, QEvent.TouchCancel}
+MAUSTYPEN = {QEvent.MouseButtonPress, QEvent.MouseMove, QEvent.MouseButtonRelease}
+
+
+class Aufzeichnung:
+    def __init__(self, dateiname: str):
+        self._datei = open(dateiname, 'wb')
+        self._datei.write(KOPF.pack(MAGIC, VERSION))
+        self._start = perf_counter()
+        self._anzahl = 0
+
+    def schreibe(self, event: QEvent):
+        eventtype = event.type()
+        if eventtype in TOUCHTYPEN:
+            punkte = [(p.id(), p.state().value, p.position(), p.ellipseDiameters()) for p in event.points()]
+            zusatz, quelle = 0, 0
+        elif eventtype in MAUSTYPEN:
+            punkte = [(p.id(), p.state().value, p.position(), p.ellipseDiameters()) for p in event.points()]
+            zusatz, quelle = event.buttons().value, event.source().value
+        elif eventtype == QEvent.Gesture:
+            gesture = event.gesture(Qt.PinchGesture)
+            if not gesture:
+                return
+            punkte = [(0, 0, gesture.centerPoint(), QSizeF()), (0, 0, gesture.lastCenterPoint(), QSizeF())]
+            zusatz, quelle = gesture.state().value, gesture.changeFlags().value
+        else:
+            return
+
+        daten = [EREIGNIS.pack(perf_counter()-self._start, eventtype.value, zusatz, quelle, len(punkte))]
+        if eventtype == QEvent.Gesture:
+            daten.append(ZOOM.pack(gesture.totalScaleFactor()))
+        for id, status, pos, ellipse in punkte:
+            daten.append(PUNKT.pack(id, status, pos.x(), pos.y(), ellipse.width(), ellipse.height()))
+        self._datei.write(b''.join(daten))
+        self._anzahl += 1
+
+    def schliessen(self):
+        if not self._datei.closed:
+            self._datei.close()
+            logger.info(f'Aufzeichnung beendet: {self._anzahl} Ereignisse')
+
+
+def leseTrace(dateiname: str) -> list:
+    with open(dateiname, 'rb') as datei:
+        daten = datei.read()
+    magic, version = KOPF.unpack_from(daten, 0)
+    if magic != MAGIC or not 1 <= version <= VERSION:
+        raise ValueError(f'{dateiname} ist keine Eingabeaufzeichnung der Version 1 bis {VERSION}.')
+    ereignisse = []
+    offset = KOPF.size
+    while offset < len(daten):
+        zeit, typ, zusatz, quelle, anzahl = EREIGNIS.unpack_from(daten, offset)
+        offset += EREIGNIS.size
+        zoom = 1.0
+        if version >= 2 and typ == QEvent.Gesture.value:
+            zoom, = ZOOM.unpack_from(daten, offset)
+            offset += ZOOM.size
+        punkte = []
+        for _ in range(anzahl):
+            punkte.append(TracePoint(*PUNKT.unpack_from(daten, offset)))
+            offset += PUNKT.size
+        ereignisse.append((zeit, TraceEvent(QEvent.Type(typ), zusatz, quelle, punkte, zeit, zoom)))
+    return ereignisse
+
+
+class TracePoint:
+    'Nachbildung der von Tafelview benutzten Teile von QEventPoint.'
+    def __init__(self, id, status, x, y, breite, hoehe):
+        self._id = id
+        self._status = status
+        self._pos = QPointF(x, y)
+        self._ellipse = QSizeF(breite, hoehe)
+
+    def id(self):
+        return self._id
+
+    def state(self):
+        return QEventPoint.State(self._status)
+
+    def pos(self):
+        return QPointF(self._pos)
+
+    def position(self):
+        return QPointF(self._pos)
+
+    def ellipseDiameters(self):
+        return QSizeF(self._ellipse)
+
+
+class TraceGesture:
+    def __init__(self, status, flags, punkte, zoom):
+        self._status = Qt.GestureState(status)
+        self._flags = QPinchGesture.ChangeFlag(flags)
+        self._punkte = punkte
+        self._zoom = zoom
+
+    def state(self):
+        return self._status
+
+    def changeFlags(self):
+        return self._flags
+
+    def centerPoint(self):
+        return self._punkte[0].pos()
+
+    def lastCenterPoint(self):
+        return self._punkte[1].pos()
+
+    def totalScaleFactor(self):
+        return self._zoom
+
+
+class TraceEvent:
+    'Nachbildung der von Tafelview.viewportEvent benutzten Teile von QTouchEvent/QMouseEvent/QGestureEvent.'
+    def __init__(self, typ, zusatz, quelle, punkte, zeit=0, zoom=1.0):
+        self._typ = typ
+        self._zoom = zoom
+        self._zeit = zeit
+        self._zusatz = zusatz
+        self._quelle = quelle
+        self._punkte = punkte
+
+    def type(self):
+        return self._typ
+
+    def points(self):
+        return list(self._punkte)
+
+    def pointCount(self):
+        return len(self._punkte)
+
+    def timestamp(self):
+        return int(self._zeit*1000)
+
+    def buttons(self):
+        return Qt.MouseButton(self._zusatz)
+
+    def source(self):
+        return Qt.MouseEventSource(self._quelle)
+
+    def device(self):
+        return None
+
+    def gesture(self, typ):
+        if self._typ != QEvent.Gesture or typ != Qt.PinchGesture:
+            return None
+        return TraceGesture(self._zusatz, self._quelle, self._punkte, self._zoom)
+
+
+class Abspieler(QObject):
+    '''Spielt eine Aufzeichnung in Originalgeschwindigkeit oder so schnell wie möglich ab.
+    Interaktionen im Editiermodus laufen über QGraphicsView und werden nicht wiedergegeben.'''
+
+    fertig = Signal(int, float)
+
+    def __init__(self, tafelview, dateiname: str, schnell: bool = False):
+        super().__init__(tafelview)
+        self._tafelview = tafelview
+        self._ereignisse = leseTrace(dateiname)
+        self._schnell = schnell
+        self._index = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self.weiter)
+
+    def start(self):
+        logger.info(f'Spiele {len(self._ereignisse)} Ereignisse ab')
+        self._start = perf_counter()
+        self.weiter()
+
+    def weiter(self):
+        if self._schnell:
+            for _, event in self._ereignisse:
+                self._tafelview.viewportEvent(event)
+            self._index = len(self._ereignisse)
+        else:
+            jetzt = perf_counter() - self._start
+            while self._index < len(self._ereignisse) and self._ereignisse[self._index][0] <= jetzt:
+                self._tafelview.viewportEvent(self._ereignisse[self._index][1])
+                self._index += 1
+            if self._index < len(self._ereignisse):
+                wartezeit = self._ereignisse[self._index][0] - (perf_counter() - self._start)
+                self._timer.start(max(0, int(wartezeit*1000)))
+                return
+        dauer = perf_counter() - self._start
+        logger.info(f'Wiedergabe beendet: {self._index} Ereignisse in {dauer:.3f} s')
+        self.fertig.emit(self._index, dauer)
@@ -0,0 +1,155 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Minimaler Empfänger für die Übertragung (siehe uebertragung). Baut das Tafelbild
+# in einer eigenen Szene nach, z.B. zum Testen auf demselben Rechner:
+#   python endlostafel.py --uebertragen
+#   python empfaenger.py localhost 5123
+
+import logging
+logger = logging.getLogger('GUI')
+
+import struct
+import sys
+from PySide6.QtCore import QObject, Qt, Signal
+from PySide6.QtGui import QBrush, QColor, QImage, QPainter, QPen, QPixmap, QTransform
+from PySide6.QtNetwork import QTcpSocket
+from PySide6.QtWidgets import QApplication, QGraphicsPathItem, QGraphicsPixmapItem, QGraphicsScene, QGraphicsView
+
+from pfadkodierung import entpackePfad, pfadAusElementen
+from uebertragung import (ART_BILD, ART_PFAD, BILDRECT, ELEMENT, ENTFERNEN, HALLO, LIVEPUNKTE, NEUERPFAD, NEUETRANSFORM,
+                          STANDARDPORT, STIL, TRANSFORMATION, VERSION, zerlegeNachrichten)
+
+ID = struct.Struct('<I')
+
+
+class Empfaenger(QObject):
+    '''Hält pro ID ein Item und die Elemente seines Pfads, an die Live-Punkte angehängt werden.
+    Bei Bildern bildet eine Basistransformation das übertragene Raster auf das Item ab.'''
+
+    aktualisiert = Signal()
+
+    def __init__(self, scene: QGraphicsScene, parent: QObject = None):
+        super().__init__(parent)
+        self._scene = scene
+        self._items = {}
+        self._elemente = {}
+        self._basis = {}
+        self._eingang = bytearray()
+        self._socket = QTcpSocket(self)
+        self._socket.readyRead.connect(self.lesen)
+
+    def verbinden(self, host: str, port: int = STANDARDPORT):
+        self._socket.connectToHost(host, port)
+
+    def anzahlItems(self) -> int:
+        return len(self._items)
+
+    def lesen(self):
+        self._eingang += self._socket.readAll().data()
+        nachrichten, verbraucht = zerlegeNachrichten(self._eingang)
+        del self._eingang[:verbraucht]
+        for typ, daten in nachrichten:
+            self.verarbeite(typ, daten)
+        if nachrichten:
+            self.aktualisiert.emit()
+
+    def verarbeite(self, typ: int, daten: bytes):
+        if typ == HALLO:
+            version, = struct.unpack_from('<H', daten)
+            if version != VERSION:
+                logger.warning(f'Empfänger: Version {version} wird nicht unterstützt')
+                self._socket.abort()
+            return
+        id, = ID.unpack_from(daten)
+        offset = ID.size
+        if typ == ELEMENT:
+            self.element(id, daten, offset)
+        elif id not in self._items:
+            return
+        elif typ == ENTFERNEN:
+            self._scene.removeItem(self._items.pop(id))
+            self._elemente.pop(id, None)
+            self._basis.pop(id, None)
+        elif typ == NEUERPFAD:
+            self.setzePfad(id, entpackePfad(daten, offset)[0])
+        elif typ == NEUETRANSFORM:
+            self.setzeTransform(id, daten, offset)
+        elif typ == LIVEPUNKTE:
+            start, = ID.unpack_from(daten, offset)
+            self.setzePfad(id, self._elemente.get(id, [])[:start] + entpackePfad(daten, offset+ID.size)[0])
+
+    def element(self, id: int, daten: bytes, offset: int):
+        art = daten[offset]
+        offset += 1
+        transformOffset = offset
+        offset += TRANSFORMATION.size
+        alt = self._items.pop(id, None)
+        if alt is not None:
+            self._scene.removeItem(alt)
+        if art == ART_PFAD:
+            pencolor, penwidth, cosmetic, brushcolor = STIL.unpack_from(daten, offset)
+            pen = QPen(Qt.NoPen)
+            if pencolor:
+                pen = QPen(QColor.fromRgba(pencolor), penwidth, Qt.SolidLine, c=Qt.RoundCap, j=Qt.RoundJoin)
+                pen.setCosmetic(bool(cosmetic))
+            item = QGraphicsPathItem()
+            item.setPen(pen)
+            item.setBrush(QBrush(QColor.fromRgba(brushcolor)) if brushcolor else QBrush(Qt.NoBrush))
+            self._items[id] = item
+            self.setzePfad(id, entpackePfad(daten, offset+STIL.size)[0])
+            self._basis[id] = QTransform()
+        elif art == ART_BILD:
+            x, y, w, h = BILDRECT.unpack_from(daten, offset)
+            image = QImage.fromData(daten[offset+BILDRECT.size:], 'PNG')
+            if image.isNull():
+                return
+            item = QGraphicsPixmapItem(QPixmap.fromImage(image))
+            item.setTransformationMode(Qt.SmoothTransformation)
+            self._items[id] = item
+            self._basis[id] = QTransform().translate(x, y).scale(w/image.width(), h/image.height())
+        else:
+            return
+        self._scene.addItem(item)
+        self.setzeTransform(id, daten, transformOffset)
+
+    def setzePfad(self, id: int, elemente: list):
+        self._elemente[id] = elemente
+        self._items[id].setPath(pfadAusElementen(elemente))
+
+    def setzeTransform(self, id: int, daten: bytes, offset: int):
+        m11, m12, m21, m22, dx, dy = TRANSFORMATION.unpack_from(daten, offset)
+        self._items[id].setTransform(self._basis[id]*QTransform(m11, m12, m21, m22, dx, dy))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    app = QApplication(sys.argv)
+    host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else STANDARDPORT
+    scene = QGraphicsScene()
+    view = QGraphicsView(scene)
+    view.setRenderHint(QPainter.Antialiasing)
+    view.setWindowTitle(f'Endlostafel – {host}:{port}')
+    empfaenger = Empfaenger(scene, view)
+    empfaenger.verbinden(host, port)
+    view.show()
+    sys.exit(app.exec())
+
+
+if __name__ == '__main__':
+    main()
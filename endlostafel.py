@@ -23,17 +23,24 @@ from typing import IO
 
 from PySide6.QtCore import QLocale, QMarginsF, QSettings, QDate, QTime, QTimer, Qt, Slot
 from PySide6.QtSvg import QSvgGenerator
-from PySide6.QtGui import QAction, QActionGroup, QCloseEvent, QColor, QGuiApplication, QPainter, QPixmap, QPalette, QFont, QUndoStack
+from PySide6.QtGui import QAction, QActionGroup, QCloseEvent, QColor, QGuiApplication, QImage, QPainter, QPalette, QFont, QUndoStack
 from PySide6.QtWidgets import QApplication, QFileDialog, QLabel, QMainWindow, QMenu, QMessageBox, QSizePolicy, QToolBar, QToolButton, QWidget, QWidgetAction, QColorDialog, QUndoView
 
 
 from icons import ColorIcon, SVGIcon
+from bildpyramide import BildPyramide
+from textraster import TextRaster
 from items import Pixelbild, SVGBild, Karopapier, Linienpapier, TextItem
 from vordrucke import MmLogDialog
 from tafelview import Tafelview, Werkzeug, Status
 from paletten import dark as paletteDark, light as paletteLight
-from logwindow import LogWindowHandler, LogWindow
+from logwindow import LogWindow, starteLogging
 from undo import UndoWindow
+from eingabetrace import Abspieler, Aufzeichnung
+from profiler import Profiler
+from speicherwaechter import KRITISCH, WARNUNG, Speicherwaechter
+from uebertragung import Uebertragung
+from synchronisation import Synchronisation
 
 # Zum Erzeugen der exe:
 # pyinstaller.exe -F -i "oszli-icon.ico" -w endlostafel.py
@@ -51,6 +58,11 @@ class Editor(QMainWindow):
         self._undoview = undoview
         self.logwindow = LogWindow(self)
         self._ungespeichert = False
+        self._initialisiert = False
+        self._aufzeichnung = None
+        self._profiler = Profiler()
+        self._uebertragung = None
+        self._synchronisation = None
         uhr = Uhr(self)
         self.undostack = QUndoStack(self)
 
@@ -58,7 +70,7 @@ class Editor(QMainWindow):
         QApplication.setPalette(paletteDark if isdarkmode else paletteLight)
 
         # Das wichtigste: Die QGraphicsView
-        self._tafelview = Tafelview(self, self.undostack, self.getBigPointFactor(), self.getVeryBigPointFactor(), self.getKalibriert())
+        self._tafelview = Tafelview(self, self.undostack, self.getBigPointFactor(), self.getVeryBigPointFactor(), self.getKalibriert(), profile=self.getProfile())
 
         # Die Statusleiste wird gebastelt
         self._speicherlabel = QLabel()
@@ -66,6 +78,11 @@ class Editor(QMainWindow):
         self.statusBar().addPermanentWidget(self._speicherlabel)
         self.statusBar().addPermanentWidget(QLabel(f'Version {VERSION} '))
 
+        self._speicherwaechter = Speicherwaechter(self._tafelview, self.undostack,
+                                                  int(self._settings.value('speicher/warnung', WARNUNG)),
+                                                  int(self._settings.value('speicher/kritisch', KRITISCH)))
+        self._speicherwaechter.meldung.connect(self.statusbarinfo)
+
         # keine Kontextmenüs
         self.setContextMenuPolicy(Qt.NoContextMenu)
 
@@ -114,6 +131,7 @@ class Editor(QMainWindow):
         actEllipseF  = Action( 'ellipsef',      'gefüllte Ellipse', self)
         actRechteckF = Action('rechteckf',    'gefülltes Rechteck', self)
         actRubber    = Action( 'radierer',              'Radieren', self)
+        actStrichRubber = Action('erease-noborder', 'Ganze Striche radieren', self)
         actEdit      = Action(     'edit',     'Objekte editieren', self)
         self._toolactions = {
             self._actFreihand:  Werkzeug.Freihand,
@@ -132,6 +150,7 @@ class Editor(QMainWindow):
         }
         self._statusactions = {
             actRubber:    Status.radieren,
+            actStrichRubber: Status.strichradieren,
             actEdit:      Status.editieren,
         }
         self._statusgroup = QActionGroup(self)
@@ -157,6 +176,12 @@ class Editor(QMainWindow):
         clipboardPasteAction   = Action('fromclipboard', 'Zwischenablage einfügen', self)
         kalibrierenAction      = Action('radierer-kalibrieren', 'Radierer kalibrieren', self)
 
+        # Versteckt, nur über das Tastenkürzel erreichbar
+        self._profilerAction = QAction('Profiler', self)
+        self._profilerAction.setShortcut('Ctrl+Shift+P')
+        self._profilerAction.setCheckable(True)
+        self.addAction(self._profilerAction)
+
         mmPapierDialog = MmLogDialog()
         mmPapierAction = Action('logpapier', 'mm/log-Papier', self)
         self._karopapierAction = Action('karopapier', 'kariertes Papier', self)
@@ -181,6 +206,7 @@ class Editor(QMainWindow):
         pensizetool = ActionWidget(self, actP1, self._actP2, actP3, actP4, popupMode=QToolButton.InstantPopup)
         linesTool = ActionWidget(self, actLinie, actLinieS)
         pfeileTool = ActionWidget(self, actPfeil, actPfeilS)
+        radierTool = ActionWidget(self, actRubber, actStrichRubber)
         formsTool = ActionWidget(self, actKreis, actQuadrat, actEllipse, actRechteck, actKreisF, actQuadratF, actEllipseF, actRechteckF)
 
         self._toolframe.addAction(exitAction)
@@ -208,7 +234,7 @@ class Editor(QMainWindow):
         self._toolframe.addAction(linesTool)
         self._toolframe.addAction(pfeileTool)
         self._toolframe.addAction(formsTool)
-        self._toolframe.addAction(actRubber)
+        self._toolframe.addAction(radierTool)
         self._toolframe.addAction(actEdit)
         self._toolframe.addSeparator()
 
@@ -255,6 +281,7 @@ class Editor(QMainWindow):
         mmPapierDialog.mmPapierCreated.connect(self._tafelview.importItem)
         clipboardPasteAction.triggered.connect(self.importClipboard)
         kalibrierenAction.triggered.connect(self._tafelview.starteKalibrieren)
+        self._profilerAction.triggered.connect(self.profilerUmschalten)
         self._undoAction.setIcon(SVGIcon('undo'))
         self._redoAction.setIcon(SVGIcon('redo'))
         self._toolframe.findChild(QToolButton, "qt_toolbar_ext_button").setIcon(SVGIcon('toolbarbutton'))
@@ -294,6 +321,7 @@ class Editor(QMainWindow):
         if appstate == Qt.ApplicationActive:
             if self._debug:
                 self.logwindow.show()
+            self._initialisiert = True
             self.initView()
             self._fullscreenAction.setChecked(self.isFullScreen())
             self._tafelview.setSceneRectFromViewport()
@@ -301,6 +329,66 @@ class Editor(QMainWindow):
             if self._undoview:
                 UndoWindow(self, self.undostack).show()
 
+    def aufzeichnen(self, dateiname: str):
+        self._aufzeichnung = Aufzeichnung(dateiname)
+        self._tafelview.setAufzeichnung(self._aufzeichnung)
+        QApplication.instance().aboutToQuit.connect(self._aufzeichnung.schliessen)
+        logger.info(f'Zeichne Eingaben auf in {dateiname}')
+
+    def abspielen(self, dateiname: str, schnell: bool):
+        if not self._initialisiert:
+            self.lateInit(Qt.ApplicationActive)
+        abspieler = Abspieler(self._tafelview, dateiname, schnell)
+        if QApplication.platformName() == 'offscreen':
+            abspieler.fertig.connect(QApplication.instance().quit)
+        abspieler.start()
+
+    def uebertragen(self, port: int):
+        try:
+            self._uebertragung = Uebertragung(self._tafelview, self.undostack, port)
+        except OSError as e:
+            QMessageBox.warning(self, 'Hinweis', f'Die Übertragung konnte nicht gestartet werden: {e}')
+            return
+        self.statusbarinfo(f'Die Tafel wird auf Port {self._uebertragung.port()} übertragen.', 5000)
+        QApplication.instance().aboutToQuit.connect(self._uebertragung.beenden)
+
+    def synchronisieren(self, port: int = None, partner: str = None, code: str = ''):
+        '''Lauscht auf port und/oder verbindet sich mit partner (host:port). Ohne gemeinsamen
+        code wird nur auf localhost gelauscht.'''
+        if not self._initialisiert:
+            self.lateInit(Qt.ApplicationActive)
+        self._synchronisation = Synchronisation(self._tafelview, self.undostack, code)
+        try:
+            if port:
+                self._synchronisation.lauschen(port)
+            if partner:
+                host, _, partnerport = partner.rpartition(':')
+                self._synchronisation.verbinden(host or 'localhost', int(partnerport))
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, 'Hinweis', f'Die Synchronisation konnte nicht gestartet werden: {e}')
+            return
+        QApplication.instance().aboutToQuit.connect(self._synchronisation.beenden)
+
+    def profilieren(self, dateiname: str = None):
+        self._profiler = Profiler(dateiname)
+        self._profiler.start()
+        self._profilerAction.setChecked(True)
+        QApplication.instance().aboutToQuit.connect(self.profilerBeenden)
+
+    def profilerUmschalten(self):
+        if self._profiler.isAktiv():
+            self.profilerBeenden()
+        else:
+            self._profiler.start()
+            self.statusbarinfo('Profiler läuft. Beenden mit Strg+Umschalt+P', 5000)
+
+    def profilerBeenden(self):
+        bericht = self._profiler.stop()
+        self._profilerAction.setChecked(False)
+        if bericht:
+            self.logwindow.append(bericht)
+            self.logwindow.show()
+
     def tafelHatGemalt(self):
         self.setUngespeichert()
         self.displayMemoryUsage()
@@ -308,6 +396,16 @@ class Editor(QMainWindow):
     def getKalibriert(self) -> float:
         return float(self._settings.value('editor/kalibriert', 1500))
 
+    def getProfile(self) -> dict:
+        'Kalibrierte Touchpunktgrößen je Eingabegerät als (Median, MAD).'
+        profile = {}
+        self._settings.beginGroup('handballen')
+        for geraet in self._settings.childKeys():
+            median, mad = (float(wert) for wert in self._settings.value(geraet))
+            profile[geraet] = (median, mad)
+        self._settings.endGroup()
+        return profile
+
     def getBigPointFactor(self) -> float:
         return float(self._settings.value('editor/bigpointfactor', 3))
 
@@ -317,14 +415,19 @@ class Editor(QMainWindow):
     def setUngespeichert(self):
         self._ungespeichert = True
 
-    def kalibriertSpeichern(self, value: float):
+    def kalibriertSpeichern(self, geraet: str, value: float, mad: float):
+        # Der letzte Wert gilt auch für Geräte ohne eigenes Profil.
         self._settings.setValue('editor/kalibriert', value)
-        self.statusbarinfo(f"Kalibrierter Wert: {value}", 5000)
+        self._settings.setValue(f'handballen/{geraet}', [value, mad])
+        self.statusbarinfo(f"Kalibrierter Wert für {geraet}: {value} ± {mad}", 5000)
         QApplication.beep()
 
     def displayMemoryUsage(self):
-        anzahl = len(self._tafelview.scene().items())
-        self._speicherlabel.setText(f'{anzahl} Element' + ('' if anzahl == 1 else 'e') )
+        geparkt = self._tafelview.strichmodell().anzahlGeparkt()
+        anzahl = len(self._tafelview.scene().items()) + geparkt
+        rss = self._speicherwaechter.rss()
+        self._speicherlabel.setText(f'{anzahl} Element' + ('' if anzahl == 1 else 'e') + (f', {geparkt} geparkt' if geparkt else '')
+                                    + (f', {rss//2**20} MB' if rss else ''))
 
     def ungespeichertFortfahren(self, text: str):
         if self._ungespeichert:
@@ -393,7 +496,12 @@ class Editor(QMainWindow):
             if filename[-4:] == '.svg':
                 self._tafelview.importItem(SVGBild(filename))
             else:
-                self._tafelview.importItem(Pixelbild(QPixmap(filename)))
+                # Das Dekodieren läuft im Hintergrund, das Bild erscheint sobald es fertig ist.
+                pyramide = BildPyramide(filename)
+                if not pyramide.isValid():
+                    QMessageBox.warning(self, 'Hinweis', f'Die Datei {filename} konnte nicht gelesen werden.')
+                    return
+                self._tafelview.importItem(Pixelbild(pyramide))
 
     def einstellungenSpeichern(self):
         self._settings.setValue('editor/darkmode', self._darkmodeAction.isChecked())
@@ -427,6 +535,7 @@ class Editor(QMainWindow):
         if not filename:
             return
 
+        self._tafelview.strichmodell().allesAusparken()
         backgroundcolor = self.palette().color(QPalette.Base)
         rect = self._tafelview.scene().itemsBoundingRect().marginsAdded(QMarginsF(50,50,50,50))
         generator = QSvgGenerator()
@@ -455,15 +564,13 @@ class Editor(QMainWindow):
         mimeData = clipboard.mimeData()
 
         if mimeData.hasImage():
-            item = Pixelbild(QPixmap(mimeData.imageData()))
+            item = Pixelbild(BildPyramide(QImage(mimeData.imageData())))
             self._tafelview.importItem(item)
         elif mimeData.hasHtml():
-            item = TextItem()
-            item.setHtml(mimeData.html())
+            item = TextItem(TextRaster(mimeData.html()))
             self._tafelview.importItem(item)
         elif mimeData.hasText():
-            item = TextItem()
-            item.setPlainText(mimeData.text())
+            item = TextItem(TextRaster(mimeData.text(), html=False))
             self._tafelview.importItem(item)
 
     def showHelp(self):
@@ -474,6 +581,11 @@ class Editor(QMainWindow):
             <p><code>--logging [debug,info,warning,error,critical]<br/>
             --show [fullscreen,maximized,normal]<br/>
             --undoview<br/>
+            --aufzeichnen datei<br/>
+            --abspielen datei [--schnell]<br/>
+            --profile [datei]<br/>
+            --uebertragen [port]<br/>
+            --sync port, --syncmit host:port [--synccode code]<br/>
             --bigpointfactor float<br/>
             --verybigpointfactor float</code></p>
             <p>Startet die Tafel in Vollbild, maximiertem Fenster oder Fenster in Normalgröße. Bei
@@ -567,6 +679,14 @@ if __name__ == "__main__":
     parser.add_argument('--bigpointfactor',type=float,help='Größe eines großen Touchpoints gegenüber des kalibrierten Touchpoints.')
     parser.add_argument('--verybigpointfactor',type=float,help='Größe eines sehr großen Touchpoints gegenüber des kalibrierten Touchpoints.')
     parser.add_argument('--undoview',action='store_true',help='Zeigt ein Undo-Fenster an.')
+    parser.add_argument('--aufzeichnen',metavar='DATEI',help='Zeichnet alle Eingaben der Tafel in einer Binärdatei auf.')
+    parser.add_argument('--abspielen',metavar='DATEI',help='Spielt eine Aufzeichnung ab. Mit QT_QPA_PLATFORM=offscreen ohne Fenster, das Programm endet danach.')
+    parser.add_argument('--profile',nargs='?',const='',metavar='DATEI',help='Misst die Laufzeit aller Funktionen, zeigt die teuersten im Log-Window an und speichert eine pstats-Datei.')
+    parser.add_argument('--uebertragen',nargs='?',const=5123,type=int,metavar='PORT',help='Überträgt das Tafelbild live per TCP an Geräte im lokalen Netz (Standardport 5123).')
+    parser.add_argument('--sync',type=int,metavar='PORT',help='Wartet auf eine zweite Tafel, mit der alle Striche abgeglichen werden.')
+    parser.add_argument('--syncmit',metavar='HOST:PORT',help='Verbindet sich mit einer zweiten Tafel, die mit --sync gestartet wurde.')
+    parser.add_argument('--synccode',default='',metavar='CODE',help='Gemeinsamer Code beider Tafeln. Nur damit wartet --sync auch auf Verbindungen aus dem Netz statt nur von localhost.')
+    parser.add_argument('--schnell',action='store_true',help='Spielt die Aufzeichnung so schnell wie möglich statt in Originalgeschwindigkeit ab.')
 
     try:
         options=vars(parser.parse_args())
@@ -594,11 +714,22 @@ if __name__ == "__main__":
         settings.setValue('editor/verybigpointfactor', options['verybigpointfactor'])
 
     d = Editor(settings, options['logging'], options['undoview'])
-    handler = LogWindowHandler(d.logwindow)
-
-    logger.addHandler(handler)
+    loglistener = starteLogging(logger, d.logwindow)
+    app.aboutToQuit.connect(loglistener.stop)
     logger.info(f"Starte Endlostafel Version {VERSION}")
 
+    if options['aufzeichnen']:
+        d.aufzeichnen(options['aufzeichnen'])
+
+    if options['uebertragen']:
+        d.uebertragen(options['uebertragen'])
+
+    if options['sync'] or options['syncmit']:
+        QTimer.singleShot(0, lambda: d.synchronisieren(options['sync'], options['syncmit'], options['synccode']))
+
+    if options['profile'] is not None:
+        d.profilieren(options['profile'] or None)
+
     if showmode == 'normal':
         d.resize(800,600)
         d.showNormal()
@@ -607,5 +738,8 @@ if __name__ == "__main__":
     else:
         d.showMaximized()
 
+    if options['abspielen']:
+        QTimer.singleShot(0, lambda: d.abspielen(options['abspielen'], options['schnell']))
+
     sys.exit(app.exec())
 
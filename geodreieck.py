@@ -21,6 +21,8 @@ from PySide6.QtGui import QPainterPath, QPalette, QPolygonF
 from PySide6.QtSvgWidgets import QGraphicsSvgItem
 from PySide6.QtWidgets import QApplication, QGraphicsItem, QGraphicsView
 
+from cachepolitik import SCHWELLE, cachepolitik
+
 class Geodreieck(QGraphicsSvgItem):
     def __init__(self):
         super().__init__()
@@ -69,6 +71,14 @@ class Geodreieck(QGraphicsSvgItem):
     def shape(self) -> QPainterPath:
         return self._shape
 
+    def komplexitaet(self) -> int:
+        # Hunderte Skalenstriche und Ziffern: im Ruhezustand immer cachen
+        return SCHWELLE
+
+    def paint(self, painter, option, widget=None):
+        cachepolitik.gemalt(self)
+        super().paint(painter, option, widget)
+
     def initShape(self):
         dreieck = QPolygonF()
         dreieck.append(QPointF(0,0))
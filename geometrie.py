@@ -0,0 +1,225 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Geometrie der Striche als Punktfelder statt als QPainterPath.
+#
+# Typen und Punkte eines Pfades liegen als Feld der Länge N bzw. (N, 2) vor.
+# Trefferprüfung beim Radieren und Ausdünnen fertiger Striche rechnen so
+# über alle Punkte auf einmal. Ein QPainterPath entsteht erst zum Zeichnen.
+# Ohne NumPy gibt es gleichwertige Listen, nur Ausdünnen entfällt.
+
+import logging
+logger = logging.getLogger('GUI')
+
+import struct
+from PySide6.QtCore import QByteArray, QDataStream, QIODevice, QPointF, Qt
+from PySide6.QtGui import QPainterPath, QPolygonF
+
+from pfadkodierung import entpackePfad
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MOVETO = QPainterPath.MoveToElement.value
+LINETO = QPainterPath.LineToElement.value
+# QPainterPath im Format von QDataStream: Anzahl, je Element Typ, x, y, dann Start
+# des letzten Teilpfads und Füllregel, alles big endian
+if numpy is not None:
+    STROMELEMENT = numpy.dtype([('typ', '>i4'), ('x', '>f8'), ('y', '>f8')])
+
+
+def punkteAusPfad(path: QPainterPath):
+    'Liefert Elementtypen und Punkte eines QPainterPath.'
+    anzahl = path.elementCount()
+    typen = [0]*anzahl
+    punkte = [None]*anzahl
+    for i in range(anzahl):
+        element = path.elementAt(i)
+        typen[i] = element.type.value
+        punkte[i] = (element.x, element.y)
+    if numpy is None:
+        return typen, punkte
+    return numpy.array(typen, numpy.int8), numpy.array(punkte, numpy.float64).reshape(-1, 2)
+
+def entpackePunkte(daten, quant: int):
+    'Wie entpackePfad, aber alle Varints auf einmal und ohne QPainterPath.'
+    if numpy is None:
+        elemente = entpackePfad(daten, quant=quant)[0]
+        return [e[0] for e in elemente], [e[1:] for e in elemente]
+    b = numpy.frombuffer(daten, numpy.uint8)
+    ende = b < 0x80
+    # Jedes Byte gehört zum Varint, das nach dem letzten Endbyte beginnt.
+    anfang = numpy.flatnonzero(numpy.r_[True, ende[:-1]])
+    nummer = numpy.r_[0, numpy.cumsum(ende[:-1])]
+    stelle = (numpy.arange(len(b)) - anfang[nummer])*7
+    werte = numpy.add.reduceat((b & 0x7f).astype(numpy.uint64) << stelle.astype(numpy.uint64), anfang)
+    anzahl = int(werte[0])
+    xwerte = werte[1:1+2*anzahl:2]
+    ywerte = werte[2:2+2*anzahl:2]
+    punkte = numpy.empty((anzahl, 2), numpy.float64)
+    punkte[:, 0] = numpy.cumsum(entzickzackFeld(xwerte >> numpy.uint64(2)))/quant
+    punkte[:, 1] = numpy.cumsum(entzickzackFeld(ywerte))/quant
+    return (xwerte & numpy.uint64(3)).astype(numpy.int8), punkte
+
+def entzickzackFeld(n):
+    return (n >> numpy.uint64(1)).astype(numpy.int64) ^ -(n & numpy.uint64(1)).astype(numpy.int64)
+
+def istPolylinie(typen) -> bool:
+    'Nur Move- und LineTo-Elemente, also keine Kurven.'
+    if numpy is None:
+        return all(typ <= LINETO for typ in typen)
+    return bool((typen <= LINETO).all())
+
+def irgendeiner(maske) -> bool:
+    if numpy is None:
+        return any(maske)
+    return bool(maske.any())
+
+def punkteInPolygon(punkte, polygon: QPolygonF):
+    'Maske der Punkte innerhalb des Polygons (gerade-ungerade-Regel wie QPainterPath.contains).'
+    if numpy is None:
+        return [polygon.containsPoint(QPointF(x, y), Qt.OddEvenFill) for x, y in punkte]
+    maske = numpy.zeros(len(punkte), bool)
+    ecken = numpy.array([(p.x(), p.y()) for p in polygon], numpy.float64).reshape(-1, 2)
+    if len(ecken) < 3 or not len(punkte):
+        return maske
+    # Nur Punkte im umgebenden Rechteck kommen in Frage.
+    xmin, ymin = ecken.min(axis=0)
+    xmax, ymax = ecken.max(axis=0)
+    x, y = punkte[:, 0], punkte[:, 1]
+    kandidaten = numpy.flatnonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+    if not len(kandidaten):
+        return maske
+    px = x[kandidaten, None]
+    py = y[kandidaten, None]
+    x1, y1 = ecken[:, 0], ecken[:, 1]
+    x2, y2 = numpy.roll(x1, -1), numpy.roll(y1, -1)
+    kreuzt = (y1 > py) != (y2 > py)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        links = px < x1 + (py - y1)*(x2 - x1)/(y2 - y1)
+    maske[kandidaten] = ((kreuzt & links).sum(axis=1) & 1).astype(bool)
+    return maske
+
+def abstandZuStrecke(punkte, a, b):
+    'Abstand jedes Punktes zur Strecke von a nach b.'
+    if numpy is None:
+        return [abstandPunktStrecke(p, a, b) for p in punkte]
+    a = numpy.asarray(a, numpy.float64)
+    d = numpy.asarray(b, numpy.float64) - a
+    laenge2 = float(d @ d)
+    if laenge2 == 0:
+        return numpy.hypot(*(punkte - a).T)
+    t = numpy.clip((punkte - a) @ d/laenge2, 0, 1)
+    return numpy.hypot(*(punkte - a - t[:, None]*d).T)
+
+def abstandPunktStrecke(p, a, b) -> float:
+    dx, dy = b[0]-a[0], b[1]-a[1]
+    laenge2 = dx*dx + dy*dy
+    t = 0 if laenge2 == 0 else min(1, max(0, ((p[0]-a[0])*dx + (p[1]-a[1])*dy)/laenge2))
+    return ((p[0]-a[0]-t*dx)**2 + (p[1]-a[1]-t*dy)**2)**.5
+
+def ausduennen(typen, punkte, toleranz: float):
+    '''Ramer-Douglas-Peucker je Teilpfad. Liefert die Maske der Punkte, die bleiben,
+    oder None, wenn nichts wegfällt (auch bei Kurven und ohne NumPy).'''
+    if numpy is None or len(punkte) < 3 or not istPolylinie(typen):
+        return None
+    anzahl = len(punkte)
+    behalten = numpy.zeros(anzahl, bool)
+    anfaenge = numpy.flatnonzero(typen == MOVETO)
+    if not len(anfaenge) or anfaenge[0] != 0:
+        anfaenge = numpy.r_[0, anfaenge]
+    enden = numpy.r_[anfaenge[1:], anzahl] - 1
+    behalten[anfaenge] = True
+    behalten[enden] = True
+    stapel = list(zip(anfaenge.tolist(), enden.tolist()))
+    while stapel:
+        a, b = stapel.pop()
+        if b - a < 2:
+            continue
+        abstand = abstandZuStrecke(punkte[a+1:b], punkte[a], punkte[b])
+        i = int(abstand.argmax())
+        if abstand[i] > toleranz:
+            mitte = a + 1 + i
+            behalten[mitte] = True
+            stapel.append((a, mitte))
+            stapel.append((mitte, b))
+    if behalten.all():
+        return None
+    return behalten
+
+def ohneGetroffene(typen, punkte, getroffen):
+    'Entfernt getroffene Punkte einer Polylinie. Nach einer Lücke beginnt ein neuer Teilpfad.'
+    if numpy is None:
+        neutypen, neupunkte = [], []
+        geschnitten = False
+        for typ, punkt, treffer in zip(typen, punkte, getroffen):
+            if treffer:
+                geschnitten = True
+                continue
+            neutypen.append(MOVETO if geschnitten else typ)
+            neupunkte.append(punkt)
+            geschnitten = False
+        return neutypen, neupunkte
+    geschnitten = numpy.r_[False, getroffen[:-1]]
+    bleibt = ~getroffen
+    return numpy.where(geschnitten, MOVETO, typen)[bleibt].astype(numpy.int8), punkte[bleibt]
+
+def packeStrom(typen, punkte) -> bytes:
+    'Eine Polylinie, die mit MoveTo beginnt, im Format von QDataStream.'
+    # Wie moveTo: von aufeinanderfolgenden MoveTo-Elementen zählt nur das letzte.
+    bleibt = numpy.r_[(typen[:-1] != MOVETO) | (typen[1:] != MOVETO), True]
+    typen, punkte = typen[bleibt], punkte[bleibt]
+    elemente = numpy.empty(len(typen), STROMELEMENT)
+    elemente['typ'] = typen
+    elemente['x'] = punkte[:, 0]
+    elemente['y'] = punkte[:, 1]
+    letzterStart = int(numpy.flatnonzero(typen == MOVETO)[-1])
+    return struct.pack('>i', len(typen)) + elemente.tobytes() + struct.pack('>ii', letzterStart, Qt.OddEvenFill.value)
+
+def stromformatPasst() -> bool:
+    'Das Format ist von Hand nachgebaut. Passt es nicht zu dieser Qt-Version, wird Punkt für Punkt gebaut.'
+    path = QPainterPath()
+    path.moveTo(1, 2)
+    path.lineTo(3, 4)
+    path.moveTo(5, 6)
+    path.lineTo(7, 8)
+    daten = QByteArray()
+    QDataStream(daten, QIODevice.WriteOnly) << path
+    punkte = numpy.array([[1, 2], [3, 4], [5, 6], [7, 8]], numpy.float64)
+    return daten.data() == packeStrom(numpy.array([MOVETO, LINETO, MOVETO, LINETO], numpy.int8), punkte)
+
+STROMFORMAT = numpy is not None and stromformatPasst()
+if numpy is not None and not STROMFORMAT:
+    logger.debug('geometrie: QDataStream-Format von QPainterPath unbekannt, Pfade werden Punkt für Punkt gebaut')
+
+def pfadAusPunkten(typen, punkte) -> QPainterPath:
+    'Baut einen QPainterPath aus einer Polylinie.'
+    path = QPainterPath()
+    if not len(typen):
+        return path
+    if not STROMFORMAT or typen[0] != MOVETO:
+        for typ, (x, y) in zip(typen, punkte):
+            if typ == MOVETO:
+                path.moveTo(x, y)
+            else:
+                path.lineTo(x, y)
+        return path
+    # Ein Aufruf statt eines QPointF pro Punkt
+    QDataStream(QByteArray(packeStrom(typen, punkte))) >> path
+    return path
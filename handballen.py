@@ -0,0 +1,160 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Unterscheidet Finger/Stift und Handballen an der Größe der Touchpunkte.
+#
+# Pro Eingabegerät wird die Größe normaler Punkte fortlaufend über Median und MAD
+# (mittlere absolute Abweichung vom Median) geschätzt, einzelne Ausreißer verschieben
+# die Schätzung kaum. Ein neuer Punkt ist nach dem ersten oder spätestens dem zweiten
+# Sample eingeordnet. Solange er unentschieden ist, beginnt er keinen Strich.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from collections import deque
+from PySide6.QtCore import QObject, Signal
+
+STIFT, HANDBALLEN, UNENTSCHIEDEN = range(3)
+
+HISTORIE = 256
+# Erst ab so vielen Samples ersetzt die Schätzung den gespeicherten Wert.
+MINDESTANZAHL = 32
+NEUSCHAETZEN = 16
+KALIBRIERANZAHL = 50
+# Umrechnung der MAD in eine Standardabweichung bei Normalverteilung
+MADFAKTOR = 1.4826
+# Untergrenze der Streuung relativ zum Median, falls alle Punkte gleich groß sind
+MINDESTSTREUUNG = 0.15
+# Bis Median + ZSTIFT Streuungen ist ein Punkt sicher kein Handballen.
+ZSTIFT = 4
+# Ein aufsetzender Handballen wird vom ersten zum zweiten Sample deutlich größer.
+WACHSTUM = 1.5
+
+
+def geraeteName(device) -> str:
+    'Schlüssel für das Profil, auch als Name in den Einstellungen brauchbar.'
+    name = device.name() if device is not None else ''
+    return name.replace('/', '_').replace('\\', '_') or 'unbekannt'
+
+
+class Geraeteprofil:
+    __slots__ = ('groessen', 'median', 'mad', 'neu')
+
+    def __init__(self, median: float, mad: float = 0):
+        self.groessen = deque(maxlen=HISTORIE)
+        self.median = median
+        self.mad = mad
+        self.neu = 0
+
+    def lerne(self, groesse: float):
+        self.groessen.append(groesse)
+        self.neu += 1
+        if len(self.groessen) >= MINDESTANZAHL and self.neu >= NEUSCHAETZEN:
+            self.schaetze()
+
+    def schaetze(self):
+        werte = sorted(self.groessen)
+        self.median = werte[len(werte)//2]
+        abweichungen = sorted(abs(wert - self.median) for wert in werte)
+        self.mad = abweichungen[len(abweichungen)//2]
+        self.neu = 0
+
+    def streuung(self) -> float:
+        return max(MADFAKTOR*self.mad, MINDESTSTREUUNG*self.median)
+
+
+class Handballenerkennung(QObject):
+
+    kalibriert = Signal(str, float, float)
+
+    def __init__(self, mittlerePointsize: float, bigpointfactor: float, verybigpointfactor: float, profile: dict = None):
+        super().__init__()
+        self._standard = mittlerePointsize
+        self._bigpointfactor = bigpointfactor
+        self._verybigpointfactor = verybigpointfactor
+        self._profile = {geraet: Geraeteprofil(median, mad) for geraet, (median, mad) in (profile or {}).items()}
+        # Touchpunkt -> Entscheidung bzw. Größe beim ersten Sample
+        self._entschieden = {}
+        self._erste = {}
+        self._kalibriere = False
+        self._kalibriergeraet = None
+
+    def profil(self, geraet: str) -> Geraeteprofil:
+        if geraet not in self._profile:
+            self._profile[geraet] = Geraeteprofil(self._standard)
+        return self._profile[geraet]
+
+    def grenze(self, profil: Geraeteprofil) -> float:
+        return profil.median*self._bigpointfactor
+
+    def einordnen(self, geraet: str, id: int, groesse: float) -> int:
+        'Für jedes Sample eines Touchpunktes. Liefert STIFT, HANDBALLEN oder UNENTSCHIEDEN.'
+        profil = self.profil(geraet)
+        if self._kalibriere:
+            self.kalibriere(geraet, profil, groesse)
+            return STIFT
+        grenze = self.grenze(profil)
+        entscheidung = self._entschieden.get(id)
+        if entscheidung == STIFT and groesse > grenze:
+            # Zu spät erkannt, der begonnene Strich wird verworfen.
+            entscheidung = self._entschieden[id] = HANDBALLEN
+        if entscheidung is not None:
+            if entscheidung == STIFT:
+                profil.lerne(groesse)
+            return entscheidung
+
+        stiftgrenze = min(profil.median + ZSTIFT*profil.streuung(), grenze)
+        erstes = self._erste.pop(id, None)
+        if groesse > grenze or (erstes is not None and groesse > stiftgrenze and groesse > erstes*WACHSTUM):
+            entscheidung = HANDBALLEN
+        elif groesse <= stiftgrenze or erstes is not None:
+            entscheidung = STIFT
+            profil.lerne(groesse)
+        else:
+            self._erste[id] = groesse
+            return UNENTSCHIEDEN
+        self._entschieden[id] = entscheidung
+        return entscheidung
+
+    def sehrGross(self, geraet: str, groesse: float) -> bool:
+        return groesse > self.profil(geraet).median*self._verybigpointfactor and not self._kalibriere
+
+    def vergessen(self, id: int):
+        self._entschieden.pop(id, None)
+        self._erste.pop(id, None)
+
+    def zuruecksetzen(self):
+        self._entschieden.clear()
+        self._erste.clear()
+
+    def starteKalibrieren(self):
+        self._kalibriere = True
+        self._kalibriergeraet = None
+
+    def kalibriere(self, geraet: str, profil: Geraeteprofil, groesse: float):
+        # Das erste Gerät, das nach dem Start berührt wird, bekommt ein neues Profil.
+        if self._kalibriergeraet is None:
+            self._kalibriergeraet = geraet
+            profil.groessen.clear()
+        elif geraet != self._kalibriergeraet:
+            return
+        profil.groessen.append(groesse)
+        if len(profil.groessen) >= KALIBRIERANZAHL:
+            profil.schaetze()
+            self._kalibriere = False
+            logger.debug(f'Kalibriert {geraet}: Median {profil.median}, MAD {profil.mad}')
+            self.kalibriert.emit(geraet, profil.median, profil.mad)
@@ -21,16 +21,81 @@ logger = logging.getLogger('GUI')
 from math import sqrt, log10
 from typing import Any
 from PySide6.QtCore import QPointF, QRectF, QSizeF, Qt
-from PySide6.QtGui import QBrush, QColor, QPainterPath, QPalette, QPen, QPixmap
+from PySide6.QtGui import QBrush, QColor, QPaintEngine, QPainter, QPainterPath, QPalette, QPen, QPolygonF
+from PySide6.QtSvg import QSvgRenderer
 from PySide6.QtSvgWidgets import QGraphicsSvgItem
-from PySide6.QtWidgets import QGraphicsItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsPixmapItem, QGraphicsRectItem, QGraphicsTextItem
-
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsLineItem, QGraphicsPathItem, QGraphicsRectItem, QStyle, QStyleOptionGraphicsItem, QWidget
+
+from bildpyramide import BildPyramide
+from cachepolitik import cachepolitik
+import geometrie
+from kacheln import kachelrenderer
+from pfadkodierung import SPEICHERQUANT, packePfad, pfadcache
+from svgraster import SVGRaster
+from textraster import TextRaster
+from umriss import berechneStrich, berechneUmriss, umrissrechner
 from undo import MoveItem
 
+# Abweichung in Viewport-Pixeln, bis zu der Punkte fertiger Freihandstriche wegfallen
+AUSDUENNEN = .25
+# Änderungen, nach denen ein gekachelter Strich wieder direkt gezeichnet wird (siehe kacheln)
+KACHELAENDERUNGEN = {QGraphicsItem.ItemPositionHasChanged, QGraphicsItem.ItemTransformHasChanged,
+                     QGraphicsItem.ItemScaleHasChanged, QGraphicsItem.ItemRotationHasChanged,
+                     QGraphicsItem.ItemTransformOriginPointHasChanged, QGraphicsItem.ItemZValueHasChanged,
+                     QGraphicsItem.ItemVisibleHasChanged, QGraphicsItem.ItemSelectedHasChanged,
+                     QGraphicsItem.ItemSceneChange, QGraphicsItem.ItemSceneHasChanged}
+
+def zeichneAuswahl(painter: QPainter, option: QStyleOptionGraphicsItem, rect: QRectF):
+    if option.state & QStyle.State_Selected:
+        pen = QPen(option.palette.color(QPalette.WindowText), 0, Qt.DashLine)
+        painter.setPen(pen)
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(rect)
+
+class Stiltabelle:
+    '''Stifte und Pinsel, die sich alle Pfade teilen. Ein Pfad merkt sich nur die Nummer
+    seines Stils. Ein Wechsel der Palette ändert so nur die Stile in der Vordergrundfarbe.'''
+    def __init__(self):
+        self._stile = []
+
+    def stilId(self, pen: QPen, brush: QBrush, isfgcolor: bool = False) -> int:
+        pen = QPen(pen)
+        brush = QBrush(brush)
+        for i, (stilpen, stilbrush, fg) in enumerate(self._stile):
+            if fg == isfgcolor and stilpen == pen and stilbrush == brush:
+                return i
+        self._stile.append((pen, brush, isfgcolor))
+        return len(self._stile)-1
+
+    def stil(self, stil: int) -> tuple:
+        return self._stile[stil]
+
+    def anzahl(self) -> int:
+        return len(self._stile)
+
+    def newPalette(self, palette):
+        newfgcolor = palette.color(QPalette.WindowText)
+        for pen, brush, fg in self._stile:
+            if fg:
+                pen.setColor(newfgcolor)
+                brush.setColor(newfgcolor)
+
+stiltabelle = Stiltabelle()
+
+
 class Pfad(QGraphicsPathItem):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__()
-        self._colorisfgcolor = False
+        # Komprimierter Pfad fertiger Striche (siehe komprimieren)
+        self._daten = None
+        self._rect = None
+        self._anzahl = 0
+        # Zwischengespeicherter Umriss für shape (siehe umriss)
+        self._umriss = None
+        self._umrissVersion = 0
+        # Typen und Punkte für das Radieren (siehe geometrie)
+        self._geometrie = None
+        self._stil = stiltabelle.stilId(pen, brush)
         self.setPos(pos)
         self.setPen(pen)
         self.setBrush(brush)
@@ -47,17 +112,30 @@ class Pfad(QGraphicsPathItem):
         return self._oldpos
 
     def setColorIsFGColor(self, isfgcolor: bool):
-        self._colorisfgcolor = isfgcolor
-
-    def newPalette(self, palette):
-        newfgcolor = palette.color(QPalette.WindowText)
-        pen = self.pen()
-        brush = self.brush()
-        if self._colorisfgcolor:
-            pen.setColor(newfgcolor)
-            self.setPen(pen)
-            brush.setColor(newfgcolor)
-            self.setBrush(brush)
+        kachelrenderer.geaendert(self)
+        self._stil = stiltabelle.stilId(self.pen(), self.brush(), isfgcolor)
+
+    def colorIsFGColor(self) -> bool:
+        return stiltabelle.stil(self._stil)[2]
+
+    def pen(self) -> QPen:
+        return QPen(stiltabelle.stil(self._stil)[0])
+
+    def brush(self) -> QBrush:
+        return QBrush(stiltabelle.stil(self._stil)[1])
+
+    def setPen(self, pen: QPen):
+        kachelrenderer.geaendert(self)
+        if QPen(pen).widthF() != self.pen().widthF():
+            self.umrissVerwerfen()
+        self._stil = stiltabelle.stilId(pen, self.brush(), self.colorIsFGColor())
+        # Die Breite braucht QGraphicsPathItem für boundingRect und shape.
+        super().setPen(stiltabelle.stil(self._stil)[0])
+
+    def setBrush(self, brush: QBrush):
+        kachelrenderer.geaendert(self)
+        self._stil = stiltabelle.stilId(self.pen(), brush, self.colorIsFGColor())
+        super().setBrush(stiltabelle.stil(self._stil)[1])
     
     def change(self):
         self.setTransformOriginPoint(self.boundingRect().center())
@@ -67,15 +145,117 @@ class Pfad(QGraphicsPathItem):
             undostack.push(MoveItem(self, QPointF(self._oldpos), QPointF(self.pos())))
             self._oldpos = None
 
+    def fertig(self):
+        'Nach dem Zeichnen oder Radieren: Pfad komprimieren und den Umriss im Hintergrund berechnen.'
+        self.komprimieren()
+        if self._umriss is None and not self._shape:
+            umrissrechner.anfordern(self, self._umrissVersion, self.path(), self.pen())
+        cachepolitik.pruefe(self)
+
+    def komplexitaet(self) -> int:
+        if kachelrenderer.gekachelt(self):
+            # Gekachelte Striche brauchen keinen eigenen Cache.
+            return 0
+        if self._daten is not None:
+            return self._anzahl
+        return super().path().elementCount()
+
+    def umrissVerwerfen(self):
+        self._umriss = None
+        self._umrissVersion += 1
+
+    def setUmriss(self, version: int, umriss: QPainterPath):
+        if version == self._umrissVersion:
+            self._umriss = umriss
+
+    def komprimieren(self) -> bool:
+        '''Ein fertiger Strich behält nur den kodierten Pfad. Gezeichnet und radiert wird
+        mit dem dekodierten Pfad aus dem pfadcache.'''
+        if self._daten is not None:
+            return True
+        path = super().path()
+        if path.isEmpty():
+            return False
+        rect = super().boundingRect()
+        self.prepareGeometryChange()
+        self._daten = packePfad(path, quant=SPEICHERQUANT)
+        self._rect = rect
+        self._anzahl = path.elementCount()
+        super().setPath(QPainterPath())
+        pfadcache.merke(self, path)
+        self._geometrie = None
+        return True
+
+    def isKomprimiert(self) -> bool:
+        return self._daten is not None
+
+    def path(self) -> QPainterPath:
+        if self._daten is None:
+            return super().path()
+        return QPainterPath(pfadcache.hole(self, self._daten))
+
+    def setPath(self, path: QPainterPath):
+        kachelrenderer.geaendert(self)
+        self.umrissVerwerfen()
+        self._geometrie = None
+        if self._daten is not None:
+            self.prepareGeometryChange()
+            self._daten = None
+            self._rect = None
+            pfadcache.vergiss(self)
+        super().setPath(path)
+
+    def geometrie(self):
+        'Elementtypen und Punkte des Pfades, bei komprimierten Strichen direkt aus den Daten.'
+        if self._geometrie is None:
+            if self._daten is not None:
+                self._geometrie = geometrie.entpackePunkte(self._daten, SPEICHERQUANT)
+            else:
+                self._geometrie = geometrie.punkteAusPfad(super().path())
+        return self._geometrie
+
+    def isKachelbar(self) -> bool:
+        return True
+
+    def kachelEintrag(self) -> tuple:
+        'Für den Schnappschuss des Kachelrenderers: Stift, Pinsel und Pfad oder die kodierten Daten.'
+        pen, brush, _ = stiltabelle.stil(self._stil)
+        if self._daten is None:
+            pfad = QPainterPath(super().path())
+        else:
+            pfad = pfadcache.nachsehen(self)
+            pfad = self._daten if pfad is None else QPainterPath(pfad)
+        return QPen(pen), QBrush(brush), pfad
+
+    def boundingRect(self) -> QRectF:
+        if self._daten is None:
+            return super().boundingRect()
+        return QRectF(self._rect)
+
     def shape(self):
         if self._shape:
             return self._shape
-        else:
-            return super().shape()
+        if self._umriss is None:
+            self._umriss = berechneUmriss(self.path(), self.pen())
+        return self._umriss
 
     def setShape(self, shape):
         self._shape = shape
 
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        if widget is not None and kachelrenderer.gekachelt(self):
+            # Im Viewport steckt der Strich in den Kacheln, Export und Übertragung zeichnen ohne widget.
+            return
+        cachepolitik.gemalt(self)
+        pen, brush, _ = stiltabelle.stil(self._stil)
+        painter.setPen(pen)
+        painter.setBrush(brush)
+        if self._daten is None:
+            painter.drawPath(super().path())
+        else:
+            painter.drawPath(pfadcache.hole(self, self._daten))
+        zeichneAuswahl(painter, option, self.boundingRect())
+
     def clone(self):
         clonepfad = Pfad(self.pos(), self.pen(), self.brush())
         clonepfad.setPath(self.path())
@@ -90,34 +270,68 @@ class Pfad(QGraphicsPathItem):
         if change == QGraphicsItem.ItemPositionChange:
             if not self._oldpos:
                 self._oldpos = self.pos()
+        elif change == QGraphicsItem.ItemScaleHasChanged:
+            self.umrissVerwerfen()
+        elif change == QGraphicsItem.ItemSelectedHasChanged:
+            # Ausgewählte Items werden verschoben oder skaliert.
+            if value:
+                cachepolitik.verwerfen(self)
+            else:
+                cachepolitik.pruefe(self)
+        if change in KACHELAENDERUNGEN:
+            kachelrenderer.geaendert(self)
         return super().itemChange(change, value)
 
-    def removeElements(self, radiererpfadscene: QPainterPath):
+    def getroffen(self, radiererpfadscene: QPainterPath) -> bool:
+        '''Für den Strichradierer. Anders als shape() zählt bei ungefüllten Pfaden nur der Strich,
+        nicht die Fläche innen, z.B. in einem Kreis oder im Bogen eines C.'''
         radiererpfad = self.mapFromScene(radiererpfadscene)
+        if self.brush() != Qt.NoBrush:
+            return self.shape().intersects(radiererpfad)
+        return berechneStrich(self.path(), self.pen()).intersects(radiererpfad)
+
+    def removeElements(self, radiererpfadscene: QPainterPath) -> QPainterPath:
+        '''Entfernt die Punkte unter dem Radiergummi. Liefert den Pfad von vorher,
+        oder None, wenn kein Punkt getroffen wurde.'''
         neupfad = QPainterPath()
         if self.brush() != Qt.NoBrush:
             # Gefüllte Elemente werden gelöscht.
+            cachepolitik.verwerfen(self)
+            pfad = self.path()
             self.setPath(neupfad)
-            return
-        anzahl = self.path().elementCount()
+            return pfad
+        typen, punkte = self.geometrie()
+        getroffen = geometrie.punkteInPolygon(punkte, self.mapFromScene(radiererpfadscene).toFillPolygon())
+        if not geometrie.irgendeiner(getroffen):
+            return None
+        cachepolitik.verwerfen(self)
+        pfad = self.path()
+        if geometrie.istPolylinie(typen):
+            typen, punkte = geometrie.ohneGetroffene(typen, punkte, getroffen)
+            self.setPath(geometrie.pfadAusPunkten(typen, punkte))
+            # Das nächste Event desselben Radierens braucht den Pfad nicht zu zerlegen.
+            self._geometrie = (typen, punkte)
+            self.setTransformOriginPoint(self.boundingRect().center())
+            return pfad
+        anzahl = pfad.elementCount()
         if anzahl > 1:
             geschnitten = False
             i=0
             while i < anzahl:
-                element = self.path().elementAt(i)
+                element = pfad.elementAt(i)
                 pos = QPointF(element.x, element.y)
                 cp1 = None
                 cp2 = None
                 if element.isCurveTo():
                     cp1 = pos
                     i += 1
-                    de1 = self.path().elementAt(i)
+                    de1 = pfad.elementAt(i)
                     cp2 = QPointF(de1.x,de1.y)
                     i += 1
-                    de2 = self.path().elementAt(i)
+                    de2 = pfad.elementAt(i)
                     pos = QPointF(de2.x,de2.y)
                 #logger.info(f"{i}: {pos}, {element.type}, {cp1} : {cp2}")
-                if radiererpfad.contains(pos) and element.type != QPainterPath.CurveToDataElement:
+                if getroffen[i] and element.type != QPainterPath.CurveToDataElement:
                     # Dieser Punkt wird nicht gezeichnet
                     geschnitten = True
                 else:
@@ -135,12 +349,23 @@ class Pfad(QGraphicsPathItem):
 
         self.setPath(neupfad)
         self.setTransformOriginPoint(self.boundingRect().center())
+        return pfad
 
 
 class Stift(Pfad):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
 
+    def ausduennen(self, zoom: float):
+        '''Vor dem Abschließen: Punkte, die beim Zeichnen mit dem Zoomfaktor zoom weniger
+        als AUSDUENNEN Pixel von der Linie abweichen, fallen weg.'''
+        if self.isKomprimiert():
+            return
+        typen, punkte = self.geometrie()
+        behalten = geometrie.ausduennen(typen, punkte, AUSDUENNEN/(zoom*self.scale()))
+        if behalten is not None:
+            self.setPath(geometrie.pfadAusPunkten(typen[behalten], punkte[behalten]))
+
     def change(self, posscene: QPointF):
         pos = self.mapFromScene(posscene)
         path = self.path()
@@ -177,27 +402,154 @@ class LinieSnap(Pfad):
         super().change()
 
 
-class Pfeil(Pfad):
+class Form(Pfad):
+    """Pfeil, Kreis, Ellipse, Quadrat und Rechteck werden als Parameter gespeichert und
+    direkt gezeichnet. Erst wenn der Radiergummi sie zerschneidet, werden sie zum Pfad."""
+    def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
+        super().__init__(pos, pen, brush)
+        self._form = None
+        self._formpfad = None
+        self._formshape = None
+
+    def isForm(self) -> bool:
+        return self._form is not None
+
+    def fertig(self):
+        # Solange die Form nur aus Parametern besteht, ist ihr Umriss billig.
+        if self._form is None:
+            super().fertig()
+
+    def isKachelbar(self) -> bool:
+        # Formen aus Parametern zeichnen sich schneller selbst.
+        return self._form is None
+
+    def komplexitaet(self) -> int:
+        if self._form is None:
+            return super().komplexitaet()
+        return 0
+
+    def form(self):
+        return self._form
+
+    def setForm(self, form):
+        self.prepareGeometryChange()
+        self._form = form
+        self._formpfad = None
+        self._formshape = None
+        self.update()
+        super().change()
+
+    def formRect(self) -> QRectF:
+        return self._form
+
+    def formPfad(self) -> QPainterPath:
+        raise NotImplementedError
+
+    def zeichneForm(self, painter: QPainter):
+        raise NotImplementedError
+
+    def formShape(self) -> QPainterPath:
+        return berechneUmriss(self.path(), self.pen())
+
+    def path(self) -> QPainterPath:
+        if self._form is None:
+            return super().path()
+        if self._formpfad is None:
+            self._formpfad = self.formPfad()
+        return QPainterPath(self._formpfad)
+
+    def setPath(self, path: QPainterPath):
+        # Ein gesetzter Pfad ersetzt die Parameter (Radieren, Undo, Synchronisation).
+        if getattr(self, '_form', None) is not None:
+            self.prepareGeometryChange()
+            self._form = None
+            self._formpfad = None
+            self._formshape = None
+        super().setPath(path)
+
+    def boundingRect(self) -> QRectF:
+        if self._form is None:
+            return super().boundingRect()
+        rand = self.pen().widthF()/2 if self.pen().style() != Qt.NoPen else 0
+        return self.formRect().normalized().adjusted(-rand, -rand, rand, rand)
+
+    def shape(self) -> QPainterPath:
+        if self._form is None:
+            return super().shape()
+        if self._formshape is None:
+            self._formshape = self.formShape()
+        return self._formshape
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        if self._form is None:
+            return super().paint(painter, option, widget)
+        cachepolitik.gemalt(self)
+        pen, brush, _ = stiltabelle.stil(self._stil)
+        painter.setPen(pen)
+        painter.setBrush(brush)
+        self.zeichneForm(painter)
+        zeichneAuswahl(painter, option, self.boundingRect())
+
+    def clone(self):
+        if self._form is None:
+            return super().clone()
+        cloneform = type(self)(self.pos(), self.pen(), self.brush())
+        cloneform.setScale(self.scale())
+        cloneform.setForm(self._form)
+        return cloneform
+
+    def removeElements(self, radiererpfadscene: QPainterPath) -> QPainterPath:
+        if self._form is not None and self.brush() == Qt.NoBrush:
+            radiererpfad = self.mapFromScene(radiererpfadscene)
+            pfad = self.path()
+            for i in range(pfad.elementCount()):
+                element = pfad.elementAt(i)
+                if element.type != QPainterPath.CurveToDataElement and radiererpfad.contains(QPointF(element.x, element.y)):
+                    break
+            else:
+                # Der Radiergummi liegt nur in der Fläche, die Form bleibt erhalten.
+                return None
+            self.setPath(pfad)
+        return super().removeElements(radiererpfadscene)
+
+
+class Pfeil(Form):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
 
     def change(self, posscene: QPointF):
-        pos = self.mapFromScene(posscene)
-        path = QPainterPath()
-        path.lineTo(pos)
-        ds = pos
-        ds0 = ds/sqrt(ds.x()*ds.x()+ds.y()*ds.y())
+        self.setForm(self.mapFromScene(posscene))
+
+    def spitze(self) -> QPolygonF:
+        pos = self._form
+        laenge = sqrt(pos.x()*pos.x()+pos.y()*pos.y())
+        if laenge == 0:
+            return QPolygonF()
+        ds0 = pos/laenge
         dl0 = QPointF(ds0.y(), -ds0.x())
         lw = self.pen().widthF()
-        path.moveTo(pos)
-        path.lineTo(pos-5*lw*ds0+lw*dl0)
-        path.lineTo(pos-5*lw*ds0-lw*dl0)
-        path.closeSubpath()
-        self.setPath(path)
-        super().change()
+        return QPolygonF([pos, pos-5*lw*ds0+lw*dl0, pos-5*lw*ds0-lw*dl0])
+
+    def formRect(self) -> QRectF:
+        return QRectF(QPointF(0,0), self._form).normalized() | self.spitze().boundingRect()
+
+    def formPfad(self) -> QPainterPath:
+        path = QPainterPath()
+        path.lineTo(self._form)
+        spitze = self.spitze()
+        if not spitze.isEmpty():
+            path.moveTo(spitze[0])
+            path.lineTo(spitze[1])
+            path.lineTo(spitze[2])
+            path.closeSubpath()
+        return path
+
+    def zeichneForm(self, painter: QPainter):
+        painter.drawLine(QPointF(0,0), self._form)
+        painter.drawPolygon(self.spitze())
 
 
-class PfeilSnap(Pfad):
+class PfeilSnap(Pfeil):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
 
@@ -207,86 +559,85 @@ class PfeilSnap(Pfad):
         if abs(pos.y()) <= abs(pos.x()):
             newpos.setX(pos.x())
             newpos.setY(0)
-        path = QPainterPath()
-        path.lineTo(newpos)
-        ds = newpos
-        ds0 = ds/sqrt(ds.x()*ds.x()+ds.y()*ds.y())
-        dl0 = QPointF(ds0.y(), -ds0.x())
-        lw = self.pen().widthF()
-        path.moveTo(newpos)
-        path.lineTo(newpos-5*lw*ds0+lw*dl0)
-        path.lineTo(newpos-5*lw*ds0-lw*dl0)
-        path.closeSubpath()
-        self.setPath(path)
-        super().change()
+        self.setForm(newpos)
 
 
-class Kreis(Pfad):
+class Ellipse(Form):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
-    
+
     def change(self, posscene: QPointF):
         pos = self.mapFromScene(posscene)
-        rx = pos.x()
-        ry = pos.y()
-        r = sqrt(rx*rx+ry*ry)
-        rect = QRectF(QPointF(-r,-r), QSizeF(2*r,2*r))
-        path = QPainterPath(QPointF(r,0))
+        rx = abs(pos.x())
+        ry = abs(pos.y())
+        self.setForm(QRectF(-QPointF(rx,ry), QSizeF(2*rx,2*ry)))
+
+    def formPfad(self) -> QPainterPath:
+        # Zum Radieren braucht es genug Stützpunkte auf dem Rand.
+        rect = self._form
+        path = QPainterPath(QPointF(rect.right(), rect.center().y()))
         for winkel in range(0,360,15):
             path.arcTo(rect, winkel, 15)
-        self.setPath(path)
-        super().change()
+        return path
+
+    def formShape(self) -> QPainterPath:
+        shape = QPainterPath()
+        shape.addEllipse(self.boundingRect())
+        return shape
+
+    def zeichneForm(self, painter: QPainter):
+        painter.drawEllipse(self._form)
 
 
-class Ellipse(Pfad):
+class Kreis(Ellipse):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
-
+    
     def change(self, posscene: QPointF):
         pos = self.mapFromScene(posscene)
-        rx = abs(pos.x())
-        ry = abs(pos.y())
-        rect = QRectF(-QPointF(rx,ry), QSizeF(2*rx,2*ry))
-        path = QPainterPath(QPointF(rx,0))
-        for winkel in range(0,360,15):
-            path.arcTo(rect, winkel, 15)
-        self.setPath(path)
-        super().change()
+        rx = pos.x()
+        ry = pos.y()
+        r = sqrt(rx*rx+ry*ry)
+        self.setForm(QRectF(QPointF(-r,-r), QSizeF(2*r,2*r)))
 
 
-class Quadrat(Pfad):
+class Rechteck(Form):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
 
     def change(self, posscene: QPointF):
         pos = self.mapFromScene(posscene)
-        dx, dy = pos.toTuple()
-        d = max(abs(dx), abs(dy))
-        dx = d if dx > 0 else -d
-        dy = d if dy > 0 else -d
+        self.setForm(QRectF(QPointF(0,0), pos))
+
+    def formPfad(self) -> QPainterPath:
+        x2, y2 = self._form.bottomRight().toTuple()
         path = QPainterPath()
-        path.lineTo( 0, dy)
-        path.lineTo(dx, dy)
-        path.lineTo(dx,  0)
+        path.lineTo( 0, y2)
+        path.lineTo(x2, y2)
+        path.lineTo(x2,  0)
         path.closeSubpath()
-        self.setPath(path)
-        super().change()
+        return path
 
+    def formShape(self) -> QPainterPath:
+        shape = QPainterPath()
+        shape.addRect(self.boundingRect())
+        return shape
 
-class Rechteck(Pfad):
+    def zeichneForm(self, painter: QPainter):
+        painter.drawRect(self._form.normalized())
+
+
+class Quadrat(Rechteck):
     def __init__(self, pos: QPointF, pen: QPen, brush: QBrush):
         super().__init__(pos, pen, brush)
 
     def change(self, posscene: QPointF):
         pos = self.mapFromScene(posscene)
-        x2, y2 = pos.toTuple()
-        path = QPainterPath()
-        path.lineTo( 0, y2)
-        path.lineTo(x2, y2)
-        path.lineTo(x2,  0)
-        path.closeSubpath()
-        self.setPath(path)
-        super().change()
+        dx, dy = pos.toTuple()
+        d = max(abs(dx), abs(dy))
+        dx = d if dx > 0 else -d
+        dy = d if dy > 0 else -d
+        self.setForm(QRectF(QPointF(0,0), QPointF(dx,dy)))
 
 
 class Punkt(Pfad):
@@ -433,9 +784,12 @@ class MmLogRect(QGraphicsRectItem):
         return line
 
 
-class Pixelbild(QGraphicsPixmapItem):
-    def __init__(self, pixmap: QPixmap):
-        super().__init__(pixmap)
+class Pixelbild(QGraphicsItem):
+    def __init__(self, pyramide: BildPyramide):
+        super().__init__()
+        self._pyramide = pyramide
+        self._verbunden = False
+        self._rect = QRectF(QPointF(0,0), QSizeF(pyramide.groesse()))
         self.setTransformOriginPoint(self.boundingRect().center())
         self.setFlag(QGraphicsItem.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.ItemIsSelectable, True)
@@ -445,8 +799,28 @@ class Pixelbild(QGraphicsPixmapItem):
     def oldPos(self):
         return self._oldpos
 
+    def pyramide(self) -> BildPyramide:
+        return self._pyramide
+
+    def boundingRect(self) -> QRectF:
+        return self._rect
+
+    def shape(self) -> QPainterPath:
+        path = QPainterPath()
+        path.addRect(self._rect)
+        return path
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        # Die Stufe der Pyramide richtet sich nach dem aktuellen Zoom.
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        pixmap = self._pyramide.pixmap(lod)
+        if pixmap:
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.drawPixmap(self._rect, pixmap, QRectF(pixmap.rect()))
+        zeichneAuswahl(painter, option, self._rect)
+
     def clone(self):
-        pixmap = Pixelbild(self.pixmap())
+        pixmap = Pixelbild(self._pyramide)
         pixmap.setPos(self.pos())
         pixmap.setScale(self.scale())
         return pixmap
@@ -455,6 +829,14 @@ class Pixelbild(QGraphicsPixmapItem):
         if change == QGraphicsItem.ItemPositionChange:
             if not self._oldpos:
                 self._oldpos = self.pos()
+        elif change == QGraphicsItem.ItemSceneHasChanged:
+            # Die Pyramide wird von Klonen geteilt und lebt länger als das Item. Nur Items
+            # in einer Szene hängen an ihr, entfernte werden nicht aufgehalten.
+            if value is not None and not self._verbunden:
+                self._pyramide.aktualisiert.connect(self.update)
+            elif value is None and self._verbunden:
+                self._pyramide.aktualisiert.disconnect(self.update)
+            self._verbunden = value is not None
         return super().itemChange(change, value)
 
     def registerPosition(self, undostack):
@@ -464,8 +846,15 @@ class Pixelbild(QGraphicsPixmapItem):
 
 
 class SVGBild(QGraphicsSvgItem):
-    def __init__(self, svgfilename: str):
-        super().__init__(svgfilename)
+    def __init__(self, svgfilename: str, renderer: QSvgRenderer = None, raster: SVGRaster = None):
+        if renderer:
+            super().__init__()
+            self.setSharedRenderer(renderer)
+        else:
+            super().__init__(svgfilename)
+        self._svgfilename = svgfilename
+        self._raster = raster if raster else SVGRaster(svgfilename, self.boundingRect())
+        self._raster.aktualisiert.connect(self.update)
         self.setTransformOriginPoint(self.boundingRect().center())
         self.setFlag(QGraphicsItem.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.ItemIsSelectable, True)
@@ -475,15 +864,30 @@ class SVGBild(QGraphicsSvgItem):
     def oldPos(self):
         return self._oldpos
 
+    def raster(self) -> SVGRaster:
+        return self._raster
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        # Komplexe SVGs werden aus dem Raster der passenden Zoomstufe gezeichnet,
+        # beim SVG-Export aber weiterhin als Vektoren.
+        pixmap = None
+        if painter.paintEngine().type() != QPaintEngine.SVG:
+            pixmap = self._raster.pixmap(option.levelOfDetailFromTransform(painter.worldTransform()))
+        if not pixmap:
+            super().paint(painter, option, widget)
+            return
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.drawPixmap(self.boundingRect(), pixmap, QRectF(pixmap.rect()))
+        if option.state & QStyle.State_Selected:
+            pen = QPen(option.palette.color(QPalette.WindowText), 0, Qt.DashLine)
+            painter.setPen(pen)
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(self.boundingRect())
+
     def clone(self):
-        newitem = QGraphicsSvgItem()
-        newitem.setSharedRenderer(self.renderer())
-        newitem.setTransformOriginPoint(newitem.boundingRect().center())
+        newitem = SVGBild(self._svgfilename, self.renderer(), self._raster)
         newitem.setScale(self.scale())
         newitem.setPos(self.pos())
-        newitem.setFlag(QGraphicsItem.ItemIsMovable, True)
-        newitem.setFlag(QGraphicsItem.ItemIsSelectable, True)
-        newitem.setFlag(QGraphicsItem.ItemSendsGeometryChanges, True)
         return newitem
 
     def itemChange(self, change: QGraphicsItem.GraphicsItemChange, value: Any) -> Any:
@@ -497,9 +901,12 @@ class SVGBild(QGraphicsSvgItem):
             undostack.push(MoveItem(self, QPointF(self._oldpos), QPointF(self.pos())))
             self._oldpos = None
 
-class TextItem(QGraphicsTextItem):
-    def __init__(self):
+class TextItem(QGraphicsItem):
+    def __init__(self, raster: TextRaster):
         super().__init__()
+        self._raster = raster
+        self._verbunden = False
+        self._rect = raster.rect()
         self.setFlag(QGraphicsItem.ItemIsMovable, True)
         self.setFlag(QGraphicsItem.ItemIsSelectable, True)
         self.setFlag(QGraphicsItem.ItemSendsGeometryChanges, True)
@@ -508,9 +915,40 @@ class TextItem(QGraphicsTextItem):
     def oldPos(self):
         return self._oldpos
 
+    def raster(self) -> TextRaster:
+        return self._raster
+
+    def rasterAktualisiert(self):
+        # Beim ersten Ergebnis aus dem Thread-Pool steht die Größe fest.
+        rect = self._raster.rect()
+        if rect != self._rect:
+            self.prepareGeometryChange()
+            self._rect = rect
+            # Beim Einfügen war das Rechteck noch leer, die Szene ist nicht mitgewachsen.
+            if self.scene() is not None:
+                for view in self.scene().views():
+                    view.berechneSceneRectNeu(self)
+        self.update()
+
+    def boundingRect(self) -> QRectF:
+        return self._rect
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        # Aus dem Raster der Zoomstufe, beim SVG-Export und bei zu großem Raster als Vektoren.
+        if self._rect.isEmpty():
+            return
+        pixmap = None
+        if painter.paintEngine().type() != QPaintEngine.SVG:
+            pixmap = self._raster.pixmap(option.levelOfDetailFromTransform(painter.worldTransform()))
+        if pixmap:
+            painter.setRenderHint(QPainter.SmoothPixmapTransform)
+            painter.drawPixmap(self._rect, pixmap, QRectF(pixmap.rect()))
+        else:
+            self._raster.dokument().drawContents(painter, self._rect)
+        zeichneAuswahl(painter, option, self._rect)
+
     def clone(self):
-        newitem = TextItem()
-        newitem.setHtml(self.toHtml())
+        newitem = TextItem(self._raster)
         newitem.setScale(self.scale())
         newitem.setPos(self.pos())
         return newitem
@@ -519,6 +957,14 @@ class TextItem(QGraphicsTextItem):
         if change == QGraphicsItem.ItemPositionChange:
             if not self._oldpos:
                 self._oldpos = self.pos()
+        elif change == QGraphicsItem.ItemSceneHasChanged:
+            # Das Raster teilen sich alle Klone, wie bei Pixelbild.
+            if value is not None and not self._verbunden:
+                self._raster.aktualisiert.connect(self.rasterAktualisiert)
+                self.rasterAktualisiert()
+            elif value is None and self._verbunden:
+                self._raster.aktualisiert.disconnect(self.rasterAktualisiert)
+            self._verbunden = value is not None
         return super().itemChange(change, value)
 
     def registerPosition(self, undostack):
@@ -0,0 +1,337 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Fertige Striche werden im Hintergrund in Kacheln fester Pixelgröße gerastert.
+#
+# Der GUI-Thread nimmt einen Schnappschuss der Striche im sichtbaren Bereich (Transformation,
+# Stift, Pinsel und Pfad bzw. kodierte Daten) und setzt in drawBackground nur die fertigen
+# Kacheln zusammen. Wird ein Strich geändert, zeichnet ihn wieder die Szene, seine Kacheln
+# werden neu gerastert. Bis dahin zeichnet der GUI-Thread die betroffenen Striche selbst.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from collections import OrderedDict
+from math import ceil, floor
+from PySide6.QtCore import QObject, QRectF, QRunnable, QThreadPool, QTimer, Qt, Signal, Slot
+from PySide6.QtGui import QImage, QPainter, QPixmap, QTransform
+from PySide6.QtWidgets import QStyleOptionGraphicsItem
+
+from cachepolitik import cachepolitik
+from pfadkodierung import SPEICHERQUANT, entpackePfad, pfadAusElementen
+
+# Kantenlänge einer Kachel in Viewport-Pixeln
+KACHEL = 256
+# So viele Kacheln über den sichtbaren Bereich hinaus, damit beim Verschieben schon welche bereitliegen
+RAND = 1
+# Kosmetische Stifte ragen über das boundingRect hinaus.
+UEBERSTAND = 8
+BUDGET = 96*1024*1024
+BERUHIGUNGSZEIT = 50
+
+
+def kachelRect(ix: int, iy: int, zoom: float) -> QRectF:
+    groesse = KACHEL/zoom
+    return QRectF(ix*groesse, iy*groesse, groesse, groesse)
+
+def kachelnIn(rect: QRectF, zoom: float) -> list:
+    groesse = KACHEL/zoom
+    x0, y0 = floor(rect.left()/groesse), floor(rect.top()/groesse)
+    x1 = max(x0, ceil(rect.right()/groesse)-1)
+    y1 = max(y0, ceil(rect.bottom()/groesse)-1)
+    return [(x, y) for y in range(y0, y1+1) for x in range(x0, x1+1)]
+
+
+class KachelSignale(QObject):
+    fertig = Signal(float, int, int, int, int, QImage)
+    beendet = Signal()
+
+
+class KachelnRendern(QRunnable):
+    'Rastert Kacheln aus einem Schnappschuss, der nur gelesen wird.'
+    def __init__(self, schnappschuss: list, kacheln: list, zoom: float, dpr: float, stand: int, farbstand: int, signale: KachelSignale):
+        super().__init__()
+        self._schnappschuss = schnappschuss
+        self._kacheln = kacheln
+        self._zoom = zoom
+        self._dpr = dpr
+        self._stand = stand
+        self._farbstand = farbstand
+        self._signale = signale
+        self.abgebrochen = False
+        # Der Kachelrenderer hält den Auftrag, um ihn abbrechen zu können.
+        self.setAutoDelete(False)
+
+    def run(self):
+        # Kodierte Pfade werden einmal pro Auftrag ausgepackt.
+        pfade = {}
+        groesse = round(KACHEL*self._dpr)
+        ueberstand = UEBERSTAND/self._zoom
+        for ix, iy in self._kacheln:
+            if self.abgebrochen:
+                break
+            rect = kachelRect(ix, iy, self._zoom)
+            bereich = rect.adjusted(-ueberstand, -ueberstand, ueberstand, ueberstand)
+            image = QImage(groesse, groesse, QImage.Format_ARGB32_Premultiplied)
+            image.setDevicePixelRatio(self._dpr)
+            image.fill(0)
+            painter = QPainter(image)
+            painter.setRenderHint(QPainter.Antialiasing)
+            basis = QTransform.fromScale(self._zoom, self._zoom).translate(-rect.x(), -rect.y())
+            for nummer, (transform, itemrect, pen, brush, geometrie) in enumerate(self._schnappschuss):
+                if not bereich.intersects(itemrect):
+                    continue
+                if isinstance(geometrie, bytes):
+                    if nummer not in pfade:
+                        pfade[nummer] = pfadAusElementen(entpackePfad(geometrie, quant=SPEICHERQUANT)[0])
+                    geometrie = pfade[nummer]
+                painter.setTransform(transform*basis)
+                painter.setPen(pen)
+                painter.setBrush(brush)
+                painter.drawPath(geometrie)
+            painter.end()
+            self._signale.fertig.emit(self._zoom, ix, iy, self._stand, self._farbstand, image)
+        self._signale.beendet.emit()
+
+
+class Kachelrenderer(QObject):
+    '''Entscheidet, welche Striche über Kacheln gezeichnet werden, und hält die Kacheln
+    der aktuellen Zoomstufe. Gekachelt wird nur, was unter keinem direkt gezeichneten Item liegt,
+    damit die Stapelreihenfolge erhalten bleibt.'''
+
+    def __init__(self):
+        super().__init__()
+        self._view = None
+        self._zoom = None
+        # (ix, iy) -> (QPixmap, farbstand), zuletzt gezeichnete am Ende
+        self._kacheln = OrderedDict()
+        self._bytes = 0
+        # (zoom, kacheln) der vorigen Zoomstufe, bis die neuen fertig sind
+        self._vorige = None
+        # Item -> Szenenrechteck, mit dem es in den Kacheln steckt
+        self._gekachelt = {}
+        # Kacheln aus Schnappschüssen vor _ungueltigAb[kachel] sind veraltet.
+        self._stand = 0
+        self._ungueltigAb = {}
+        self._farbstand = 0
+        self._job = None
+        self._signale = KachelSignale()
+        self._signale.fertig.connect(self.gerastert)
+        self._signale.beendet.connect(self.jobBeendet)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(BERUHIGUNGSZEIT)
+        self._timer.timeout.connect(self.anfordern)
+
+    def setView(self, view):
+        self._view = view
+        for scrollbar in (view.horizontalScrollBar(), view.verticalScrollBar()):
+            scrollbar.valueChanged.connect(self.sichtGeaendert)
+            scrollbar.rangeChanged.connect(self.sichtGeaendert)
+
+    def sichtGeaendert(self):
+        self._timer.start()
+
+    def gekachelt(self, item) -> bool:
+        return item in self._gekachelt
+
+    def geaendert(self, item):
+        'Vor jeder Änderung eines Items: Es wird wieder direkt gezeichnet, seine Kacheln neu gerastert.'
+        rect = self._gekachelt.pop(item, None)
+        if rect is not None:
+            self.ungueltig(rect)
+        elif item.scene() is not None:
+            self._timer.start()
+
+    def ungueltig(self, rect: QRectF):
+        if self._zoom is None:
+            return
+        self._stand += 1
+        for kachel in kachelnIn(rect, self._zoom):
+            self.entfernen(kachel)
+            self._ungueltigAb[kachel] = self._stand
+        if self._vorige is not None:
+            zoom, kacheln = self._vorige
+            for kachel in kachelnIn(rect, zoom):
+                kacheln.pop(kachel, None)
+        self._timer.start()
+
+    def neuePalette(self):
+        'Die alten Kacheln bleiben sichtbar, bis sie in den neuen Farben fertig sind.'
+        self._farbstand += 1
+        self._timer.start()
+
+    def leeren(self):
+        'Bei Speichermangel: Kacheln verwerfen. Bis zum nächsten Verschieben zeichnet der GUI-Thread selbst.'
+        self.abbrechen()
+        self._kacheln.clear()
+        self._bytes = 0
+        self._vorige = None
+
+    def abbrechen(self):
+        if self._job is not None:
+            self._job.abgebrochen = True
+
+    def entfernen(self, kachel):
+        eintrag = self._kacheln.pop(kachel, None)
+        if eintrag is not None:
+            self._bytes -= kachelBytes(eintrag[0])
+
+    def pruefeZoom(self):
+        zoom = self._view.transform().m11()
+        if zoom == self._zoom:
+            return
+        self.abbrechen()
+        if self._kacheln and self._zoom is not None:
+            self._vorige = (self._zoom, self._kacheln)
+        self._zoom = zoom
+        self._kacheln = OrderedDict()
+        self._bytes = 0
+        self._ungueltigAb = {}
+        self._timer.start()
+
+    def verteilen(self, bereich: QRectF) -> list:
+        'Entscheidet für die Items im Bereich, welche gekachelt werden. Liefert diese von unten nach oben.'
+        direkt = []
+        gekachelt = []
+        for item in self._view.scene().items(bereich, Qt.IntersectsItemBoundingRect, Qt.AscendingOrder):
+            rect = item.sceneBoundingRect()
+            if (item.parentItem() is not None or not hasattr(item, 'isKachelbar') or not item.isKachelbar()
+                    or not item.isVisible() or item.isSelected() or item.childItems()
+                    or any(rect.intersects(r) for r in direkt)):
+                direkt.append(rect)
+                if item in self._gekachelt:
+                    self.geaendert(item)
+                    cachepolitik.pruefe(item)
+                    item.update()
+                continue
+            if item not in self._gekachelt:
+                cachepolitik.verwerfen(item)
+                self._gekachelt[item] = rect
+                self.ungueltig(rect)
+            gekachelt.append(item)
+        return gekachelt
+
+    @Slot()
+    def anfordern(self):
+        if self._view is None or self._job is not None:
+            return
+        if self._view.bearbeitetGerade():
+            self._timer.start()
+            return
+        self.pruefeZoom()
+        sicht = self._view.mapToScene(self._view.viewport().rect()).boundingRect()
+        rand = RAND*KACHEL/self._zoom
+        bereich = sicht.adjusted(-rand, -rand, rand, rand)
+        items = self.verteilen(bereich)
+
+        dpr = self._view.devicePixelRatioF()
+        mitte = sicht.center()
+        kacheln = sorted(kachelnIn(bereich, self._zoom), key=lambda k: (kachelRect(*k, self._zoom).center()-mitte).manhattanLength())
+        # Nie mehr Kacheln, als ins Budget passen, sonst verdrängen sie sich gegenseitig.
+        kacheln = kacheln[:max(1, int(BUDGET//(4*(KACHEL*dpr)**2)))]
+        fehlend = [k for k in kacheln if self._kacheln.get(k, (None, -1))[1] != self._farbstand]
+        if not fehlend:
+            self._vorige = None
+            return
+        if not items:
+            return
+        gesamt = QRectF()
+        for kachel in fehlend:
+            gesamt |= kachelRect(*kachel, self._zoom)
+        schnappschuss = [(item.sceneTransform(), self._gekachelt[item], *item.kachelEintrag())
+                         for item in items if gesamt.intersects(self._gekachelt[item])]
+        self._job = KachelnRendern(schnappschuss, fehlend, self._zoom, dpr, self._stand, self._farbstand, self._signale)
+        QThreadPool.globalInstance().start(self._job)
+
+    @Slot(float, int, int, int, int, QImage)
+    def gerastert(self, zoom: float, ix: int, iy: int, stand: int, farbstand: int, image: QImage):
+        kachel = (ix, iy)
+        if zoom != self._zoom or self._ungueltigAb.get(kachel, 0) > stand:
+            return
+        alt = self._kacheln.get(kachel)
+        if alt is not None and alt[1] > farbstand:
+            return
+        self.entfernen(kachel)
+        pixmap = QPixmap.fromImage(image)
+        self._kacheln[kachel] = (pixmap, farbstand)
+        self._bytes += kachelBytes(pixmap)
+        while self._bytes > BUDGET and len(self._kacheln) > 1:
+            self.entfernen(next(iter(self._kacheln)))
+        self._view.viewport().update(self._view.mapFromScene(kachelRect(ix, iy, zoom)).boundingRect())
+
+    @Slot()
+    def jobBeendet(self):
+        self._job = None
+        # Inzwischen geänderte oder neu sichtbare Kacheln
+        self._timer.start()
+
+    def zeichne(self, painter: QPainter, rect: QRectF):
+        'Aus drawBackground: setzt die Kacheln im Bereich zusammen.'
+        if self._view is None or not self._gekachelt:
+            return
+        self.pruefeZoom()
+        for kachel in kachelnIn(rect, self._zoom):
+            krect = kachelRect(*kachel, self._zoom)
+            eintrag = self._kacheln.get(kachel)
+            if eintrag is not None:
+                self._kacheln.move_to_end(kachel)
+                painter.drawPixmap(krect, eintrag[0], QRectF(eintrag[0].rect()))
+            elif not self.zeichneVorige(painter, krect) and self.zeichneDirekt(painter, krect & rect):
+                if self._job is None and not self._timer.isActive():
+                    self._timer.start()
+
+    def zeichneVorige(self, painter: QPainter, krect: QRectF) -> bool:
+        'Skaliert die Kacheln der vorigen Zoomstufe, wenn sie die Kachel ganz abdecken.'
+        if self._vorige is None:
+            return False
+        zoom, kacheln = self._vorige
+        alte = kachelnIn(krect, zoom)
+        if not all(kachel in kacheln for kachel in alte):
+            return False
+        painter.save()
+        painter.setClipRect(krect)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        for kachel in alte:
+            pixmap = kacheln[kachel][0]
+            painter.drawPixmap(kachelRect(*kachel, zoom), pixmap, QRectF(pixmap.rect()))
+        painter.restore()
+        return True
+
+    def zeichneDirekt(self, painter: QPainter, rect: QRectF) -> bool:
+        '''Solange eine Kachel fehlt, werden ihre Striche wie bisher im GUI-Thread gezeichnet.
+        Liefert, ob es dort gekachelte Striche gibt.'''
+        items = [item for item in self._view.scene().items(rect, Qt.IntersectsItemBoundingRect, Qt.AscendingOrder) if item in self._gekachelt]
+        if not items:
+            return False
+        painter.save()
+        painter.setClipRect(rect)
+        option = QStyleOptionGraphicsItem()
+        for item in items:
+            painter.save()
+            painter.setTransform(item.sceneTransform(), True)
+            item.paint(painter, option, None)
+            painter.restore()
+        painter.restore()
+        return True
+
+
+def kachelBytes(pixmap: QPixmap) -> int:
+    return pixmap.width()*pixmap.height()*4
+
+
+kachelrenderer = Kachelrenderer()
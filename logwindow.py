@@ -1,13 +1,89 @@
 
+import copy
 import logging
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from time import monotonic
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QWidget, QTextEdit, QDialog, QGridLayout
+
+# Höchstens so viele Meldungen unterhalb von WARNING pro Sekunde
+MAXPROSEKUNDE = 200
+MAXZEILEN = 5000
+INTERVALL = 250
+
+class Drossel(logging.Filter):
+    'Verwirft Debug- und Info-Meldungen, wenn zu viele in einer Sekunde kommen.'
+    def __init__(self, maxProSekunde: int = MAXPROSEKUNDE) -> None:
+        super().__init__()
+        self._max = maxProSekunde
+        self._fensterstart = monotonic()
+        self._anzahl = 0
+        self._verworfen = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        jetzt = monotonic()
+        if jetzt - self._fensterstart >= 1:
+            record.verworfen = self._verworfen
+            self._fensterstart = jetzt
+            self._anzahl = 0
+            self._verworfen = 0
+        self._anzahl += 1
+        if self._anzahl > self._max:
+            self._verworfen += 1
+            return False
+        return True
+
+# Argumente dieser Typen ändern sich nicht mehr und dürfen im Thread des Listeners eingesetzt werden.
+UNVERAENDERLICH = (str, int, float, bool, bytes, type(None))
+
+class SchnellerQueueHandler(QueueHandler):
+    '''Legt Meldungen nur in die Queue. Der Standard-QueueHandler formatiert schon im
+    aufrufenden Thread, hier wird der Record nur kopiert und die Meldung erst im Listener
+    eingesetzt. Andere Argumente, etwa Qt-Events, leben nur während des Aufrufs und
+    werden sofort eingesetzt.'''
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.args and not (isinstance(record.args, tuple) and all(isinstance(arg, UNVERAENDERLICH) for arg in record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
 class LogWindowHandler(logging.Handler):
+    'Formatiert im Thread des QueueListeners und sammelt die Zeilen in einem Ringpuffer.'
     def __init__(self, logwindow) -> None:
         logging.Handler.__init__(self)
-        self._logwindow = logwindow
+        self._puffer = deque(maxlen=MAXZEILEN)
+        logwindow.setQuelle(self)
 
     def emit(self, record):
-        self._logwindow.append(self.format(record))
+        verworfen = getattr(record, 'verworfen', 0)
+        if verworfen:
+            self._puffer.append(f'... {verworfen} Meldungen verworfen')
+        self._puffer.append(self.format(record))
+
+    def abholen(self):
+        zeilen = []
+        try:
+            while True:
+                zeilen.append(self._puffer.popleft())
+        except IndexError:
+            pass
+        return zeilen
+
+def starteLogging(logger: logging.Logger, logwindow) -> QueueListener:
+    '''Der Logger schreibt nur in eine Queue. Formatiert wird in einem eigenen Thread,
+    das LogWindow übernimmt die Zeilen gesammelt per Timer.'''
+    queue = SimpleQueue()
+    queuehandler = SchnellerQueueHandler(queue)
+    queuehandler.addFilter(Drossel())
+    listener = QueueListener(queue, LogWindowHandler(logwindow))
+    listener.start()
+    logger.addHandler(queuehandler)
+    return listener
 
 class LogWindow(QDialog):
     def __init__(self, parent: QWidget | None = ...) -> None:
@@ -15,9 +91,22 @@ class LogWindow(QDialog):
         self._text_edit = QTextEdit(self)
         self._text_edit.setLineWrapMode(QTextEdit.NoWrap)
         self._text_edit.setReadOnly(True)
+        self._text_edit.document().setMaximumBlockCount(MAXZEILEN)
         layout = QGridLayout()
         layout.addWidget(self._text_edit)
         self.setLayout(layout)
+        self._quelle = None
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.abholen)
+
+    def setQuelle(self, handler: LogWindowHandler):
+        self._quelle = handler
+        self._timer.start(INTERVALL)
+
+    def abholen(self):
+        zeilen = self._quelle.abholen()
+        if zeilen:
+            self._text_edit.append('\n'.join(zeilen))
 
     def append(self, text):
         self._text_edit.append(text)
@@ -0,0 +1,139 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Kompakte Kodierung von QPainterPath für Übertragung und Speicher.
+#
+# Koordinaten werden auf 1/quant Pixel gerundet, als Differenz zum vorherigen
+# Element gespeichert und zickzack- und varint-kodiert. Die zwei niedrigsten
+# Bits des x-Wertes enthalten den Elementtyp von QPainterPath. Ein Freihandstrich
+# braucht so meist zwei bis drei Byte pro Punkt statt 24 im QPainterPath.
+
+from collections import OrderedDict
+from PySide6.QtCore import QPointF
+from PySide6.QtGui import QPainterPath
+
+QUANT = 4
+# Im Speicher etwas feiner, damit auch stark vergrößerte Striche glatt bleiben.
+SPEICHERQUANT = 16
+CACHEGROESSE = 2048
+
+
+def zickzack(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+def entzickzack(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+def schreibeVarint(out: bytearray, n: int):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def leseVarint(daten, offset: int):
+    n = 0
+    shift = 0
+    while True:
+        b = daten[offset]
+        offset += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, offset
+        shift += 7
+
+def packePfad(path: QPainterPath, start: int = 0, quant: int = QUANT) -> bytes:
+    out = bytearray()
+    anzahl = path.elementCount()
+    schreibeVarint(out, max(0, anzahl-start))
+    lx = ly = 0
+    for i in range(start, anzahl):
+        element = path.elementAt(i)
+        x = round(element.x*quant)
+        y = round(element.y*quant)
+        schreibeVarint(out, zickzack(x-lx) << 2 | element.type.value)
+        schreibeVarint(out, zickzack(y-ly))
+        lx, ly = x, y
+    return bytes(out)
+
+def entpackePfad(daten, offset: int = 0, quant: int = QUANT):
+    'Liefert die Elemente als Liste (typ, x, y) und den Offset hinter dem Pfad.'
+    anzahl, offset = leseVarint(daten, offset)
+    elemente = []
+    x = y = 0
+    for _ in range(anzahl):
+        wert, offset = leseVarint(daten, offset)
+        dy, offset = leseVarint(daten, offset)
+        x += entzickzack(wert >> 2)
+        y += entzickzack(dy)
+        elemente.append((wert & 3, x/quant, y/quant))
+    return elemente, offset
+
+def pfadAusElementen(elemente) -> QPainterPath:
+    path = QPainterPath()
+    i = 0
+    while i < len(elemente):
+        typ, x, y = elemente[i]
+        if typ == QPainterPath.MoveToElement.value:
+            path.moveTo(x, y)
+        elif typ == QPainterPath.LineToElement.value:
+            path.lineTo(x, y)
+        elif typ == QPainterPath.CurveToElement.value and i+2 < len(elemente):
+            path.cubicTo(QPointF(x, y), QPointF(*elemente[i+1][1:]), QPointF(*elemente[i+2][1:]))
+            i += 2
+        i += 1
+    return path
+
+
+class PfadCache:
+    'LRU-Cache der zuletzt gezeichneten oder radierten Pfade komprimierter Items.'
+    def __init__(self, groesse: int = CACHEGROESSE):
+        self._groesse = groesse
+        self._pfade = OrderedDict()
+        self.treffer = 0
+        self.fehlschlaege = 0
+
+    def hole(self, item, daten: bytes) -> QPainterPath:
+        path = self._pfade.get(item)
+        if path is not None:
+            self._pfade.move_to_end(item)
+            self.treffer += 1
+            return path
+        self.fehlschlaege += 1
+        path = pfadAusElementen(entpackePfad(daten, quant=SPEICHERQUANT)[0])
+        self._pfade[item] = path
+        if len(self._pfade) > self._groesse:
+            self._pfade.popitem(last=False)
+        return path
+
+    def nachsehen(self, item) -> QPainterPath:
+        'Wie hole, aber ohne Auspacken und ohne Statistik. Liefert None, wenn der Pfad fehlt.'
+        return self._pfade.get(item)
+
+    def merke(self, item, path: QPainterPath):
+        self._pfade[item] = path
+        self._pfade.move_to_end(item)
+        if len(self._pfade) > self._groesse:
+            self._pfade.popitem(last=False)
+
+    def vergiss(self, item):
+        self._pfade.pop(item, None)
+
+    def leeren(self):
+        self._pfade.clear()
+
+
+pfadcache = PfadCache()
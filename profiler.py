@@ -0,0 +1,68 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+import cProfile
+import io
+import os
+import pstats
+from PySide6.QtCore import QDateTime, QDir, QStandardPaths
+
+ANZAHLFUNKTIONEN = 25
+
+
+class Profiler:
+    'cProfile-Sitzung für den GUI-Thread. Der Bericht landet im LogWindow, die Daten in einer pstats-Datei.'
+    def __init__(self, dateiname: str = None):
+        self._dateiname = dateiname
+        self._profile = None
+
+    def isAktiv(self) -> bool:
+        return self._profile is not None
+
+    def start(self):
+        if self._profile:
+            return
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        logger.info('Profiler gestartet')
+
+    def stop(self) -> str:
+        'Beendet die Sitzung, schreibt die pstats-Datei und liefert die heißesten Funktionen als Text.'
+        if not self._profile:
+            return ''
+        self._profile.disable()
+        dateiname = self._dateiname or self.standardDateiname()
+        try:
+            self._profile.dump_stats(dateiname)
+            logger.info(f'Profiler beendet, Daten in {dateiname}')
+        except OSError as e:
+            # Der Bericht soll trotzdem ins LogWindow.
+            logger.error(f'Profiler beendet, {dateiname} konnte nicht geschrieben werden: {e}')
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.strip_dirs().sort_stats(pstats.SortKey.TIME).print_stats(ANZAHLFUNKTIONEN)
+        self._profile = None
+        return stream.getvalue()
+
+    def standardDateiname(self) -> str:
+        verzeichnis = QStandardPaths.writableLocation(QStandardPaths.TempLocation) or QDir.tempPath()
+        zeit = QDateTime.currentDateTime().toString('yyyyMMdd-hhmmss')
+        return os.path.join(verzeichnis, f'endlostafel-{zeit}.pstats')
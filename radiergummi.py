@@ -17,11 +17,29 @@
 
 import logging
 from PySide6.QtCore import QPointF, QRectF, Qt, QSizeF
-from PySide6.QtGui import QColor, QPen
+from PySide6.QtGui import QColor, QPainterPath, QPen, QPolygonF
 from PySide6.QtWidgets import QGraphicsRectItem, QGraphicsView
 
 logger = logging.getLogger('GUI')
 
+def huelle(punkte: list) -> list:
+    'Konvexe Hülle nach Andrew, gegen den Uhrzeigersinn.'
+    punkte = sorted({(p.x(), p.y()) for p in punkte})
+    if len(punkte) < 3:
+        return [QPointF(*p) for p in punkte]
+    def kreuz(o, a, b):
+        return (a[0]-o[0])*(b[1]-o[1]) - (a[1]-o[1])*(b[0]-o[0])
+    unten, oben = [], []
+    for p in punkte:
+        while len(unten) >= 2 and kreuz(unten[-2], unten[-1], p) <= 0:
+            unten.pop()
+        unten.append(p)
+    for p in reversed(punkte):
+        while len(oben) >= 2 and kreuz(oben[-2], oben[-1], p) <= 0:
+            oben.pop()
+        oben.append(p)
+    return [QPointF(*p) for p in unten[:-1] + oben[:-1]]
+
 class Radiergummi(QGraphicsRectItem):
     def __init__(self, size: QSizeF, pos: QPointF = QPointF(0,0)):
         super().__init__()
@@ -43,3 +61,16 @@ class Radiergummi(QGraphicsRectItem):
 
     def size(self) -> QSizeF:
         return self.rect().size()
+
+    def ueberstrichen(self, von: QPointF) -> QPainterPath:
+        'Die Fläche in Szenenkoordinaten, die der Radiergummi von von bis zur aktuellen Position überstreicht.'
+        jetzt = self.rect().translated(self.pos())
+        path = QPainterPath()
+        if von == self.pos():
+            path.addRect(jetzt)
+            return path
+        vorher = self.rect().translated(von)
+        ecken = [ecke for rect in (vorher, jetzt) for ecke in (rect.topLeft(), rect.topRight(), rect.bottomRight(), rect.bottomLeft())]
+        path.addPolygon(QPolygonF(huelle(ecken)))
+        path.closeSubpath()
+        return path
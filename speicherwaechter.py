@@ -0,0 +1,140 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+from cachepolitik import cachepolitik
+from kacheln import kachelrenderer
+from items import Pixelbild, SVGBild, TextItem
+from pfadkodierung import pfadcache
+from undo import Auslagerung
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024*1024
+INTERVALL = 10000
+# Schwellen für den belegten Speicher (RSS) in MB, einstellbar unter speicher/warnung und speicher/kritisch
+WARNUNG = 1024
+KRITISCH = 1536
+# Erst wenn der Speicher um so viel weiter wächst, wird erneut entlastet.
+ZUWACHS = 1.1
+# So viele Undo-Schritte vor dem aktuellen bleiben im Speicher.
+BEHALTEN = 50
+
+
+class Speicherwaechter(QObject):
+    '''Prüft regelmäßig den belegten Speicher. Über der Warnschwelle werden Caches geleert und
+    nicht sichtbare Bilder auf ihre gröbste Stufe gebracht, über der kritischen Schwelle zusätzlich
+    alte Undo-Schritte ausgelagert und alle nicht sichtbaren Striche geparkt. Ohne psutil inaktiv.'''
+
+    meldung = Signal(str, int)
+
+    def __init__(self, tafelview, undostack, warnung: int = WARNUNG, kritisch: int = KRITISCH):
+        super().__init__(tafelview)
+        self._tafelview = tafelview
+        self._undostack = undostack
+        self._warnung = warnung*MB
+        self._kritisch = kritisch*MB
+        self._stufe = 0
+        self._rssNachEntlastung = 0
+        self._auslagerung = None
+        self._prozess = psutil.Process() if psutil else None
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.pruefe)
+        if self._prozess is None:
+            logger.info('psutil nicht installiert, keine Speicherüberwachung')
+            return
+        self._timer.start(INTERVALL)
+
+    def rss(self) -> int:
+        if self._prozess is None:
+            return 0
+        return self._prozess.memory_info().rss
+
+    def pruefe(self):
+        rss = self.rss()
+        stufe = 2 if rss > self._kritisch else 1 if rss > self._warnung else 0
+        if stufe > self._stufe or (stufe and rss > self._rssNachEntlastung*ZUWACHS):
+            schritte = self.entlasten(stufe)
+            self._rssNachEntlastung = self.rss()
+            text = f'Speicher knapp ({rss//MB} MB): ' + ', '.join(schritte)
+            logger.info(f'{text}, danach {self._rssNachEntlastung//MB} MB')
+            self.meldung.emit(text, 10000)
+        self._stufe = stufe
+
+    def entlasten(self, stufe: int) -> list:
+        schritte = []
+        anzahl = self.bilderHerabstufen()
+        if anzahl:
+            schritte.append(f'{anzahl} Bilder verkleinert')
+        cachepolitik.leeren()
+        kachelrenderer.leeren()
+        pfadcache.leeren()
+        schritte.append('Zwischenspeicher geleert')
+        if stufe >= 2:
+            anzahl = self.undoAuslagern()
+            if anzahl:
+                schritte.append(f'{anzahl} Undo-Schritte ausgelagert')
+            anzahl = self._tafelview.strichmodell().aktualisiere(rand=0)
+            if anzahl:
+                schritte.append(f'{anzahl} Striche geparkt')
+        return schritte
+
+    def bilderHerabstufen(self) -> int:
+        'Raster nicht sichtbarer Bilder, SVGs und Texte. Klone teilen sie mit sichtbaren Items.'
+        view = self._tafelview
+        sicht = view.mapToScene(view.viewport().rect()).boundingRect()
+        sichtbar = {id(self.raster(item)) for item in view.scene().items(sicht)}
+        anzahl = 0
+        erledigt = set()
+        for item in view.scene().items():
+            raster = self.raster(item)
+            if raster is None or id(raster) in sichtbar or id(raster) in erledigt:
+                continue
+            erledigt.add(id(raster))
+            if isinstance(item, Pixelbild):
+                anzahl += raster.herabstufen() > 0
+            else:
+                raster.leeren()
+        return anzahl
+
+    def raster(self, item):
+        if isinstance(item, Pixelbild):
+            return item.pyramide()
+        if isinstance(item, (SVGBild, TextItem)):
+            return item.raster()
+        return None
+
+    def undoAuslagern(self) -> int:
+        ende = self._undostack.index() - BEHALTEN
+        if ende <= 0:
+            return 0
+        if self._auslagerung is None:
+            self._auslagerung = Auslagerung()
+        return sum(self.auslagern(self._undostack.command(i)) for i in range(ende))
+
+    def auslagern(self, command) -> int:
+        'Liefert 1, wenn das Kommando oder eines seiner Kinder etwas ausgelagert hat.'
+        if hasattr(command, 'auslagern'):
+            return 1 if command.auslagern(self._auslagerung) else 0
+        return 1 if sum(self.auslagern(command.child(i)) for i in range(command.childCount())) else 0
@@ -0,0 +1,201 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from math import floor, inf
+from weakref import WeakKeyDictionary
+from PySide6.QtCore import QObject, QRectF, QTimer, Qt
+
+from cachepolitik import cachepolitik
+from items import Pfad, Punkt, Stift
+from undo import HINZU, WEG, aenderungenVon
+
+# Kantenlänge der Zellen des Rasters, in dem geparkte Striche einsortiert sind
+ZELLE = 2048
+VERZOEGERUNG = 150
+# Nur Striche werden geparkt, Papiere und Formen bleiben in der Szene.
+PARKBAR = (Pfad, Stift, Punkt)
+
+
+class Strich:
+    'Ein geparkter Strich. Seine Geometrie bleibt komprimiert im Item (siehe Pfad.komprimieren).'
+    __slots__ = ('item', 'rect')
+
+    def __init__(self, item: Pfad, rect: QRectF):
+        self.item = item
+        self.rect = rect
+
+
+def zellen(rect: QRectF) -> list:
+    x0, x1 = floor(rect.left()/ZELLE), floor(rect.right()/ZELLE)
+    y0, y1 = floor(rect.top()/ZELLE), floor(rect.bottom()/ZELLE)
+    return [(x, y) for x in range(x0, x1+1) for y in range(y0, y1+1)]
+
+
+class Strichmodell(QObject):
+    '''Hält nur Striche in der Nähe des sichtbaren Bereichs in der Szene. Weiter entfernte
+    werden geparkt: aus der Szene genommen und nur noch in einem Raster geführt.
+    Das Item selbst bleibt erhalten, weil Undo, Übertragung und Synchronisation es referenzieren.'''
+
+    def __init__(self, tafelview, undostack):
+        super().__init__(tafelview)
+        self._tafelview = tafelview
+        self._scene = tafelview.scene()
+        self._undostack = undostack
+        self._index = undostack.index()
+        self._geparkt = {}
+        self._zellen = {}
+        # Reihenfolge des Hinzufügens, damit ausgeparkte Striche wieder richtig gestapelt werden.
+        # Schwache Referenzen, damit gelöschte Striche freigegeben werden können.
+        self._nummern = WeakKeyDictionary()
+        self._naechsteNummer = 0
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(VERZOEGERUNG)
+        self._timer.timeout.connect(self.aktualisiere)
+        undostack.indexChanged.connect(self.stackGeaendert)
+        for scrollbar in (tafelview.horizontalScrollBar(), tafelview.verticalScrollBar()):
+            scrollbar.valueChanged.connect(self.sichtGeaendert)
+            scrollbar.rangeChanged.connect(self.sichtGeaendert)
+
+    def anzahlGeparkt(self) -> int:
+        return len(self._geparkt)
+
+    def istGeparkt(self, item) -> bool:
+        return item in self._geparkt
+
+    def nummer(self, item) -> int:
+        if item not in self._nummern:
+            self._nummern[item] = self._naechsteNummer
+            self._naechsteNummer += 1
+        return self._nummern[item]
+
+    def sichtGeaendert(self):
+        self._timer.start()
+
+    def aktualisiere(self, rand: int = 1) -> int:
+        '''Parkt und parkt aus. rand ist der Abstand in Viewportgrößen, bis zu dem Striche
+        in der Szene bleiben; 0 parkt alles außerhalb des sichtbaren Bereichs.'''
+        if self._tafelview.bearbeitetGerade():
+            self._timer.start()
+            return 0
+        sicht = self._tafelview.mapToScene(self._tafelview.viewport().rect()).boundingRect()
+        w, h = rand*sicht.width(), rand*sicht.height()
+        nah = sicht.adjusted(-w, -h, w, h)
+        # Geparkt wird erst weiter draußen, damit Striche am Rand nicht hin und her wandern.
+        fern = sicht.adjusted(-2*w, -2*h, 2*w, 2*h)
+        geparkt = 0
+        for item in self._scene.items():
+            if type(item) not in PARKBAR or item.parentItem() is not None or item.isSelected():
+                continue
+            if not fern.intersects(item.sceneBoundingRect()):
+                geparkt += self.parken(item)
+            else:
+                # z.B. nach Undo beim Radieren oder von der Synchronisation gesetzte Pfade
+                item.komprimieren()
+        ausgeparkt = self.geparkteIn(nah)
+        for strich in ausgeparkt:
+            self.ausparken(strich.item)
+        if geparkt or ausgeparkt:
+            logger.debug(f'Strichmodell: {geparkt} geparkt, {len(ausgeparkt)} ausgeparkt, {len(self._geparkt)} insgesamt geparkt')
+        return geparkt
+
+    def geparkteIn(self, rect: QRectF) -> set:
+        bereich = zellen(rect)
+        if len(bereich) > len(self._zellen):
+            bereich = [zelle for zelle in self._zellen if rect.intersects(QRectF(zelle[0]*ZELLE, zelle[1]*ZELLE, ZELLE, ZELLE))]
+        gefunden = set()
+        for zelle in bereich:
+            for strich in self._zellen.get(zelle, ()):
+                if rect.intersects(strich.rect):
+                    gefunden.add(strich)
+        return gefunden
+
+    def parken(self, item: Pfad) -> bool:
+        if not item.komprimieren():
+            return False
+        strich = Strich(item, item.sceneBoundingRect())
+        self.nummer(item)
+        self._scene.removeItem(item)
+        self._geparkt[item] = strich
+        for zelle in zellen(strich.rect):
+            self._zellen.setdefault(zelle, set()).add(strich)
+        return True
+
+    def vergessen(self, item: Pfad) -> Strich:
+        strich = self._geparkt.pop(item, None)
+        if strich is None:
+            return None
+        for zelle in zellen(strich.rect):
+            striche = self._zellen[zelle]
+            striche.discard(strich)
+            if not striche:
+                del self._zellen[zelle]
+        return strich
+
+    def ausparken(self, item: Pfad):
+        strich = self.vergessen(item)
+        if strich is None:
+            return
+        self._scene.addItem(item)
+        cachepolitik.pruefe(item)
+        # Unter das unterste überlappende Item legen, das später hinzugekommen ist.
+        nummer = self.nummer(item)
+        darueber = [anderes for anderes in self._scene.items(strich.rect, Qt.IntersectsItemBoundingRect, Qt.DescendingOrder)
+                    if anderes is not item and anderes.parentItem() is None and self._nummern.get(anderes, inf) > nummer]
+        if darueber:
+            item.stackBefore(darueber[-1])
+
+    def stapel(self, items: list) -> list:
+        '''Ergänzt Items der Szene in aufsteigender Reihenfolge um die geparkten Striche,
+        jeweils vor dem ersten später hinzugekommenen Item. Es wird nichts ausgeparkt.'''
+        geparkt = sorted(self._geparkt, key=self.nummer)
+        ergebnis = []
+        i = 0
+        for item in items:
+            nummer = self._nummern.get(item)
+            while nummer is not None and i < len(geparkt) and self._nummern[geparkt[i]] < nummer:
+                ergebnis.append(geparkt[i])
+                i += 1
+            ergebnis.append(item)
+        ergebnis.extend(geparkt[i:])
+        return ergebnis
+
+    def allesAusparken(self):
+        'Für alles, was die ganze Tafel braucht: Export und Löschen.'
+        for item in list(self._geparkt):
+            self.ausparken(item)
+
+    def stackGeaendert(self, index: int):
+        if index > self._index:
+            commands = [(self._undostack.command(i), True) for i in range(self._index, index)]
+        else:
+            commands = [(self._undostack.command(i), False) for i in reversed(range(index, self._index))]
+        self._index = index
+        for command, redo in commands:
+            for art, item in aenderungenVon(command, redo):
+                if art == HINZU:
+                    self.nummer(item)
+                if item not in self._geparkt:
+                    continue
+                if art == WEG:
+                    self.vergessen(item)
+                else:
+                    self.ausparken(item)
@@ -0,0 +1,122 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from math import log2
+from PySide6.QtCore import QObject, QRectF, QRunnable, QSize, QSizeF, QThreadPool, QTimer, Signal, Slot
+from PySide6.QtGui import QImage, QPainter, QPixmap
+from PySide6.QtSvg import QSvgRenderer
+
+# Zoomstufen in halben Oktaven
+STUFENPROOKTAVE = 2
+MAXSTUFEN = 3
+# Größere Raster lohnen sich nicht, dann wird direkt als Vektor gezeichnet.
+MAXRASTERGROESSE = 4096
+# Wartezeit nach der letzten Zoomänderung, bevor neu gerastert wird
+BERUHIGUNGSZEIT = 200
+
+
+class RasterSignale(QObject):
+    fertig = Signal(int, QImage)
+
+
+class SVGRastern(QRunnable):
+    def __init__(self, quelle: str, groesse: QSize, stufe: int, signale: RasterSignale):
+        super().__init__()
+        self._quelle = quelle
+        self._groesse = groesse
+        self._stufe = stufe
+        self._signale = signale
+
+    def run(self):
+        # Jeder Thread bekommt einen eigenen Renderer, der geteilte gehört dem GUI-Thread.
+        renderer = QSvgRenderer(self._quelle)
+        image = QImage(self._groesse, QImage.Format_ARGB32_Premultiplied)
+        image.fill(0)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.Antialiasing)
+        renderer.render(painter, QRectF(0, 0, self._groesse.width(), self._groesse.height()))
+        painter.end()
+        self._signale.fertig.emit(self._stufe, image)
+
+
+class SVGRaster(QObject):
+    '''Gerasterte Fassungen eines SVG-Bildes je Zoomstufe. Wird von allen Klonen geteilt.'''
+
+    aktualisiert = Signal()
+
+    def __init__(self, quelle: str, rect: QRectF):
+        super().__init__()
+        self._quelle = quelle
+        self._rect = QRectF(rect)
+        self._stufen: dict[int, QPixmap] = {}
+        self._gewuenscht = None
+        self._ladend = None
+        self._signale = RasterSignale()
+        self._signale.fertig.connect(self.gerastert)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.rastern)
+
+    def stufe(self, lod: float) -> int:
+        return round(log2(max(lod, 1e-6))*STUFENPROOKTAVE)
+
+    def rasterGroesse(self, stufe: int) -> QSize:
+        faktor = 2**(stufe/STUFENPROOKTAVE)
+        return (QSizeF(self._rect.size())*faktor).toSize()
+
+    def pixmap(self, lod: float) -> QPixmap:
+        '''Liefert das Raster für den Detailgrad lod. Fehlt es, wird es nach dem Zoomen
+        angefordert und bis dahin das nächstliegende vorhandene geliefert (oder None).'''
+        stufe = self.stufe(lod)
+        groesse = self.rasterGroesse(stufe)
+        if max(groesse.width(), groesse.height()) > MAXRASTERGROESSE or groesse.isEmpty():
+            return None
+        if stufe in self._stufen:
+            return self._stufen[stufe]
+        if self._gewuenscht != stufe:
+            self._gewuenscht = stufe
+            self._timer.start(BERUHIGUNGSZEIT)
+        if self._stufen:
+            return self._stufen[min(self._stufen, key=lambda s: abs(s-stufe))]
+        return None
+
+    @Slot()
+    def rastern(self):
+        if self._ladend is not None or self._gewuenscht is None or self._gewuenscht in self._stufen:
+            return
+        self._ladend = self._gewuenscht
+        QThreadPool.globalInstance().start(SVGRastern(self._quelle, self.rasterGroesse(self._ladend), self._ladend, self._signale))
+
+    @Slot(int, QImage)
+    def gerastert(self, stufe: int, image: QImage):
+        self._ladend = None
+        self._stufen[stufe] = QPixmap.fromImage(image)
+        while len(self._stufen) > MAXSTUFEN:
+            del self._stufen[max(self._stufen, key=lambda s: abs(s-stufe))]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'SVG gerastert: Stufe {stufe}, {image.size()}')
+        self.aktualisiert.emit()
+        # Wurde während des Rasterns weiter gezoomt?
+        if self._gewuenscht is not None and self._gewuenscht not in self._stufen:
+            self._timer.start(BERUHIGUNGSZEIT)
+
+    def leeren(self):
+        self._stufen.clear()
+        self._gewuenscht = None
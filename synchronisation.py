@@ -0,0 +1,384 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Synchronisation zweier Tafeln, z.B. zweier Displays nebeneinander.
+#
+# Jedes Element bekommt eine globale ID (Instanz, laufende Nummer). Vorhandensein,
+# Pfad und Position eines Elements sind jeweils Last-Writer-Wins-Register mit
+# Lamport-Zeitstempel (Uhr, Instanz). Eine Operation wird nur angewendet, wenn
+# sie neuer ist als der Stand des Registers. Dadurch kommen beide Tafeln zum
+# selben Ergebnis, egal in welcher Reihenfolge gleichzeitige Eingaben eintreffen.
+#
+# Die Operationen werden pro Frame gesammelt und zlib-komprimiert verschickt.
+# Nach dem Verbinden weisen sich beide Seiten mit einem HMAC über Zufallszahlen
+# beider Seiten nach, dass sie denselben Code kennen, und schicken sich dann
+# ihren kompletten Stand. Ohne Code wird nur auf localhost gelauscht.
+
+import logging
+logger = logging.getLogger('GUI')
+
+import hmac
+import random
+import secrets
+import struct
+import zlib
+from weakref import WeakKeyDictionary, WeakValueDictionary
+from PySide6.QtCore import QObject, QPointF, QRectF, QTimer, Qt
+from PySide6.QtGui import QBrush, QColor, QImage, QPen
+from PySide6.QtNetwork import QHostAddress, QTcpServer, QTcpSocket
+from PySide6.QtWidgets import QGraphicsItem
+
+from bildpyramide import BildPyramide
+from items import Pfad, Pixelbild
+from undo import HINZU, WEG, PFAD, TRANSFORM, aenderungenVon
+from pfadkodierung import entpackePfad, packePfad, pfadAusElementen
+from uebertragung import ART_BILD, ART_PFAD, BILDRECT, STIL, nachricht, packeStil, rendereBild, zerlegeNachrichten
+
+FRAMEZEIT = 16
+WIEDERVERBINDEN = 2000
+
+BATCH, HALLO, ANTWORT = 1, 2, 3
+# Mehr darf vor dem Nachweis des Codes nicht ankommen.
+MAXHANDSHAKE = 1024
+SERVER, CLIENT = b'S', b'C'
+OP_HINZU, OP_WEG, OP_PFAD, OP_POS = range(4)
+OPKOPF = struct.Struct('<BIIQI')   # Art, ID (Instanz, Nummer), Lamport-Uhr, Autor
+POSITION = struct.Struct('<3f')    # Verschiebung und Skalierung der Szenentransformation
+
+
+class Synchronisation(QObject):
+    def __init__(self, tafelview, undostack, code: str = ''):
+        super().__init__(tafelview)
+        self._tafelview = tafelview
+        self._scene = tafelview.scene()
+        self._undostack = undostack
+        self._index = undostack.index()
+        self._instanz = random.getrandbits(32) or 1
+        self._uhr = 0
+        self._nummer = 0
+        # Schwache Referenzen: Entfernte Elemente werden freigegeben, sobald auch der
+        # Undo-Stack sie nicht mehr braucht. Ihr Grabstein bleibt in _zeiten.
+        self._gids = WeakKeyDictionary()
+        self._items = WeakValueDictionary()
+        self._zeiten = {}
+        self._korrektur = {}
+        self._ausgang = []
+        self._code = code.encode()
+        self._socket = None
+        self._bestaetigt = False
+        self._rolle = None
+        self._herausforderung = b''
+        self._partnerHerausforderung = None
+        self._server = None
+        self._ziel = None
+        self._eingang = bytearray()
+
+        # Was schon auf der Tafel ist, gehört zum Stand dieser Instanz, auch geparkte Striche.
+        items = [item for item in self._scene.items(Qt.AscendingOrder)
+                 if item.parentItem() is None and item is not tafelview.geodreieck()]
+        for item in tafelview.strichmodell().stapel(items):
+            self.lokaleAenderung(HINZU, item)
+        self._ausgang.clear()
+
+        undostack.indexChanged.connect(self.stackGeaendert)
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.frame)
+        self._timer.start(FRAMEZEIT)
+        self._wiederverbinden = QTimer(self)
+        self._wiederverbinden.setSingleShot(True)
+        self._wiederverbinden.timeout.connect(self.verbindeNeu)
+
+    def lauschen(self, port: int):
+        self._server = QTcpServer(self)
+        self._server.newConnection.connect(self.neueVerbindung)
+        # Ohne Code könnte jeder im Netz auf der Tafel zeichnen und löschen.
+        adresse = QHostAddress.Any if self._code else QHostAddress.LocalHost
+        if not self._server.listen(adresse, port):
+            raise OSError(self._server.errorString())
+        logger.info(f'Synchronisation wartet auf {adresse.name}:{self._server.serverPort()}')
+
+    def verbinden(self, host: str, port: int):
+        self._ziel = (host, port)
+        self.verbindeNeu()
+
+    def verbindeNeu(self):
+        socket = QTcpSocket(self)
+        socket.connected.connect(lambda: self.partnerVerbunden(socket, CLIENT))
+        socket.errorOccurred.connect(lambda _: self.verbindungBeendet(socket))
+        socket.connectToHost(*self._ziel)
+
+    def neueVerbindung(self):
+        while self._server.hasPendingConnections():
+            self.partnerVerbunden(self._server.nextPendingConnection(), SERVER)
+
+    def partnerVerbunden(self, socket: QTcpSocket, rolle: bytes):
+        if self._socket and self._socket is not socket:
+            self._socket.abort()
+        self._socket = socket
+        self._eingang.clear()
+        self._bestaetigt = False
+        self._rolle = rolle
+        self._herausforderung = secrets.token_bytes(16)
+        self._partnerHerausforderung = None
+        socket.setSocketOption(QTcpSocket.LowDelayOption, 1)
+        socket.readyRead.connect(lambda: self.lesen(socket))
+        socket.disconnected.connect(lambda: self.verbindungBeendet(socket))
+        socket.write(nachricht(HALLO, self._herausforderung))
+
+    def signatur(self, rolle: bytes, erste: bytes, zweite: bytes) -> bytes:
+        '''Die Rolle verhindert, dass ein Angreifer die eigene Antwort zurückspiegelt,
+        die Zufallszahlen beider Seiten, dass er eine alte Antwort wiederholt.'''
+        return hmac.new(self._code, rolle + erste + zweite, 'sha256').digest()
+
+    def handshake(self, socket: QTcpSocket, typ: int, daten: bytes):
+        if typ == HALLO and self._partnerHerausforderung is None:
+            if daten == self._herausforderung:
+                raise ValueError('gespiegelte Herausforderung')
+            self._partnerHerausforderung = daten
+            socket.write(nachricht(ANTWORT, self.signatur(self._rolle, daten, self._herausforderung)))
+        elif typ == ANTWORT and self._partnerHerausforderung is not None:
+            gegenrolle = CLIENT if self._rolle == SERVER else SERVER
+            if not hmac.compare_digest(daten, self.signatur(gegenrolle, self._herausforderung, self._partnerHerausforderung)):
+                raise ValueError('falscher Code')
+            self._bestaetigt = True
+            logger.info(f'Synchronisation mit {socket.peerAddress().toString()}:{socket.peerPort()}')
+            self._ausgang = self.zustand() + self._ausgang
+            self.frame()
+        else:
+            raise ValueError(f'unerwartete Nachricht {typ}')
+
+    def verbindungBeendet(self, socket: QTcpSocket):
+        if socket is self._socket:
+            self._socket = None
+            logger.info('Synchronisation getrennt')
+        socket.deleteLater()
+        if self._ziel and not self._wiederverbinden.isActive():
+            self._wiederverbinden.start(WIEDERVERBINDEN)
+
+    # Zeitstempel und Register
+
+    def tick(self):
+        self._uhr += 1
+        return (self._uhr, self._instanz)
+
+    def neuer(self, gid, feld: str, zeit) -> bool:
+        alt = self._zeiten.get((gid, feld))
+        if alt is None or zeit > alt:
+            self._zeiten[(gid, feld)] = zeit
+            return True
+        return False
+
+    def gid(self, item: QGraphicsItem):
+        if item not in self._gids:
+            self._nummer += 1
+            self.registriere((self._instanz, self._nummer), item)
+        return self._gids[item]
+
+    def registriere(self, gid, item: QGraphicsItem):
+        self._gids[item] = gid
+        self._items[gid] = item
+
+    # Positionen werden als Szenentransformation übertragen, damit unterschiedliche
+    # Transformationsursprünge und gerasterte Bilder auf beiden Seiten passen.
+
+    def packePosition(self, gid, item: QGraphicsItem) -> bytes:
+        rect, faktor = self._korrektur.get(gid, (QRectF(), 1))
+        t = item.sceneTransform()
+        s = item.scale()*faktor
+        return POSITION.pack(t.dx() - s*rect.x(), t.dy() - s*rect.y(), s)
+
+    def setzePosition(self, gid, item: QGraphicsItem, daten: bytes):
+        x, y, s = POSITION.unpack_from(daten)
+        rect, faktor = self._korrektur.get(gid, (QRectF(), 1))
+        itemscale = s/faktor
+        o = item.transformOriginPoint()
+        item.setScale(itemscale)
+        item.setPos(x + s*rect.x() - o.x()*(1-itemscale), y + s*rect.y() - o.y()*(1-itemscale))
+
+    # Lokale Änderungen
+
+    def stackGeaendert(self, index: int):
+        if index > self._index:
+            commands = [(self._undostack.command(i), True) for i in range(self._index, index)]
+        else:
+            commands = [(self._undostack.command(i), False) for i in reversed(range(index, self._index))]
+        self._index = index
+        for command, redo in commands:
+            for art, item in aenderungenVon(command, redo):
+                self.lokaleAenderung(art, item)
+
+    def lokaleAenderung(self, art: int, item: QGraphicsItem):
+        gid = self.gid(item)
+        zeit = self.tick()
+        if art == HINZU:
+            for feld in ('da', 'pfad', 'pos'):
+                self.neuer(gid, feld, zeit)
+            self._ausgang.append(self.op(OP_HINZU, gid, zeit, self.inhalt(gid, item)))
+        elif art == WEG:
+            self.neuer(gid, 'da', zeit)
+            self._ausgang.append(self.op(OP_WEG, gid, zeit))
+        elif art == PFAD and isinstance(item, Pfad):
+            self.neuer(gid, 'pfad', zeit)
+            self._ausgang.append(self.op(OP_PFAD, gid, zeit, packePfad(item.path())))
+        elif art == TRANSFORM:
+            self.neuer(gid, 'pos', zeit)
+            self._ausgang.append(self.op(OP_POS, gid, zeit, self.packePosition(gid, item)))
+
+    def op(self, art: int, gid, zeit, nutzdaten: bytes = b'') -> bytes:
+        return nachricht(art, OPKOPF.pack(art, gid[0], gid[1], zeit[0], zeit[1]) + nutzdaten)
+
+    def inhalt(self, gid, item: QGraphicsItem) -> bytes:
+        position = self.packePosition(gid, item)
+        if isinstance(item, Pfad):
+            return bytes([ART_PFAD]) + position + packeStil(item) + bytes([item.colorIsFGColor()]) + packePfad(item.path())
+        rect, png = rendereBild(item)
+        return bytes([ART_BILD]) + position + BILDRECT.pack(*rect.getRect()) + png
+
+    def zustand(self) -> list:
+        ops = []
+        strichmodell = self._tafelview.strichmodell()
+        items = dict(self._items)
+        for gid, item in items.items():
+            da = self._zeiten.get((gid, 'da'), (0, 0))
+            if item.scene() is self._scene or strichmodell.istGeparkt(item):
+                ops.append(self.op(OP_HINZU, gid, da, self.inhalt(gid, item)))
+                if isinstance(item, Pfad):
+                    ops.append(self.op(OP_PFAD, gid, self._zeiten.get((gid, 'pfad'), da), packePfad(item.path())))
+                ops.append(self.op(OP_POS, gid, self._zeiten.get((gid, 'pos'), da), self.packePosition(gid, item)))
+            else:
+                ops.append(self.op(OP_WEG, gid, da))
+        # Schon freigegebene Elemente
+        for (gid, feld), zeit in self._zeiten.items():
+            if feld == 'da' and gid not in items:
+                ops.append(self.op(OP_WEG, gid, zeit))
+        return ops
+
+    def frame(self):
+        if not self._socket or not self._bestaetigt or not self._ausgang:
+            return
+        self._socket.write(nachricht(BATCH, zlib.compress(b''.join(self._ausgang))))
+        self._ausgang.clear()
+
+    # Änderungen des Partners
+
+    def lesen(self, socket: QTcpSocket):
+        if socket is not self._socket:
+            return
+        self._eingang += socket.readAll().data()
+        nachrichten, verbraucht = zerlegeNachrichten(self._eingang, False)
+        del self._eingang[:verbraucht]
+        angewendet = False
+        try:
+            for typ, daten in nachrichten:
+                if not self._bestaetigt:
+                    self.handshake(socket, typ, daten)
+                    continue
+                if typ != BATCH:
+                    continue
+                ops, _ = zerlegeNachrichten(zlib.decompress(daten), False)
+                for _, op in ops:
+                    self.anwenden(op)
+                angewendet = True
+            if not self._bestaetigt and len(self._eingang) > MAXHANDSHAKE:
+                raise ValueError('zu lange Nachricht vor dem Handshake')
+        except (ValueError, zlib.error, struct.error, IndexError) as e:
+            # Eine kaputte Nachricht darf nicht im Slot hochkommen, der Partner wird getrennt.
+            logger.warning(f'Synchronisation: {socket.peerAddress().toString()} getrennt: {e}')
+            socket.abort()
+        if angewendet:
+            self._tafelview.eswurdegemalt.emit()
+
+    def anwenden(self, op: bytes):
+        art, instanz, nummer, uhr, autor = OPKOPF.unpack_from(op)
+        gid = (instanz, nummer)
+        zeit = (uhr, autor)
+        daten = op[OPKOPF.size:]
+        self._uhr = max(self._uhr, uhr)
+        item = self._items.get(gid)
+        if item is not None:
+            # Geparkte Striche werden für die Änderung zurück in die Szene geholt.
+            self._tafelview.strichmodell().ausparken(item)
+
+        if art == OP_HINZU:
+            if item is None:
+                item = self.erzeugeItem(gid, daten)
+                if item is None:
+                    return
+                self.neuer(gid, 'pfad', zeit)
+                self.neuer(gid, 'pos', zeit)
+            else:
+                # Pfad und Position im Inhalt haben denselben Zeitstempel wie das Hinzufügen.
+                self.inhaltAnwenden(gid, item, daten, zeit)
+            if self.neuer(gid, 'da', zeit) and item.scene() is None:
+                self._scene.addItem(item)
+        elif item is None:
+            logger.warning(f'Synchronisation: unbekanntes Element {gid}')
+        elif art == OP_WEG:
+            if self.neuer(gid, 'da', zeit) and item.scene() is not None:
+                self._scene.removeItem(item)
+        elif art == OP_PFAD:
+            if self.neuer(gid, 'pfad', zeit):
+                item.setPath(pfadAusElementen(entpackePfad(daten)[0]))
+                item.setTransformOriginPoint(item.boundingRect().center())
+        elif art == OP_POS:
+            if self.neuer(gid, 'pos', zeit):
+                self.setzePosition(gid, item, daten)
+
+    def erzeugeItem(self, gid, daten: bytes) -> QGraphicsItem:
+        itemart = daten[0]
+        position = daten[1:1+POSITION.size]
+        rest = daten[1+POSITION.size:]
+        if itemart == ART_PFAD:
+            pencolor, penwidth, cosmetic, brushcolor = STIL.unpack_from(rest)
+            pen = QPen(Qt.NoPen)
+            if pencolor:
+                pen = QPen(QColor.fromRgba(pencolor), penwidth, Qt.SolidLine, c=Qt.RoundCap, j=Qt.RoundJoin)
+                pen.setCosmetic(bool(cosmetic))
+            brush = QBrush(QColor.fromRgba(brushcolor)) if brushcolor else QBrush(Qt.NoBrush)
+            item = Pfad(QPointF(), pen, brush)
+            item.setColorIsFGColor(bool(rest[STIL.size]))
+            item.setPath(pfadAusElementen(entpackePfad(rest, STIL.size+1)[0]))
+            item.setTransformOriginPoint(item.boundingRect().center())
+        elif itemart == ART_BILD:
+            x, y, w, h = BILDRECT.unpack_from(rest)
+            image = QImage.fromData(rest[BILDRECT.size:], 'PNG')
+            if image.isNull():
+                return None
+            item = Pixelbild(BildPyramide(image))
+            item.setTransformOriginPoint(0, 0)
+            self._korrektur[gid] = (QRectF(x, y, w, h), image.width()/w if w else 1)
+        else:
+            return None
+        self.registriere(gid, item)
+        self.setzePosition(gid, item, position)
+        return item
+
+    def inhaltAnwenden(self, gid, item: QGraphicsItem, daten: bytes, zeit):
+        'Übernimmt Pfad und Position aus dem Inhalt einer OP_HINZU für ein vorhandenes Element.'
+        if daten[0] == ART_PFAD and isinstance(item, Pfad) and self.neuer(gid, 'pfad', zeit):
+            item.setPath(pfadAusElementen(entpackePfad(daten, 1+POSITION.size+STIL.size+1)[0]))
+            item.setTransformOriginPoint(item.boundingRect().center())
+        if self.neuer(gid, 'pos', zeit):
+            self.setzePosition(gid, item, daten[1:1+POSITION.size])
+
+    def beenden(self):
+        self._timer.stop()
+        self._ziel = None
+        if self._socket:
+            self._socket.disconnectFromHost()
+        if self._server:
+            self._server.close()
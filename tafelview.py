@@ -18,17 +18,23 @@
 import logging
 logger = logging.getLogger('GUI')
 
+from collections import OrderedDict
+from time import monotonic
 from PySide6 import QtCore
-from PySide6.QtCore import QEvent, QPointF, QRect, QSizeF, Qt, Signal, Slot
-from PySide6.QtGui import QBrush, QColor, QPainter, QPalette, QPen, QResizeEvent, QUndoStack, QInputDevice
-from PySide6.QtWidgets import QApplication, QGraphicsRectItem, QGraphicsItem, QGraphicsView, QMessageBox, QToolButton, QWidget, QPinchGesture, QGraphicsScene
+from PySide6.QtCore import QEvent, QLineF, QPointF, QRect, QRectF, QSizeF, Qt, QTimer, Signal, Slot
+from PySide6.QtGui import QBrush, QColor, QEventPoint, QPainter, QPalette, QPen, QResizeEvent, QUndoStack, QInputDevice
+from PySide6.QtWidgets import QApplication, QGraphicsItem, QGraphicsView, QMessageBox, QToolButton, QWidget, QPinchGesture, QGraphicsScene, QStyleOptionGraphicsItem
 from enum import Enum
 
 from icons import SVGCursor, SVGIcon, ItemCursor
-from items import Ellipse, Kreis, Linie, LinieSnap, Pfad, Pfeil, PfeilSnap, Punkt, Quadrat, Rechteck, Stift
+from items import Ellipse, Kreis, Linie, LinieSnap, Pfad, Pfeil, PfeilSnap, Punkt, Quadrat, Rechteck, Stift, stiltabelle
 from geodreieck import Geodreieck
+from handballen import HANDBALLEN, UNENTSCHIEDEN, Handballenerkennung, geraeteName
 from radiergummi import Radiergummi
-from undo import AddItem, RemoveItem, ChangePathItems, MoveItem
+from strichmodell import Strichmodell
+from cachepolitik import cachepolitik
+from kacheln import kachelrenderer
+from undo import AddItem, RemoveItem, RemoveItems, ChangePathItems, MoveItem
 
 class Werkzeug(Enum):
     Freihand  = 1
@@ -46,35 +52,79 @@ class Werkzeug(Enum):
     RechteckF = 13
 
 class Status(Enum):
-    kreativ   = 1
-    radieren  = 2
-    editieren = 3
+    kreativ        = 1
+    radieren       = 2
+    editieren      = 3
+    strichradieren = 4
 
 class Tafelview(QGraphicsView):
 
     eswurdegemalt = Signal()
     statusbarinfo = Signal(str, int)
-    kalibriert = Signal(float)
+    kalibriert = Signal(str, float, float)
 
     RADIERGUMMISIZESMALL = QSizeF(30, 60)
     RADIERGUMMISIZEBIG   = QSizeF(90, 180)
 
-    def __init__(self, parent: QWidget, undostack, bigpointfactor: float, verybigpointfactor: float, mittlerePointsize: float, colorname: str="foreground", pensize: float=3, werkzeug: Werkzeug=Werkzeug.Freihand, status: Status=Status.kreativ):
+    # Zwei Finger, die so dicht und so kurz nacheinander aufsetzen, verschieben die Leinwand.
+    PINCHABSTAND = 300
+    PINCHZEIT    = 150
+
+    # Schwung nach dem Verschieben: Anteil der Geschwindigkeit, der pro Frame erhalten bleibt
+    REIBUNG    = 0.95
+    FRAMEZEIT  = 16
+    # in Pixel pro ms
+    MINSCHWUNG = 0.05
+
+    # Ab dieser Änderung des Pinch-Faktors wird gezoomt statt nur verschoben.
+    ZOOMSCHWELLE = 0.03
+    MINZOOM = 0.1
+    MAXZOOM = 10
+
+    # So viele Radiergummi-Cursor (Größe und Zoom) bleiben gespeichert.
+    RADIERCURSORANZAHL = 8
+
+    MAUS = -1
+
+    def __init__(self, parent: QWidget, undostack, bigpointfactor: float, verybigpointfactor: float, mittlerePointsize: float, colorname: str="foreground", pensize: float=3, werkzeug: Werkzeug=Werkzeug.Freihand, status: Status=Status.kreativ, profile: dict=None):
         super().__init__(parent)
         self._undostack = undostack
         self._status = status
         self._tool = werkzeug
         self._tmpStatus = None
-        self._painting = False
         self._dreheGeo: bool = None
         self._verschiebeGeo: bool = None
+        self._geoPunkt = None
+        self._radierPunkt = None
+        # Letzte Position des Radiergummis pro Touchpunkt
+        self._radierPos: dict[int, QPointF] = {}
+        self._pinch = False
+        self._schwung = QPointF()
+        self._letzteVerschiebung = 0
+        self._scrollRest = QPointF()
+        self._schwungTimer = QTimer(self)
+        self._schwungTimer.setTimerType(Qt.PreciseTimer)
+        self._schwungTimer.setInterval(Tafelview.FRAMEZEIT)
+        self._schwungTimer.timeout.connect(self.schwingen)
+        # Schnappschuss des Viewports, der während des Pinch-Zooms nur skaliert wird
+        self._zoomBild = None
+        self._zoomStart = QPointF()
+        self._zoomMitte = QPointF()
+        self._zoomBasis = 1
+        self._zoomFaktor = 1
+        # Vor dem ersten viewportEvent gesetzt, das schon setAttribute auslöst
+        self._aufzeichnung = None
         self.setDragMode(QGraphicsView.RubberBandDrag)
         self.viewport().setAttribute(Qt.WA_AcceptTouchEvents, True)
         self.viewport().grabGesture(Qt.PinchGesture)
         self.setScene(QGraphicsScene(self))
         self.setBackgroundBrush(QColor(Qt.transparent))
-        self._currentItem: Pfad = None
-        self._lastPos: QPointF = None
+        # Pro Touchpunkt (bzw. MAUS) ein Strich in Arbeit
+        self._aktiveItems: dict[int, Pfad] = {}
+        self._startPos: dict[int, QPointF] = {}
+        self._druckzeit: dict[int, int] = {}
+        self._bewegt = set()
+        self._overlayRect = QRectF()
         self._fgcolor = QApplication.instance().palette().color(QPalette.WindowText)
 
         self._status2cursor = self.initCursor()
@@ -85,16 +135,26 @@ class Tafelview(QGraphicsView):
         self._arrowpen = QPen(self._drawpen)
         self._arrowpen.setJoinStyle(Qt.MiterJoin)
         self._radiersize = QSizeF(pensize*5, pensize*10)
+        # Es gibt nur einen Radiergummi. Seine Größe in Viewport-Pixeln ist _radierGroesse,
+        # die Cursor werden pro Größe und Zoom nur einmal gezeichnet.
+        self._radierGroesse = self._radiersize
         self._radiergummi = Radiergummi(self._radiersize/self.transform().m11(), QPointF(0,0))
+        self._radierCursor = OrderedDict()
         self.setPencolor(colorname)
         self.setPensize(pensize)
 
-        self._kalibriere = False
-        self._mittlerePointsize = mittlerePointsize
-        self._countPointsize = 50
-        self._bigpointfactor = bigpointfactor
-        self._verybigpointfactor = verybigpointfactor
-        self._clonedItems = {}
+        self._handballen = Handballenerkennung(mittlerePointsize, bigpointfactor, verybigpointfactor, profile)
+        self._handballen.kalibriert.connect(self.kalibriert)
+        self._geraet = geraeteName(None)
+        # Touchpunkte, die noch nicht als Stift oder Handballen eingeordnet sind, mit ihrer Startposition
+        self._wartend: dict[int, QPointF] = {}
+        # Radierte Items und ihr Pfad vor dem Radieren
+        self._altePfade = {}
+        # Vom Strichradierer entfernte Items, die beim Loslassen ein Undo-Schritt werden
+        self._geloeschteItems = []
+        self._strichmodell = Strichmodell(self, undostack)
+        cachepolitik.setView(self)
+        kachelrenderer.setView(self)
 
         self.setRenderHint(QPainter.Antialiasing)
         self.setTransformationAnchor(QGraphicsView.NoAnchor)
@@ -127,6 +187,9 @@ class Tafelview(QGraphicsView):
     def fgcolor(self):
         return self._fgcolor
 
+    def geodreieck(self) -> Geodreieck:
+        return self._geodreieck
+
     def newPalette(self):
         self._status2cursor = self.initCursor()
         self.setCustomCursor()
@@ -148,9 +211,25 @@ class Tafelview(QGraphicsView):
         self._drawpen.setWidthF(pensize)
         self._arrowpen.setWidthF(pensize)
         self._radiersize = QSizeF(pensize*5, pensize*10)
-        self._radiergummi = Radiergummi(self._radiersize/self.transform().m11(), QPointF(0,0))
+        if not self._tmpStatus:
+            self.setRadierGroesse(self._radiersize)
         self.setCustomCursor()
 
+    def setRadierGroesse(self, size: QSizeF):
+        self._radierGroesse = size
+        self._radiergummi.setSize(size/self.transform().m11())
+
+    def radierCursor(self) -> ItemCursor:
+        # Gerundet, sonst entstünde beim stufenlosen Pinch-Zoom ein Eintrag pro Frame.
+        schluessel = (self._radierGroesse.width(), self._radierGroesse.height(), round(self.transform().m11(), 2))
+        cursor = self._radierCursor.get(schluessel)
+        if cursor is None:
+            cursor = self._radierCursor[schluessel] = ItemCursor(self._radiergummi, self.transform().m11(), -1, -1)
+            if len(self._radierCursor) > Tafelview.RADIERCURSORANZAHL:
+                self._radierCursor.popitem(last=False)
+        self._radierCursor.move_to_end(schluessel)
+        return cursor
+
     def centerGeodreieck(self):
         center = self.mapToScene(self.viewport().rect().center() );
         self._geodreieck.setPos(center-self._geodreieck.transformOriginPoint())
@@ -174,8 +253,8 @@ class Tafelview(QGraphicsView):
         }
 
     def setCustomCursor(self):
-        if self._status == Status.radieren:
-            cursor = ItemCursor(self._radiergummi, self.transform().m11(), -1, -1)
+        if self._status in (Status.radieren, Status.strichradieren):
+            cursor = self.radierCursor()
         elif self._status == Status.editieren:
             cursor = self._status2cursor[self._status]
         else:
@@ -189,7 +268,8 @@ class Tafelview(QGraphicsView):
                 item.setSelected(False)
 
         self._status = status
-        self._painting = False
+        self._bewegt.clear()
+        self._geoPunkt = None
         self._dreheGeo = False
         self._verschiebeGeo = False
         self.setCustomCursor()
@@ -198,10 +278,7 @@ class Tafelview(QGraphicsView):
         self._tool = tool
         self.setCustomCursor()
 
-    def setLastPos(self, pos):
-        self._lastPos = pos
-
-    def createCurrentItem(self, pos):
+    def createCurrentItem(self, pos, id=MAUS):
         if self._tool == Werkzeug.Freihand:
             item = Stift(pos, self._drawpen, Qt.NoBrush)
         elif self._tool == Werkzeug.Linie:
@@ -234,145 +311,353 @@ class Tafelview(QGraphicsView):
         if self._colorname == "foreground":
             item.setColorIsFGColor(True)
 
-        self._undostack.push(AddItem(self.scene(), item))
-        self._currentItem = item
-
-    def deleteCurrentItem(self):
-        try:
-            self.scene().removeItem(self._currentItem)
-            self._currentItem = None
-        except Exception as e:
-            logger.exception(e, exc_info=True)
+        # Das Item kommt erst in bearbeitenFertig in die Szene. Bis dahin
+        # wird es in drawForeground gezeichnet und belastet den BSP-Index nicht.
+        self._aktiveItems[id] = item
+
+    def strichmodell(self) -> Strichmodell:
+        return self._strichmodell
+
+    def bearbeitetGerade(self) -> bool:
+        return bool(self._startPos) or self._geoPunkt is not None
+
+    def currentItems(self) -> list:
+        return list(self._aktiveItems.values())
+
+    def deleteCurrentItem(self, id):
+        self._aktiveItems.pop(id, None)
+        self._startPos.pop(id, None)
+        self._bewegt.discard(id)
+
+    def overlayItems(self):
+        items = list(self._aktiveItems.values())
+        if self._tmpStatus:
+            items.append(self._radiergummi)
+        return items
+
+    def aktualisiereOverlay(self):
+        rect = QRectF()
+        for item in self.overlayItems():
+            rect |= item.sceneBoundingRect()
+        dirty = self._overlayRect | rect
+        self._overlayRect = rect
+        if dirty.isNull():
+            return
+        rand = self._drawpen.widthF() + 3
+        self.viewport().update(self.mapFromScene(dirty).boundingRect().adjusted(-rand, -rand, rand, rand))
+
+    def drawBackground(self, painter: QPainter, rect: QRectF):
+        super().drawBackground(painter, rect)
+        # Fertige Striche kommen als Kacheln aus dem Hintergrund (siehe kacheln).
+        kachelrenderer.zeichne(painter, rect)
+
+    def drawForeground(self, painter: QPainter, rect: QRectF):
+        super().drawForeground(painter, rect)
+        for item in self.overlayItems():
+            painter.save()
+            painter.setTransform(item.sceneTransform(), True)
+            item.paint(painter, QStyleOptionGraphicsItem(), None)
+            painter.restore()
+        cachepolitik.frame(rect)
 
     def scenePosFromEvent(self, event):
         tp = event.points().pop()
-        pos = self.mapToScene(tp.pos().x(), tp.pos().y())
-        return pos
+        return self.scenePosFromPoint(tp)
+
+    def scenePosFromPoint(self, tp):
+        return self.mapToScene(tp.pos().x(), tp.pos().y())
+
+    def bearbeitenStart(self, pos, id=MAUS):
+        verschiebeGeo = self._geodreieck.posInVerschiebegriff(pos)
+        dreheGeo = self._geodreieck.posInDrehgriff(pos)
+        if (verschiebeGeo or dreheGeo) and self._geoPunkt is None:
+            cachepolitik.verwerfen(self._geodreieck)
+            self._geoPunkt = id
+            self._verschiebeGeo = verschiebeGeo
+            self._dreheGeo = dreheGeo
+            return
 
-    def bearbeitenStart(self,pos) -> bool:
-        self._verschiebeGeo = self._geodreieck.posInVerschiebegriff(pos)
-        self._dreheGeo = self._geodreieck.posInDrehgriff(pos)
-        
+        pos = self.snapToGeodreieck(pos)
+        self._startPos[id] = pos
+        # Radiert wird erst ab hier, nicht ab dem Ende des vorigen Drucks.
+        self._radierPos[id] = pos
         if self._status == Status.kreativ:
-            if not self._verschiebeGeo and not self._dreheGeo:
-                pos = self.snapToGeodreieck(pos)
-                self.setLastPos(pos)
-                self.createCurrentItem(pos)
-                self._painting = True
-
-    def bearbeitenWeiter(self, pos) -> bool:
-        if not self._painting:
-            self._verschiebeGeo = self._geodreieck.posInVerschiebegriff(pos)
-            self._dreheGeo = self._geodreieck.posInDrehgriff(pos)
-
-        if self._dreheGeo:
-            self._geodreieck.drehe(pos)
-            self._painting = True
-            return
-        if self._verschiebeGeo:
-            self._geodreieck.verschiebe(pos)
-            self._painting = True
+            self.createCurrentItem(pos, id)
+
+    def bearbeitenWeiter(self, pos, id=MAUS):
+        if id not in self._startPos and id != self._geoPunkt:
+            self.bearbeitenStart(pos, id)
+
+        if id == self._geoPunkt:
+            if self._dreheGeo:
+                self._geodreieck.drehe(pos)
+            elif self._verschiebeGeo:
+                self._geodreieck.verschiebe(pos)
             return
-        if self._status == Status.radieren:
-            self._painting = True
-            self.radiere(pos)
+
+        self._bewegt.add(id)
+        if self._status in (Status.radieren, Status.strichradieren):
+            self.radiere(pos, id)
             return
 
-        geopos = self.snapToGeodreieck(pos)
-        if not self._painting:
-            self.createCurrentItem(geopos)
-            self._painting = True
-        self._currentItem.change(geopos)
+        item = self._aktiveItems.get(id)
+        if item:
+            item.change(self.snapToGeodreieck(pos))
     
-    def bearbeitenFertig(self,pos) -> bool:
-        self._verschiebeGeo = False
-        self._dreheGeo = False
-        self._currentItem = None
-        if pos:
-            geopos = self.snapToGeodreieck(pos)
-            if geopos == self._lastPos or not self._painting:   # MouseClick
-                if self._status == Status.radieren:
-                    self.radiere(geopos)
-                elif self._status == Status.kreativ and self._tool == Werkzeug.Freihand:
-                    item = Punkt(geopos, self._drawpen, Qt.NoBrush)
-                    self._undostack.undo()
-                    self._undostack.push(AddItem(self.scene(), item))
-        if self._clonedItems:
-            self._undostack.push(ChangePathItems({k: self._clonedItems[k] for k in self._clonedItems}))
-        self._clonedItems = {}
-        self._painting = False
-        self.setLastPos(None)
+    def bearbeitenFertig(self, pos, id=MAUS):
+        if id == self._geoPunkt:
+            cachepolitik.pruefe(self._geodreieck)
+            self._geoPunkt = None
+            self._verschiebeGeo = False
+            self._dreheGeo = False
+            self._startPos.pop(id, None)
+        else:
+            item = self._aktiveItems.pop(id, None)
+            startpos = self._startPos.pop(id, None)
+            bewegt = id in self._bewegt
+            self._bewegt.discard(id)
+            if pos:
+                geopos = self.snapToGeodreieck(pos)
+                if geopos == startpos or not bewegt:   # MouseClick
+                    if self._status in (Status.radieren, Status.strichradieren):
+                        self.radiere(geopos, id)
+                    elif self._status == Status.kreativ and self._tool == Werkzeug.Freihand:
+                        item = Punkt(geopos, self._drawpen, Qt.NoBrush)
+                        if self._colorname == "foreground":
+                            item.setColorIsFGColor(True)
+            # Erst nach dem Radieren beim Klick, das die Position sonst wieder setzt
+            self._radierPos.pop(id, None)
+            if item and not item.path().isEmpty():
+                if isinstance(item, Stift):
+                    item.ausduennen(self.transform().m11())
+                self._undostack.push(AddItem(self.scene(), item))
+                item.fertig()
+
+        if self._startPos or self._geoPunkt is not None:
+            # Andere Finger sind noch unterwegs.
+            return
+        if self._altePfade:
+            self._undostack.push(ChangePathItems(self._altePfade))
+            for item in self._altePfade:
+                item.fertig()
+        self._altePfade = {}
+        if self._geloeschteItems:
+            self._undostack.push(RemoveItems(self.scene(), self._geloeschteItems))
+            self._geloeschteItems = []
         self.eswurdegemalt.emit()
 
+    def erkennePinch(self, event):
+        """Zwei Finger, die fast gleichzeitig und dicht beieinander aufsetzen, sind
+        eine Pinch-Geste. Alles andere sind mehrere Stifte."""
+        for point in event.points():
+            if point.state() == QEventPoint.Pressed:
+                self._druckzeit[point.id()] = event.timestamp()
+        if self._pinch or self._tmpStatus or event.pointCount() != 2:
+            return
+        a, b = event.points()
+        if QEventPoint.Pressed not in (a.state(), b.state()):
+            return
+        abstand = QLineF(a.pos(), b.pos()).length()
+        zeit = abs(self._druckzeit.get(a.id(), 0) - self._druckzeit.get(b.id(), 0))
+        if abstand < Tafelview.PINCHABSTAND and zeit < Tafelview.PINCHZEIT:
+            self._pinch = True
+            self.deleteCurrentItem(a.id())
+            self.deleteCurrentItem(b.id())
+
+    def touchVerarbeiten(self, event):
+        eventtype = event.type()
+        points = event.points()
+        if eventtype == QEvent.TouchBegin:
+            self.stoppeSchwung()
+        self._geraet = geraeteName(event.device())
+        klassen = {}
+        if eventtype != QEvent.TouchCancel:
+            pointsizes = {point.id(): self.touchPointSize(point) for point in points}
+            for point in points:
+                klassen[point.id()] = self._handballen.einordnen(self._geraet, point.id(), pointsizes[point.id()])
+            handballen = [point for point in points if klassen[point.id()] == HANDBALLEN]
+            if handballen and not self._pinch:
+                bigpoint = max(handballen, key=lambda point: pointsizes[point.id()])
+                if not self._tmpStatus:
+                    self.aktiviereRadiergummi(pointsizes[bigpoint.id()], self.scenePosFromPoint(bigpoint), bigpoint.id())
+                self.resizeRadiergummi(pointsizes[bigpoint.id()])
+
+        self.erkennePinch(event)
+
+        # Alle Punkte eines Events werden zusammen verarbeitet, das Overlay nur einmal aktualisiert.
+        if not self._pinch:
+            for point in points:
+                if self._tmpStatus and point.id() != self._radierPunkt:
+                    # Solange der Handballen radiert, ruhen die anderen Finger.
+                    continue
+                state = point.state()
+                pos = self.scenePosFromPoint(point)
+                if klassen.get(point.id()) == UNENTSCHIEDEN:
+                    # Erst nach dem nächsten Sample steht fest, ob ein Strich beginnt.
+                    self._wartend.setdefault(point.id(), pos)
+                    continue
+                if point.id() in self._wartend:
+                    self.bearbeitenStart(self._wartend.pop(point.id()), point.id())
+                if eventtype == QEvent.TouchCancel or state == QEventPoint.Released:
+                    self._handballen.vergessen(point.id())
+                    self.bearbeitenFertig(pos, point.id())
+                elif state == QEventPoint.Pressed:
+                    self.bearbeitenStart(pos, point.id())
+                elif state == QEventPoint.Updated:
+                    self.bearbeitenWeiter(pos, point.id())
+
+        if eventtype in [QEvent.TouchCancel, QEvent.TouchEnd]:
+            for id in list(self._startPos):
+                self.bearbeitenFertig(None, id)
+            if self._geoPunkt is not None:
+                self.bearbeitenFertig(None, self._geoPunkt)
+            self._pinch = False
+            self.pinchFertig()
+            self._druckzeit.clear()
+            self._wartend.clear()
+            self._handballen.zuruecksetzen()
+            if self._tmpStatus:
+                self.deaktiviereRadiergummi()
+        self.aktualisiereOverlay()
+
     def touchPointSize(self, point):
         ellipse = point.ellipseDiameters()
         area = ellipse.height()**2 + ellipse.width()**2
         #logger.info(f"Pointsize: {ellipse}, Fläche={area}")
         return area
     
-    def isBigPoint(self, pointsize) -> True:
-        return pointsize > self._mittlerePointsize * self._bigpointfactor and not self._kalibriere
-
     def isVeryBigPoint(self, pointsize) -> True:
-        return pointsize > self._mittlerePointsize * self._verybigpointfactor and not self._kalibriere
-
-    def getPointSizeList(self, event):
-        return [self.touchPointSize(point) for point in event.points()]
+        return self._handballen.sehrGross(self._geraet, pointsize)
 
     def verschiebeLeinwand(self, point: QPointF, lastpoint: QPointF):
-        scpoint = self.mapToScene(point.toPoint())
-        sclastpoint = self.mapToScene(lastpoint.toPoint())
-        dpoint = scpoint -sclastpoint
-        rectvor = self.mapToScene(self.viewport().geometry()).boundingRect()
-        self.translate(dpoint.x(), dpoint.y())
-        rectnach = self.mapToScene(self.viewport().geometry()).boundingRect()
-        if rectvor.x() == rectnach.x() and dpoint.x() != 0 or rectvor.y() == rectnach.y() and dpoint.y() != 0:
-            logger.debug(f"dpoint={dpoint}")
-            if dpoint.x() > 0:
-                self.erweitern('left', self.mapFromParent(dpoint).x())
-            if dpoint.x() < 0:
-                self.erweitern('right', -self.mapFromParent(dpoint).x())
-            if dpoint.y() > 0:
-                self.erweitern('top', self.mapFromParent(dpoint).y())
-            if dpoint.y() < 0:
-                self.erweitern('bottom', -self.mapFromParent(dpoint).y())
-
-    def aktiviereRadiergummi(self, pointsize, pos):
+        delta = point - lastpoint
+        self.scrolleUm(delta)
+        # Geglättete Geschwindigkeit für den Schwung nach dem Loslassen
+        jetzt = monotonic()*1000
+        dt = max(1, jetzt - self._letzteVerschiebung)
+        self._schwung = (self._schwung + delta/dt)/2 if dt < 100 else delta/dt
+        self._letzteVerschiebung = jetzt
+
+    def pinchWeiter(self, gesture):
+        mitte = QPointF(self.viewport().mapFromGlobal(gesture.centerPoint()))
+        faktor = gesture.totalScaleFactor()
+        if self._zoomBild is None and abs(faktor - 1) > Tafelview.ZOOMSCHWELLE:
+            # Ab jetzt wird nur der Schnappschuss skaliert, gerendert wird erst am Ende der Geste.
+            self._zoomBild = self.viewport().grab()
+            self._zoomStart = mitte
+            self._zoomBasis = faktor
+        if self._zoomBild is None:
+            if gesture.changeFlags() & QPinchGesture.CenterPointChanged:
+                self.verschiebeLeinwand(gesture.centerPoint(), gesture.lastCenterPoint())
+            return
+        zoom = self.transform().m11()
+        self._zoomFaktor = min(max(faktor/self._zoomBasis, Tafelview.MINZOOM/zoom), Tafelview.MAXZOOM/zoom)
+        self._zoomMitte = mitte
+        self.viewport().update()
+
+    def pinchFertig(self) -> bool:
+        'Rendert nach einem Pinch-Zoom einmal in voller Qualität. Liefert, ob gezoomt wurde.'
+        if self._zoomBild is None:
+            return False
+        self._zoomBild = None
+        self._schwung = QPointF()
+        szenepunkt = self.mapToScene(self._zoomStart.toPoint())
+        self.scale(self._zoomFaktor, self._zoomFaktor)
+        self.scrolleUm(self._zoomMitte - QPointF(self.mapFromScene(szenepunkt)))
+        self.viewport().update()
+        return True
+
+    def paintEvent(self, event):
+        if self._zoomBild is None:
+            return super().paintEvent(event)
+        painter = QPainter(self.viewport())
+        painter.fillRect(event.rect(), self.viewport().palette().color(QPalette.Base))
+        painter.translate(self._zoomMitte)
+        painter.scale(self._zoomFaktor, self._zoomFaktor)
+        painter.translate(-self._zoomStart)
+        painter.drawPixmap(QPointF(0, 0), self._zoomBild)
+        painter.end()
+
+    def scrolleUm(self, delta: QPointF):
+        '''Verschiebt den Inhalt um delta Viewport-Pixel über die Scrollbars. Qt verschiebt
+        dabei das fertige Bild und zeichnet nur den frei gewordenen Streifen neu.'''
+        sicht = self.mapToScene(self.viewport().rect()).boundingRect()
+        ziel = sicht.translated(-delta.x()/self.transform().m11(), -delta.y()/self.transform().m22())
+        scenerect = self.sceneRect()
+        if not scenerect.contains(ziel):
+            # Gleich um eine ganze Sicht erweitern, damit sich die Scrollbereiche selten ändern.
+            w, h = sicht.width(), sicht.height()
+            self.setSceneRect(scenerect | ziel.adjusted(-w, -h, w, h))
+        self._scrollRest += delta
+        dx, dy = round(self._scrollRest.x()), round(self._scrollRest.y())
+        self._scrollRest -= QPointF(dx, dy)
+        self.horizontalScrollBar().setValue(self.horizontalScrollBar().value() - dx)
+        self.verticalScrollBar().setValue(self.verticalScrollBar().value() - dy)
+
+    def starteSchwung(self):
+        if monotonic()*1000 - self._letzteVerschiebung > 100:
+            # Der Finger stand vor dem Loslassen still.
+            self._schwung = QPointF()
+        if QLineF(QPointF(), self._schwung).length() >= Tafelview.MINSCHWUNG:
+            self._schwungTimer.start()
+
+    def stoppeSchwung(self):
+        self._schwungTimer.stop()
+        self._schwung = QPointF()
+
+    def schwingen(self):
+        self.scrolleUm(self._schwung*Tafelview.FRAMEZEIT)
+        self._schwung *= Tafelview.REIBUNG
+        if QLineF(QPointF(), self._schwung).length() < Tafelview.MINSCHWUNG:
+            self.stoppeSchwung()
+
+    def aktiviereRadiergummi(self, pointsize, pos, id=MAUS):
+        # Der Strich, den der Handballen begonnen hat, wird verworfen.
+        self.deleteCurrentItem(id)
+        self._radierPunkt = id
         self._tmpStatus = self._status
         size = Tafelview.RADIERGUMMISIZESMALL
         if self.isVeryBigPoint(pointsize):
             size = Tafelview.RADIERGUMMISIZEBIG
-        self._radiergummi = Radiergummi(size/self.transform().m11(), pos)
-        self.scene().addItem(self._radiergummi)
+        self.setRadierGroesse(size)
+        self._radiergummi.setPos(pos)
         self.setStatus(Status.radieren)
+        self.aktualisiereOverlay()
 
     def resizeRadiergummi(self, pointsize):
-        if self._radiergummi.size() == Tafelview.RADIERGUMMISIZEBIG:
+        if self._radierGroesse == Tafelview.RADIERGUMMISIZEBIG or not self.isVeryBigPoint(pointsize):
             return
-        size = Tafelview.RADIERGUMMISIZESMALL
-        if self.isVeryBigPoint(pointsize):
-            size = Tafelview.RADIERGUMMISIZEBIG
-        self._radiergummi.setSize(size/self.transform().m11())
+        self.setRadierGroesse(Tafelview.RADIERGUMMISIZEBIG)
+        self.aktualisiereOverlay()
     
     def deaktiviereRadiergummi(self):
         self.setStatus(self._tmpStatus)
         self._tmpStatus = None
-        self.scene().removeItem(self._radiergummi)
-        self._radiergummi = Radiergummi(self._radiersize/self.transform().m11(), QPointF(0,0))
+        self._radierPunkt = None
+        self._radierPos.clear()
+        self.aktualisiereOverlay()
+        self.setRadierGroesse(self._radiersize)
+
+    def setAufzeichnung(self, aufzeichnung):
+        self._aufzeichnung = aufzeichnung
 
     def viewportEvent(self, event: QtCore.QEvent) -> bool:
         if logger.isEnabledFor(logging.DEBUG):
-            logger.debug(f'Tafelview: {event}')
+            logger.debug('Tafelview: %s', event)
+        if self._aufzeichnung:
+            self._aufzeichnung.schreibe(event)
 
         try:
             eventtype = event.type()
 
             if eventtype == QEvent.PaletteChange:
                 self.newPalette()
-                for item in self.scene().items():
-                    if isinstance(item, Pfad):
-                        item.newPalette(self.palette())
+                # Gilt für alle Pfade, auch für geparkte.
+                stiltabelle.newPalette(self.palette())
+                kachelrenderer.neuePalette()
+                self.scene().update()
                 self._geodreieck.newPalette(self.palette())
+                cachepolitik.neuePalette()
                 return True
             
             if self._status == Status.editieren:
@@ -387,43 +672,27 @@ class Tafelview(QGraphicsView):
 
             if eventtype == QEvent.Gesture:
                 gesture = event.gesture(Qt.PinchGesture)
-                if gesture and not self._tmpStatus:
-                    if gesture.state() == Qt.GestureUpdated and gesture.changeFlags() | QPinchGesture.CenterPointChanged:
-                        self.verschiebeLeinwand(gesture.centerPoint(), gesture.lastCenterPoint())
+                if gesture and gesture.state() in (Qt.GestureFinished, Qt.GestureCanceled):
+                    # Das Touch-Ende kann schon vorher angekommen sein, ohne Verschieben bleibt der Schwung 0.
+                    if not self.pinchFertig():
+                        self.starteSchwung()
+                elif gesture and not self._tmpStatus and self._pinch:
+                    if gesture.state() == Qt.GestureUpdated:
+                        self.pinchWeiter(gesture)
                 return True
 
-            elif eventtype == QEvent.TouchBegin:
-                maxPointSize = max(self.getPointSizeList(event))
-                if self.isBigPoint(maxPointSize):
-                    if not self._tmpStatus:
-                        self.aktiviereRadiergummi(maxPointSize, self.scenePosFromEvent(event))
-                self.bearbeitenStart(self.scenePosFromEvent(event))
-                return True
-
-            elif eventtype == QEvent.TouchUpdate:
-                if event.pointCount() > 1:
-                    self.deleteCurrentItem()
-                maxPointSize = max(self.getPointSizeList(event))
-                #logger.debug(event.points())
-                self.kalibrierePointSize(maxPointSize)
-                if self.isBigPoint(maxPointSize):
-                    if not self._tmpStatus:
-                        self.aktiviereRadiergummi(maxPointSize, self.scenePosFromEvent(event))
-                    self.resizeRadiergummi(maxPointSize)
-                self.bearbeitenWeiter(self.scenePosFromEvent(event))
-                return True
-
-            elif eventtype in [QEvent.TouchCancel,QEvent.TouchEnd]:
-                logger.debug(QInputDevice.devices())
-                self.bearbeitenFertig(self.scenePosFromEvent(event))
-                if self._tmpStatus:
-                    self.deaktiviereRadiergummi()
+            elif eventtype in [QEvent.TouchBegin,QEvent.TouchUpdate,QEvent.TouchCancel,QEvent.TouchEnd]:
+                if eventtype in [QEvent.TouchCancel,QEvent.TouchEnd] and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('Eingabegeräte: %s', QInputDevice.devices())
+                self.touchVerarbeiten(event)
                 return True
 
             elif eventtype == QEvent.MouseButtonPress:
                 if event.source() == Qt.MouseEventSynthesizedBySystem:
                     return False
+                self.stoppeSchwung()
                 self.bearbeitenStart(self.scenePosFromEvent(event))
+                self.aktualisiereOverlay()
                 return True
 
             elif eventtype == QEvent.MouseMove:
@@ -432,13 +701,16 @@ class Tafelview(QGraphicsView):
                 if event.buttons() == Qt.NoButton:
                     return True
                 self.bearbeitenWeiter(self.scenePosFromEvent(event))
+                self.aktualisiereOverlay()
                 return True
 
             elif eventtype == QEvent.MouseButtonRelease:
-                logger.debug(QInputDevice.devices())
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('Eingabegeräte: %s', QInputDevice.devices())
                 if event.source() == Qt.MouseEventSynthesizedBySystem:
                     return False
                 self.bearbeitenFertig(self.scenePosFromEvent(event))
+                self.aktualisiereOverlay()
                 return True
 
             elif eventtype == QEvent.MouseButtonDblClick:
@@ -460,16 +732,6 @@ class Tafelview(QGraphicsView):
         self._btn_right.moveToSide()
         return super().resizeEvent(event)
 
-    def kalibrierePointSize(self, pointsize):
-        if self._kalibriere:
-            if self._countPointsize < 50:
-                self._mittlerePointsize = (self._countPointsize * self._mittlerePointsize + pointsize) / (self._countPointsize+1)
-                self._countPointsize += 1
-                logger.debug(f"Kalibrieren: {self._mittlerePointsize}")
-            else:
-                self._kalibriere = False
-                self.kalibriert.emit(self._mittlerePointsize)
-
 
     def snapToGeodreieck(self, pos):
         if self._geodreieck.scene() != self.scene():
@@ -481,17 +743,35 @@ class Tafelview(QGraphicsView):
             posGeo.setY(0)
         return self._geodreieck.mapToScene(posGeo)
     
-    def radiere(self, pos):
+    def radiere(self, pos, id=MAUS):
+        von = self._radierPos.get(id, pos)
+        self._radierPos[id] = pos
         self._radiergummi.setPos(pos)
-        radierpath = QGraphicsRectItem(self._radiergummi.sceneBoundingRect()).shape()
+        self.aktualisiereOverlay()
+        # Die ganze seit dem letzten Event überstrichene Fläche in einem Durchgang,
+        # so bleiben bei schnellen Bewegungen keine Lücken.
+        radierpath = self._radiergummi.ueberstrichen(von)
+        if self._status == Status.strichradieren:
+            self.loescheStriche(radierpath)
+            return
         for item in self.scene().items(radierpath):
             if hasattr(item,'removeElements') and callable(item.removeElements):
-                if item not in self._clonedItems:
-                    self._clonedItems[item] = item.clone()
-                item.removeElements(radierpath)
+                # Nur getroffene Items merken sich ihren alten Pfad für den Undo-Schritt.
+                pfad = item.removeElements(radierpath)
+                if pfad is not None and item not in self._altePfade:
+                    self._altePfade[item] = pfad
             if hasattr(item,'path') and callable(item.path) and item.path().elementCount() < 2:
                 self._undostack.push(RemoveItem(self.scene(), item))
 
+    def loescheStriche(self, radierpath):
+        # Ganze Striche, vorausgewählt über den Index der Szene und ihren Umriss. Gelöscht wird
+        # nur, was der Strich selbst trifft. Pfade werden weder geklont noch zerlegt, der
+        # Undo-Schritt entsteht erst beim Loslassen.
+        for item in self.scene().items(radierpath):
+            if hasattr(item, 'getroffen') and item.parentItem() is None and item.getroffen(radierpath):
+                self.scene().removeItem(item)
+                self._geloeschteItems.append(item)
+
     def berechneSceneRectNeu(self, item: QGraphicsItem):
         # Mögliche Erweiterung des sceneRect berechnen
         rect = item.sceneBoundingRect()
@@ -506,19 +786,17 @@ class Tafelview(QGraphicsView):
 
     def scale(self, sx: float, sy: float):
         super().scale(sx, sy)
-        self._radiergummi = Radiergummi(self._radiersize/self.transform().m11(), QPointF(0,0))
+        self.setRadierGroesse(self._radierGroesse)
         self.setCustomCursor()
 
     def resetTransform(self):
         super().resetTransform()
-        self._radiergummi = Radiergummi(self._radiersize/self.transform().m11(), QPointF(0,0))
+        self.setRadierGroesse(self._radierGroesse)
         self.setCustomCursor()
 
     def starteKalibrieren(self):
         logger.debug('Kalibriere')
-        self._kalibriere = True
-        self._countPointsize = 0
-        self._mittlerePointsize = 0
+        self._handballen.starteKalibrieren()
     
     def deleteItems(self):
         if not self.scene().selectedItems():
@@ -556,6 +834,7 @@ class Tafelview(QGraphicsView):
         self._undostack.push(AddItem(self.scene(), item))
         item.setPos(self.mapToScene(0,0))
         self.berechneSceneRectNeu(item)
+        cachepolitik.pruefe(item)
         self.statusbarinfo.emit('Das Element oben links eingefügt. Bitte jetzt verschieben...',5000)
         self.eswurdegemalt.emit() 
 
@@ -628,6 +907,7 @@ class Tafelview(QGraphicsView):
         if self._geodreieck.scene():
             geodreiecksichtbar = True
             self.scene().removeItem(self._geodreieck)
+        self._strichmodell.allesAusparken()
         self._undostack.beginMacro('Lösche alles')
         for item in self.scene().items():
             self._undostack.push(RemoveItem(self.scene(),item))
@@ -645,6 +925,7 @@ class Tafelview(QGraphicsView):
         if enable:
             self.scene().addItem(self._geodreieck)
             self._geodreieck.setPos(self.mapToScene(self.viewport().rect().center()))
+            cachepolitik.pruefe(self._geodreieck)
         else:
             self.scene().removeItem(self._geodreieck)
 
@@ -0,0 +1,148 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from math import log2
+from PySide6.QtCore import QObject, QRectF, QRunnable, QSize, QSizeF, QThreadPool, QTimer, Signal, Slot
+from PySide6.QtGui import QImage, QPainter, QPixmap, QTextDocument
+
+from svgraster import BERUHIGUNGSZEIT, MAXRASTERGROESSE, MAXSTUFEN, STUFENPROOKTAVE
+
+
+def erzeugeDokument(quelle: str, html: bool) -> QTextDocument:
+    dokument = QTextDocument()
+    if html:
+        dokument.setHtml(quelle)
+    else:
+        dokument.setPlainText(quelle)
+    return dokument
+
+def rasterGroesse(groesse: QSizeF, stufe: int) -> QSize:
+    return (groesse*2**(stufe/STUFENPROOKTAVE)).toSize()
+
+
+class TextSignale(QObject):
+    fertig = Signal(int, QSizeF, QImage)
+
+
+class TextRastern(QRunnable):
+    'Setzt das Dokument im Thread-Pool und rastert es für eine Zoomstufe.'
+    def __init__(self, quelle: str, html: bool, stufe: int, signale: TextSignale):
+        super().__init__()
+        self._quelle = quelle
+        self._html = html
+        self._stufe = stufe
+        self._signale = signale
+
+    def run(self):
+        # Ein eigenes Dokument je Auftrag, das des GUI-Threads wird hier nicht angefasst.
+        dokument = erzeugeDokument(self._quelle, self._html)
+        groesse = dokument.size()
+        rastergroesse = rasterGroesse(groesse, self._stufe)
+        image = QImage()
+        if not rastergroesse.isEmpty() and max(rastergroesse.width(), rastergroesse.height()) <= MAXRASTERGROESSE:
+            image = QImage(rastergroesse, QImage.Format_ARGB32_Premultiplied)
+            image.fill(0)
+            painter = QPainter(image)
+            painter.setRenderHints(QPainter.Antialiasing | QPainter.TextAntialiasing)
+            faktor = 2**(self._stufe/STUFENPROOKTAVE)
+            painter.scale(faktor, faktor)
+            dokument.drawContents(painter)
+            painter.end()
+        self._signale.fertig.emit(self._stufe, groesse, image)
+
+
+class TextRaster(QObject):
+    '''Gesetzter und gerasterter Text je Zoomstufe. Wird von allen Klonen geteilt.
+    Die Größe ist erst bekannt, wenn der erste Auftrag fertig ist.'''
+
+    aktualisiert = Signal()
+
+    def __init__(self, quelle: str, html: bool = True):
+        super().__init__()
+        self._quelle = quelle
+        self._html = html
+        self._groesse = None
+        self._dokument = None
+        self._stufen: dict[int, QPixmap] = {}
+        self._gewuenscht = 0
+        self._ladend = None
+        self._signale = TextSignale()
+        self._signale.fertig.connect(self.gerastert)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.rastern)
+        self.rastern()
+
+    def rect(self) -> QRectF:
+        if self._groesse is None:
+            return QRectF()
+        return QRectF(0, 0, self._groesse.width(), self._groesse.height())
+
+    def stufe(self, lod: float) -> int:
+        return round(log2(max(lod, 1e-6))*STUFENPROOKTAVE)
+
+    def pixmap(self, lod: float) -> QPixmap:
+        '''Liefert das Raster für den Detailgrad lod, bis zum Eintreffen das nächstliegende.
+        None, solange nichts gerastert ist oder wenn das Raster zu groß wäre.'''
+        if self._groesse is None:
+            return None
+        stufe = self.stufe(lod)
+        groesse = rasterGroesse(self._groesse, stufe)
+        if max(groesse.width(), groesse.height()) > MAXRASTERGROESSE or groesse.isEmpty():
+            return None
+        if stufe in self._stufen:
+            return self._stufen[stufe]
+        if self._gewuenscht != stufe:
+            self._gewuenscht = stufe
+            self._timer.start(BERUHIGUNGSZEIT)
+        if self._stufen:
+            return self._stufen[min(self._stufen, key=lambda s: abs(s-stufe))]
+        return None
+
+    def dokument(self) -> QTextDocument:
+        'Für Vektorausgabe (SVG-Export, sehr starker Zoom). Wird erst dann im GUI-Thread gesetzt.'
+        if self._dokument is None:
+            self._dokument = erzeugeDokument(self._quelle, self._html)
+        return self._dokument
+
+    @Slot()
+    def rastern(self):
+        if self._ladend is not None or self._gewuenscht is None or self._gewuenscht in self._stufen:
+            return
+        self._ladend = self._gewuenscht
+        QThreadPool.globalInstance().start(TextRastern(self._quelle, self._html, self._ladend, self._signale))
+
+    @Slot(int, QSizeF, QImage)
+    def gerastert(self, stufe: int, groesse: QSizeF, image: QImage):
+        self._ladend = None
+        self._groesse = groesse
+        if not image.isNull():
+            self._stufen[stufe] = QPixmap.fromImage(image)
+            while len(self._stufen) > MAXSTUFEN:
+                del self._stufen[max(self._stufen, key=lambda s: abs(s-stufe))]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f'Text gerastert: Stufe {stufe}, {image.size()}')
+        self.aktualisiert.emit()
+        if self._gewuenscht is not None and self._gewuenscht not in self._stufen and self._gewuenscht != stufe:
+            self._timer.start(BERUHIGUNGSZEIT)
+
+    def leeren(self):
+        self._stufen.clear()
+        self._gewuenscht = None
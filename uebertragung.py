@@ -0,0 +1,274 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+# Überträgt das Tafelbild live über TCP an Schülergeräte im LAN.
+#
+# Jede Nachricht besteht aus Typ (uint8), Länge (uint32) und Nutzdaten.
+# Pfade werden als Liste von Elementen in 1/4 Pixel übertragen (siehe pfadkodierung).
+# Neue Teilnehmer bekommen zuerst einen zlib-komprimierten Schnappschuss.
+
+import logging
+logger = logging.getLogger('GUI')
+
+import struct
+import zlib
+from weakref import WeakKeyDictionary
+from PySide6.QtCore import QBuffer, QByteArray, QIODevice, QObject, QTimer, Qt
+from PySide6.QtGui import QImage, QPainter, QPainterPath, QTransform
+from PySide6.QtNetwork import QHostAddress, QTcpServer, QTcpSocket
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem
+
+from items import Pfad, Stift
+from pfadkodierung import packePfad
+from undo import HINZU, WEG, PFAD, TRANSFORM, aenderungenVon
+
+VERSION = 1
+STANDARDPORT = 5123
+FRAMEZEIT = 16
+# Langsame Geräte werden getrennt und bekommen beim Wiederverbinden einen Schnappschuss.
+MAXRUECKSTAU = 8*1024*1024
+MAXBILDGROESSE = 2048
+
+HALLO, SCHNAPPSCHUSS, ELEMENT, ENTFERNEN, NEUERPFAD, NEUETRANSFORM, LIVEPUNKTE = range(7)
+ART_PFAD, ART_BILD = range(2)
+
+NACHRICHT = struct.Struct('<BI')
+TRANSFORMATION = struct.Struct('<6f')
+STIL = struct.Struct('<IfBI')
+BILDRECT = struct.Struct('<4f')
+
+
+def leseNachrichten(daten) -> list:
+    'Zerlegt einen Empfangspuffer in (typ, nutzdaten). Schnappschüsse werden ausgepackt.'
+    return zerlegeNachrichten(daten)[0]
+
+def zerlegeNachrichten(daten, auspacken: bool = True):
+    'Wie leseNachrichten, liefert zusätzlich die Anzahl der verbrauchten Bytes.'
+    nachrichten = []
+    offset = 0
+    while offset + NACHRICHT.size <= len(daten):
+        typ, laenge = NACHRICHT.unpack_from(daten, offset)
+        if offset + NACHRICHT.size + laenge > len(daten):
+            break
+        offset += NACHRICHT.size
+        nutzdaten = bytes(daten[offset:offset+laenge])
+        offset += laenge
+        if typ == SCHNAPPSCHUSS and auspacken:
+            nachrichten.extend(leseNachrichten(zlib.decompress(nutzdaten)))
+        else:
+            nachrichten.append((typ, nutzdaten))
+    return nachrichten, offset
+
+def nachricht(typ: int, nutzdaten: bytes = b'') -> bytes:
+    return NACHRICHT.pack(typ, len(nutzdaten)) + nutzdaten
+
+def packeTransform(item: QGraphicsItem) -> bytes:
+    t = item.sceneTransform()
+    return TRANSFORMATION.pack(t.m11(), t.m12(), t.m21(), t.m22(), t.dx(), t.dy())
+
+def packeStil(item: Pfad) -> bytes:
+    pen = item.pen()
+    brush = item.brush()
+    pencolor = 0 if pen.style() == Qt.NoPen else pen.color().rgba()
+    brushcolor = 0 if brush.style() == Qt.NoBrush else brush.color().rgba()
+    return STIL.pack(pencolor, pen.widthF(), pen.isCosmetic(), brushcolor)
+
+def rendereBild(item: QGraphicsItem):
+    'Rastert ein Item samt Kindern. Liefert das Rechteck in Item-Koordinaten und ein PNG.'
+    rect = item.boundingRect() | item.childrenBoundingRect()
+    faktor = min(1, MAXBILDGROESSE/max(rect.width(), rect.height(), 1))
+    image = QImage((rect.size()*faktor).toSize(), QImage.Format_ARGB32_Premultiplied)
+    image.fill(0)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    basis = QTransform.fromScale(faktor, faktor).translate(-rect.x(), -rect.y())
+    items = [item]
+    while items:
+        teil = items.pop()
+        transform, _ = teil.itemTransform(item)
+        painter.setWorldTransform(transform*basis)
+        teil.paint(painter, QStyleOptionGraphicsItem(), None)
+        items.extend(teil.childItems())
+    painter.end()
+    puffer = QByteArray()
+    buffer = QBuffer(puffer)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, 'PNG')
+    return rect, puffer.data()
+
+
+class Uebertragung(QObject):
+    '''Server, der Änderungen aus dem Undo-Stack und den gerade gezeichneten Strich
+    einmal pro Frame gesammelt an alle verbundenen Geräte schickt.'''
+
+    def __init__(self, tafelview, undostack, port: int = STANDARDPORT):
+        super().__init__(tafelview)
+        self._tafelview = tafelview
+        self._scene = tafelview.scene()
+        self._undostack = undostack
+        self._index = undostack.index()
+        # Schwache Referenzen, damit gelöschte Items freigegeben werden können
+        self._ids = WeakKeyDictionary()
+        self._naechsteId = 1
+        # Striche in Arbeit -> Anzahl schon übertragener Pfadelemente
+        self._live = {}
+        self._ausgang = bytearray()
+        self._clients = []
+
+        self._server = QTcpServer(self)
+        self._server.newConnection.connect(self.neueVerbindung)
+        if not self._server.listen(QHostAddress.Any, port):
+            raise OSError(self._server.errorString())
+        undostack.indexChanged.connect(self.stackGeaendert)
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.timeout.connect(self.frame)
+        self._timer.start(FRAMEZEIT)
+        logger.info(f'Übertragung auf Port {self._server.serverPort()}')
+
+    def port(self) -> int:
+        return self._server.serverPort()
+
+    def anzahlClients(self) -> int:
+        return len(self._clients)
+
+    def itemId(self, item: QGraphicsItem) -> int:
+        if item not in self._ids:
+            self._ids[item] = self._naechsteId
+            self._naechsteId += 1
+        return self._ids[item]
+
+    def elementNachricht(self, item: QGraphicsItem) -> bytes:
+        kopf = struct.pack('<I', self.itemId(item))
+        if isinstance(item, Pfad):
+            return nachricht(ELEMENT, kopf + bytes([ART_PFAD]) + packeTransform(item) + packeStil(item) + packePfad(item.path()))
+        rect, png = rendereBild(item)
+        return nachricht(ELEMENT, kopf + bytes([ART_BILD]) + packeTransform(item) + BILDRECT.pack(*rect.getRect()) + png)
+
+    def schnappschuss(self) -> bytes:
+        'Die ganze Tafel samt geparkter Striche und der Striche in Arbeit, ohne etwas auszuparken.'
+        daten = bytearray()
+        items = [item for item in self._scene.items(Qt.AscendingOrder)
+                 if item.parentItem() is None and item is not self._tafelview.geodreieck()]
+        for item in self._tafelview.strichmodell().stapel(items) + self._tafelview.currentItems():
+            daten += self.elementNachricht(item)
+        return nachricht(SCHNAPPSCHUSS, zlib.compress(bytes(daten)))
+
+    def stackGeaendert(self, index: int):
+        if index > self._index:
+            commands = [(self._undostack.command(i), True) for i in range(self._index, index)]
+        else:
+            commands = [(self._undostack.command(i), False) for i in reversed(range(index, self._index))]
+        self._index = index
+        if not self._clients:
+            # Neue Geräte bekommen ohnehin einen Schnappschuss.
+            return
+        for command, redo in commands:
+            for art, item in aenderungenVon(command, redo):
+                self.aenderung(art, item)
+
+    def aenderung(self, art: int, item: QGraphicsItem):
+        if art == HINZU and item in self._live:
+            self.liveFertig(item)
+        elif art == HINZU:
+            self._ausgang += self.elementNachricht(item)
+        elif art == WEG:
+            self._ausgang += nachricht(ENTFERNEN, struct.pack('<I', self.itemId(item)))
+        elif art == PFAD:
+            self._ausgang += nachricht(NEUERPFAD, struct.pack('<I', self.itemId(item)) + packePfad(item.path()))
+        elif art == TRANSFORM:
+            self._ausgang += nachricht(NEUETRANSFORM, struct.pack('<I', self.itemId(item)) + packeTransform(item))
+
+    def liveAenderungen(self):
+        items = self._tafelview.currentItems()
+        for item in list(self._live):
+            if item not in items:
+                if item.scene() is None:
+                    # Abgebrochener Strich
+                    self._ausgang += nachricht(ENTFERNEN, struct.pack('<I', self.itemId(item)))
+                del self._live[item]
+        for item in items:
+            if item not in self._live:
+                self._ausgang += self.elementNachricht(item)
+                self._live[item] = item.path().elementCount()
+                continue
+            self.liveWeiter(item)
+
+    def liveWeiter(self, item: QGraphicsItem):
+        anzahl = item.path().elementCount()
+        if isinstance(item, Stift) and anzahl > self._live[item]:
+            # Beim Freihandstrich kommen nur Punkte hinzu.
+            self._ausgang += nachricht(LIVEPUNKTE, struct.pack('<II', self.itemId(item), self._live[item]) + packePfad(item.path(), self._live[item]))
+        elif not isinstance(item, Stift):
+            self._ausgang += nachricht(NEUERPFAD, struct.pack('<I', self.itemId(item)) + packePfad(item.path()))
+        self._live[item] = anzahl
+
+    def liveFertig(self, item: QGraphicsItem):
+        '''Ein fertiger Strich ist bei den Geräten schon unter seiner ID vorhanden und wird
+        nicht noch einmal geschickt, nur der Rest seit dem letzten Frame.'''
+        anzahl = item.path().elementCount()
+        if isinstance(item, Stift) and 0 < anzahl <= self._live[item]:
+            # Ausgedünnt: Die Indizes passen nicht mehr, der Endpunkt bleibt aber erhalten.
+            ende = item.path().elementAt(anzahl-1)
+            rest = QPainterPath()
+            rest.lineTo(ende.x, ende.y)
+            self._ausgang += nachricht(LIVEPUNKTE, struct.pack('<II', self.itemId(item), self._live[item]) + packePfad(rest, 1))
+        else:
+            self.liveWeiter(item)
+        del self._live[item]
+
+    def frame(self):
+        if not self._clients:
+            self._ausgang.clear()
+            return
+        self.liveAenderungen()
+        if not self._ausgang:
+            return
+        daten = bytes(self._ausgang)
+        self._ausgang.clear()
+        for client in list(self._clients):
+            if client.bytesToWrite() > MAXRUECKSTAU:
+                logger.info(f'Übertragung: {client.peerAddress().toString()} zu langsam, wird getrennt')
+                client.abort()
+                continue
+            client.write(daten)
+
+    def neueVerbindung(self):
+        # Die schon verbundenen Geräte auf den Stand bringen, den der Schnappschuss zeigt.
+        self.frame()
+        while self._server.hasPendingConnections():
+            client = self._server.nextPendingConnection()
+            client.setSocketOption(QTcpSocket.LowDelayOption, 1)
+            client.disconnected.connect(lambda client=client: self.verbindungBeendet(client))
+            client.write(nachricht(HALLO, struct.pack('<H', VERSION)) + self.schnappschuss())
+            self._clients.append(client)
+            # Die Striche in Arbeit stecken mit allen bisherigen Punkten im Schnappschuss.
+            for item in self._tafelview.currentItems():
+                self._live[item] = item.path().elementCount()
+            logger.info(f'Übertragung: {client.peerAddress().toString()} verbunden, {len(self._clients)} Geräte')
+
+    def verbindungBeendet(self, client: QTcpSocket):
+        if client in self._clients:
+            self._clients.remove(client)
+        client.deleteLater()
+
+    def beenden(self):
+        self._timer.stop()
+        for client in self._clients:
+            client.disconnectFromHost()
+        self._server.close()
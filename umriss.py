@@ -0,0 +1,80 @@
+
+# Endlostafel - Ein einfaches Schreibprogramm für interaktive Tafeln
+# Copyright (C) 2021  Christian Hoffmann
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see https://www.gnu.org/licenses/.
+
+import logging
+logger = logging.getLogger('GUI')
+
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal, Slot
+from PySide6.QtGui import QPainterPath, QPainterPathStroker, QPen
+
+# Für Auswahl und Radieren reicht ein gröberer Umriss: flachere Kurven,
+# abgeschrägte Ecken und eckige Enden statt runder.
+KURVENGENAUIGKEIT = 1.0
+
+
+def berechneStrich(path: QPainterPath, pen: QPen) -> QPainterPath:
+    'Nur die Fläche, die der Stift färbt, ohne das Innere des Pfads.'
+    if pen.style() == Qt.NoPen:
+        return QPainterPath()
+    stroker = QPainterPathStroker()
+    stroker.setWidth(max(pen.widthF(), 1))
+    stroker.setCurveThreshold(KURVENGENAUIGKEIT)
+    stroker.setJoinStyle(Qt.BevelJoin)
+    stroker.setCapStyle(Qt.SquareCap)
+    return stroker.createStroke(path)
+
+def berechneUmriss(path: QPainterPath, pen: QPen) -> QPainterPath:
+    'Wie QGraphicsPathItem::shape: Umriss des Strichs plus die Fläche des Pfads.'
+    if pen.style() == Qt.NoPen or pen.widthF() <= 0:
+        return QPainterPath(path)
+    shape = berechneStrich(path, pen)
+    shape.addPath(path)
+    return shape
+
+
+class UmrissBerechnen(QRunnable):
+    def __init__(self, item, version: int, path: QPainterPath, pen: QPen, signal):
+        super().__init__()
+        self._item = item
+        self._version = version
+        self._path = path
+        self._pen = pen
+        self._signal = signal
+
+    def run(self):
+        # Das Item selbst wird hier nicht angefasst, es dient nur als Schlüssel.
+        self._signal.emit(self._item, self._version, berechneUmriss(self._path, self._pen))
+
+
+class Umrissrechner(QObject):
+    'Berechnet die Umrisse fertiger Striche im Hintergrund.'
+
+    fertig = Signal(object, int, object)
+
+    def __init__(self):
+        super().__init__()
+        self.fertig.connect(self.umrissFertig)
+
+    def anfordern(self, item, version: int, path: QPainterPath, pen: QPen):
+        QThreadPool.globalInstance().start(UmrissBerechnen(item, version, path, pen, self.fertig))
+
+    @Slot(object, int, object)
+    def umrissFertig(self, item, version: int, umriss: QPainterPath):
+        item.setUmriss(version, umriss)
+
+
+umrissrechner = Umrissrechner()
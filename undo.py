@@ -18,10 +18,40 @@
 import logging
 logger = logging.getLogger('GUI')
 
+import tempfile
 from PySide6.QtCore import QPointF
 from PySide6.QtGui import QUndoCommand, QUndoStack
 from PySide6.QtWidgets import QGraphicsItem, QGraphicsScene, QWidget, QDialog, QGridLayout, QUndoView
 
+from pfadkodierung import SPEICHERQUANT, entpackePfad, packePfad, pfadAusElementen
+
+# Arten von Änderungen, die ein Kommando an der Szene vornimmt (siehe aenderungen)
+HINZU, WEG, PFAD, TRANSFORM = range(4)
+
+def aenderungenVon(command: QUndoCommand, redo: bool) -> list:
+    'Änderungen eines Kommandos einschließlich aller Kinder eines Makros.'
+    if hasattr(command, 'aenderungen'):
+        return command.aenderungen(redo)
+    kinder = [command.child(i) for i in range(command.childCount())]
+    if not redo:
+        kinder.reverse()
+    return [aenderung for kind in kinder for aenderung in aenderungenVon(kind, redo)]
+
+class Auslagerung:
+    'Temporäre Datei für ausgelagerte Undo-Daten. Es wird nur angehängt.'
+    def __init__(self):
+        self._datei = tempfile.TemporaryFile()
+
+    def schreibe(self, daten: bytes) -> int:
+        self._datei.seek(0, 2)
+        offset = self._datei.tell()
+        self._datei.write(daten)
+        return offset
+
+    def lese(self, offset: int, laenge: int) -> bytes:
+        self._datei.seek(offset)
+        return self._datei.read(laenge)
+
 class AddItem(QUndoCommand):
     def __init__(self, scene: QGraphicsScene, item: QGraphicsItem):
         super().__init__()
@@ -30,11 +60,16 @@ class AddItem(QUndoCommand):
         self.setText('Element eingefügt')
 
     def undo(self):
-        self._scene.removeItem(self._item)
+        # Geparkte Striche (siehe Strichmodell) sind nicht in der Szene.
+        if self._item.scene() is self._scene:
+            self._scene.removeItem(self._item)
     
     def redo(self):
         self._scene.addItem(self._item)
 
+    def aenderungen(self, redo: bool):
+        return [(HINZU if redo else WEG, self._item)]
+
 class RemoveItem(QUndoCommand):
     def __init__(self, scene: QGraphicsScene, item: QGraphicsItem):
         super().__init__()
@@ -46,24 +81,79 @@ class RemoveItem(QUndoCommand):
         self._scene.addItem(self._item)
     
     def redo(self):
-        self._scene.removeItem(self._item)
+        if self._item.scene() is self._scene:
+            self._scene.removeItem(self._item)
+
+    def aenderungen(self, redo: bool):
+        return [(WEG if redo else HINZU, self._item)]
+
+class RemoveItems(QUndoCommand):
+    'Mehrere Items in einem Schritt, z.B. alle Striche eines Wischers mit dem Strichradierer.'
+    def __init__(self, scene: QGraphicsScene, items: list):
+        super().__init__()
+        self._items = list(items)
+        self._scene = scene
+        self.setText('Elemente entfernt')
+
+    def undo(self):
+        for item in self._items:
+            self._scene.addItem(item)
+
+    def redo(self):
+        for item in self._items:
+            if item.scene() is self._scene:
+                self._scene.removeItem(item)
+
+    def aenderungen(self, redo: bool):
+        return [(WEG if redo else HINZU, item) for item in self._items]
 
 class ChangePathItems(QUndoCommand):
-    def __init__(self, clonedItems: dict):
+    def __init__(self, altePfade: dict):
         super().__init__()
         self._itemsPaths = {}
-        for orig in clonedItems:
-            self._itemsPaths[orig] = [orig.path(), clonedItems[orig].path() ]
+        for orig in altePfade:
+            self._itemsPaths[orig] = [orig.path(), altePfade[orig]]
+        # (Auslagerung, Offset, Länge), sobald die Pfade auf der Platte liegen
+        self._ausgelagert = None
         self.setText('Elemente geändert')
 
+    def pfade(self) -> dict:
+        if self._ausgelagert is None:
+            return self._itemsPaths
+        auslagerung, offset, laenge = self._ausgelagert
+        daten = auslagerung.lese(offset, laenge)
+        pfade = {}
+        offset = 0
+        for orig in self._itemsPaths:
+            alt, offset = entpackePfad(daten, offset, SPEICHERQUANT)
+            neu, offset = entpackePfad(daten, offset, SPEICHERQUANT)
+            pfade[orig] = [pfadAusElementen(alt), pfadAusElementen(neu)]
+        return pfade
+
+    def auslagern(self, auslagerung: Auslagerung) -> int:
+        'Schreibt die Pfade in die Auslagerungsdatei. Liefert die Anzahl freigegebener Pfadelemente.'
+        if self._ausgelagert is not None:
+            return 0
+        daten = bytearray()
+        anzahl = 0
+        for alt, neu in self._itemsPaths.values():
+            daten += packePfad(alt, quant=SPEICHERQUANT) + packePfad(neu, quant=SPEICHERQUANT)
+            anzahl += alt.elementCount() + neu.elementCount()
+        self._ausgelagert = (auslagerung, auslagerung.schreibe(bytes(daten)), len(daten))
+        self._itemsPaths = dict.fromkeys(self._itemsPaths)
+        return anzahl
+
     def undo(self):
-        for orig, paths in self._itemsPaths.items():
+        for orig, paths in self.pfade().items():
             orig.setPath(paths[1])
     
     def redo(self):
-        for orig, paths in self._itemsPaths.items():
+        for orig, paths in self.pfade().items():
             orig.setPath(paths[0])
 
+    def aenderungen(self, redo: bool):
+        return [(PFAD, orig) for orig in self._itemsPaths]
+
 class MoveItem(QUndoCommand):
     def __init__(self, item: QGraphicsItem, oldpos: QPointF, newpos: QPointF):
         super().__init__()
@@ -78,6 +168,9 @@ class MoveItem(QUndoCommand):
     def redo(self):
         self._item.setPos(self._newpos)
 
+    def aenderungen(self, redo: bool):
+        return [(TRANSFORM, self._item)]
+
 class UndoWindow(QDialog):
     def __init__(self, parent: QWidget, undostack: QUndoStack) -> None:
         super().__init__(parent)